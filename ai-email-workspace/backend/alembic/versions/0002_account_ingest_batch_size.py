@@ -0,0 +1,22 @@
+"""add per-account ingest batch size
+
+Revision ID: 0002_account_ingest_batch_size
+Revises: 0001_create_tables
+Create Date: 2026-10-17 00:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0002_account_ingest_batch_size"
+down_revision = "0001_create_tables"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("mail_accounts", sa.Column("ingest_batch_size", sa.Integer))
+
+
+def downgrade() -> None:
+    op.drop_column("mail_accounts", "ingest_batch_size")
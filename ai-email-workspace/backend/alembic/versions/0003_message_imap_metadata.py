@@ -0,0 +1,28 @@
+"""add imap uid, size and attachment flag to messages
+
+Revision ID: 0003_message_imap_metadata
+Revises: 0002_account_ingest_batch_size
+Create Date: 2026-10-17 00:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0003_message_imap_metadata"
+down_revision = "0002_account_ingest_batch_size"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("messages", sa.Column("imap_uid", sa.Integer))
+    op.add_column("messages", sa.Column("size_bytes", sa.Integer))
+    op.add_column("messages", sa.Column("has_attachments", sa.Boolean, server_default=sa.false()))
+    op.create_index("ix_messages_folder_uid", "messages", ["folder_id", "imap_uid"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_messages_folder_uid", table_name="messages")
+    op.drop_column("messages", "has_attachments")
+    op.drop_column("messages", "size_bytes")
+    op.drop_column("messages", "imap_uid")
@@ -0,0 +1,26 @@
+"""add folder sync state and message flags
+
+Revision ID: 0004_folder_sync_state
+Revises: 0003_message_imap_metadata
+Create Date: 2026-10-17 00:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0004_folder_sync_state"
+down_revision = "0003_message_imap_metadata"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("folders", sa.Column("uidvalidity", sa.BigInteger))
+    op.add_column("folders", sa.Column("highestmodseq", sa.BigInteger))
+    op.add_column("messages", sa.Column("flags_json", sa.JSON, server_default="[]"))
+
+
+def downgrade() -> None:
+    op.drop_column("messages", "flags_json")
+    op.drop_column("folders", "highestmodseq")
+    op.drop_column("folders", "uidvalidity")
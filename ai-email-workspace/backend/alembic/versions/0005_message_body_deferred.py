@@ -0,0 +1,22 @@
+"""flag messages whose text body was deferred during ingest
+
+Revision ID: 0005_message_body_deferred
+Revises: 0004_folder_sync_state
+Create Date: 2026-10-17 00:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0005_message_body_deferred"
+down_revision = "0004_folder_sync_state"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("messages", sa.Column("body_deferred", sa.Boolean, server_default=sa.false()))
+
+
+def downgrade() -> None:
+    op.drop_column("messages", "body_deferred")
@@ -0,0 +1,35 @@
+"""key stored messages on (folder, uid) instead of a global Message-ID
+
+Revision ID: 0006_message_folder_uid_unique
+Revises: 0005_message_body_deferred
+Create Date: 2026-10-17 00:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0006_message_folder_uid_unique"
+down_revision = "0005_message_body_deferred"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # The same message can live in several folders and accounts.
+    op.drop_index("ix_messages_message_id_header", table_name="messages")
+    op.create_index("ix_messages_message_id_header", "messages", ["message_id_header"])
+    op.drop_index("ix_messages_folder_uid", table_name="messages")
+    op.create_index(
+        "ix_messages_folder_uid",
+        "messages",
+        ["folder_id", "imap_uid"],
+        unique=True,
+        postgresql_where=sa.text("imap_uid IS NOT NULL"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_messages_folder_uid", table_name="messages")
+    op.create_index("ix_messages_folder_uid", "messages", ["folder_id", "imap_uid"])
+    op.drop_index("ix_messages_message_id_header", table_name="messages")
+    op.create_index("ix_messages_message_id_header", "messages", ["message_id_header"], unique=True)
@@ -0,0 +1,31 @@
+"""add content-hash embedding cache
+
+Revision ID: 0007_embedding_cache
+Revises: 0006_message_folder_uid_unique
+Create Date: 2026-10-17 00:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+from pgvector.sqlalchemy import Vector
+
+revision = "0007_embedding_cache"
+down_revision = "0006_message_folder_uid_unique"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("embeddings", sa.Column("content_hash", sa.String(length=64)))
+    op.create_table(
+        "embedding_cache",
+        sa.Column("model", sa.String(length=128), primary_key=True),
+        sa.Column("content_hash", sa.String(length=64), primary_key=True),
+        sa.Column("vector", Vector(1536), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.text("now()")),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("embedding_cache")
+    op.drop_column("embeddings", "content_hash")
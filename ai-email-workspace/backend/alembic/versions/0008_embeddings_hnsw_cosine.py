@@ -0,0 +1,39 @@
+"""replace the default ivfflat vector index with HNSW on cosine distance
+
+Revision ID: 0008_embeddings_hnsw_cosine
+Revises: 0007_embedding_cache
+Create Date: 2026-10-17 00:00:00.000000
+
+The build locks the table against writes; on a large live table build the
+index with ``scripts/build_vector_index.py`` first, which this migration
+then leaves in place.
+"""
+
+from alembic import op
+
+from app.core.config import settings
+
+revision = "0008_embeddings_hnsw_cosine"
+down_revision = "0007_embedding_cache"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    existing = bind.exec_driver_sql(
+        "SELECT am.amname FROM pg_class c JOIN pg_am am ON am.oid = c.relam "
+        "WHERE c.relname = 'ix_embeddings_vector'"
+    ).scalar()
+    if existing == "hnsw":
+        return
+    op.execute("DROP INDEX IF EXISTS ix_embeddings_vector")
+    op.execute(
+        "CREATE INDEX ix_embeddings_vector ON embeddings USING hnsw (vector vector_cosine_ops) "
+        f"WITH (m = {int(settings.vector_index_m)}, ef_construction = {int(settings.vector_index_ef_construction)})"
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP INDEX IF EXISTS ix_embeddings_vector")
+    op.execute("CREATE INDEX ix_embeddings_vector ON embeddings USING ivfflat (vector)")
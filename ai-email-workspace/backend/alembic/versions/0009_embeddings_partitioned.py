@@ -0,0 +1,92 @@
+"""store account_id on embeddings and hash-partition the table by account
+
+Revision ID: 0009_embeddings_partitioned
+Revises: 0008_embeddings_hnsw_cosine
+Create Date: 2026-10-17 00:00:00.000000
+
+Postgres cannot partition an existing table in place, so the rows are copied
+into a new partitioned table which then takes over the old name. The HNSW
+index is created on the parent and so built once per partition. The number
+of partitions comes from EMBEDDING_PARTITIONS; changing it later means
+running this copy again.
+"""
+
+from alembic import op
+
+from app.core.config import settings
+
+revision = "0009_embeddings_partitioned"
+down_revision = "0008_embeddings_hnsw_cosine"
+branch_labels = None
+depends_on = None
+
+COLUMNS = "id, message_id, model, chunk_index, content, content_hash, vector"
+
+
+def _partition_ddl(partitions: int) -> list[str]:
+    return [
+        f"CREATE TABLE embeddings_p{remainder} PARTITION OF embeddings_partitioned "
+        f"FOR VALUES WITH (MODULUS {partitions}, REMAINDER {remainder})"
+        for remainder in range(partitions)
+    ]
+
+
+def _vector_index() -> str:
+    return (
+        "CREATE INDEX ix_embeddings_vector ON embeddings USING hnsw (vector vector_cosine_ops) "
+        f"WITH (m = {int(settings.vector_index_m)}, ef_construction = {int(settings.vector_index_ef_construction)})"
+    )
+
+
+def _swap_in(new_table: str) -> None:
+    # The id sequence belongs to the old table and would be dropped with it.
+    op.execute("ALTER SEQUENCE embeddings_id_seq OWNED BY NONE")
+    op.execute("DROP TABLE embeddings")
+    op.execute(f"ALTER TABLE {new_table} RENAME TO embeddings")
+    op.execute("ALTER SEQUENCE embeddings_id_seq OWNED BY embeddings.id")
+    op.execute("CREATE INDEX ix_embeddings_message ON embeddings (message_id)")
+    op.execute(_vector_index())
+
+
+def upgrade() -> None:
+    op.execute(
+        """
+        CREATE TABLE embeddings_partitioned (
+            id integer NOT NULL DEFAULT nextval('embeddings_id_seq'),
+            account_id integer NOT NULL REFERENCES mail_accounts (id),
+            message_id integer NOT NULL REFERENCES messages (id),
+            model varchar(128) NOT NULL,
+            chunk_index integer NOT NULL,
+            content text NOT NULL,
+            content_hash varchar(64),
+            vector vector(1536),
+            PRIMARY KEY (id, account_id)
+        ) PARTITION BY HASH (account_id)
+        """
+    )
+    for statement in _partition_ddl(int(settings.embedding_partitions)):
+        op.execute(statement)
+    op.execute(
+        f"INSERT INTO embeddings_partitioned (account_id, {COLUMNS}) "
+        f"SELECT m.account_id, {', '.join(f'e.{column}' for column in COLUMNS.split(', '))} "
+        "FROM embeddings e JOIN messages m ON m.id = e.message_id"
+    )
+    _swap_in("embeddings_partitioned")
+
+
+def downgrade() -> None:
+    op.execute(
+        """
+        CREATE TABLE embeddings_unpartitioned (
+            id integer PRIMARY KEY DEFAULT nextval('embeddings_id_seq'),
+            message_id integer NOT NULL REFERENCES messages (id),
+            model varchar(128) NOT NULL,
+            chunk_index integer NOT NULL,
+            content text NOT NULL,
+            content_hash varchar(64),
+            vector vector(1536)
+        )
+        """
+    )
+    op.execute(f"INSERT INTO embeddings_unpartitioned ({COLUMNS}) SELECT {COLUMNS} FROM embeddings")
+    _swap_in("embeddings_unpartitioned")
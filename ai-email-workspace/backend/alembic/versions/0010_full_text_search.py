@@ -0,0 +1,62 @@
+"""add generated tsvector columns and trigram indexes for lexical retrieval
+
+Revision ID: 0010_full_text_search
+Revises: 0009_embeddings_partitioned
+Create Date: 2026-10-17 00:00:00.000000
+
+Adding a stored generated column rewrites the table, so expect this to take
+a while on large mailboxes.
+"""
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import TSVECTOR
+
+revision = "0010_full_text_search"
+down_revision = "0009_embeddings_partitioned"
+branch_labels = None
+depends_on = None
+
+# Copies of the expressions in app.models.models as of this revision.
+MESSAGE_SEARCH_EXPRESSION = (
+    "setweight(to_tsvector('english', coalesce(subject, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(from_name, '') || ' ' || coalesce(from_email, '')), 'B')"
+)
+EMBEDDING_SEARCH_EXPRESSION = "to_tsvector('english', content)"
+
+
+def upgrade() -> None:
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.add_column(
+        "messages",
+        sa.Column("search_vector", TSVECTOR, sa.Computed(MESSAGE_SEARCH_EXPRESSION, persisted=True)),
+    )
+    op.add_column(
+        "embeddings",
+        sa.Column("search_vector", TSVECTOR, sa.Computed(EMBEDDING_SEARCH_EXPRESSION, persisted=True)),
+    )
+    op.create_index("ix_messages_search", "messages", ["search_vector"], postgresql_using="gin")
+    op.create_index("ix_embeddings_search", "embeddings", ["search_vector"], postgresql_using="gin")
+    op.create_index(
+        "ix_messages_from_email_trgm",
+        "messages",
+        ["from_email"],
+        postgresql_using="gin",
+        postgresql_ops={"from_email": "gin_trgm_ops"},
+    )
+    op.create_index(
+        "ix_messages_subject_trgm",
+        "messages",
+        ["subject"],
+        postgresql_using="gin",
+        postgresql_ops={"subject": "gin_trgm_ops"},
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_messages_subject_trgm", table_name="messages")
+    op.drop_index("ix_messages_from_email_trgm", table_name="messages")
+    op.drop_index("ix_embeddings_search", table_name="embeddings")
+    op.drop_index("ix_messages_search", table_name="messages")
+    op.drop_column("embeddings", "search_vector")
+    op.drop_column("messages", "search_vector")
@@ -0,0 +1,47 @@
+"""add thread centroid embeddings for two-stage retrieval
+
+Revision ID: 0011_thread_centroids
+Revises: 0010_full_text_search
+Create Date: 2026-10-17 00:00:00.000000
+
+Centroids are backfilled from the existing chunks; new chunks keep them up
+to date incrementally.
+"""
+
+from alembic import op
+import sqlalchemy as sa
+from pgvector.sqlalchemy import Vector
+
+from app.core.config import settings
+
+revision = "0011_thread_centroids"
+down_revision = "0010_full_text_search"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("threads", sa.Column("centroid", Vector(1536)))
+    op.add_column("threads", sa.Column("centroid_count", sa.Integer, nullable=False, server_default="0"))
+    op.execute(
+        """
+        UPDATE threads SET centroid = chunks.centroid, centroid_count = chunks.count
+        FROM (
+            SELECT m.thread_id, avg(e.vector) AS centroid, count(*) AS count
+            FROM embeddings e JOIN messages m ON m.id = e.message_id
+            WHERE e.vector IS NOT NULL
+            GROUP BY m.thread_id
+        ) AS chunks
+        WHERE threads.id = chunks.thread_id
+        """
+    )
+    op.execute(
+        "CREATE INDEX ix_threads_centroid ON threads USING hnsw (centroid vector_cosine_ops) "
+        f"WITH (m = {int(settings.vector_index_m)}, ef_construction = {int(settings.vector_index_ef_construction)})"
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_threads_centroid", table_name="threads")
+    op.drop_column("threads", "centroid_count")
+    op.drop_column("threads", "centroid")
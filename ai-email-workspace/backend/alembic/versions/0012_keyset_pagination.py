@@ -0,0 +1,40 @@
+"""add composite indexes for keyset pagination of messages and threads
+
+Revision ID: 0012_keyset_pagination
+Revises: 0011_thread_centroids
+Create Date: 2026-10-17 00:00:00.000000
+
+The indexes are built concurrently so listings keep working meanwhile;
+``ix_messages_account_sent`` gains ``id`` as a tie-breaker.
+"""
+
+from alembic import op
+
+revision = "0012_keyset_pagination"
+down_revision = "0011_thread_centroids"
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ("ix_messages_account_sent_id", "messages", ["account_id", "sent_at", "id"]),
+    ("ix_messages_folder_sent", "messages", ["folder_id", "sent_at", "id"]),
+    ("ix_threads_account_last_date", "threads", ["account_id", "last_date", "id"]),
+]
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, postgresql_concurrently=True, if_not_exists=True)
+        op.drop_index("ix_messages_account_sent", table_name="messages", postgresql_concurrently=True)
+    op.execute("ALTER INDEX ix_messages_account_sent_id RENAME TO ix_messages_account_sent")
+
+
+def downgrade() -> None:
+    op.execute("ALTER INDEX ix_messages_account_sent RENAME TO ix_messages_account_sent_id")
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_messages_account_sent", "messages", ["account_id", "sent_at"], postgresql_concurrently=True
+        )
+        for name, table, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True)
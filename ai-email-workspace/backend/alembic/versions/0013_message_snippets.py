@@ -0,0 +1,37 @@
+"""add a precomputed snippet to messages for list views
+
+Revision ID: 0013_message_snippets
+Revises: 0012_keyset_pagination
+Create Date: 2026-10-17 00:00:00.000000
+
+Existing rows are backfilled in SQL with the rules of
+``app.utils.snippets.make_snippet``.
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.utils.snippets import SNIPPET_LENGTH
+
+revision = "0013_message_snippets"
+down_revision = "0012_keyset_pagination"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("messages", sa.Column("snippet", sa.String(255)))
+    op.execute(
+        r"""
+        UPDATE messages
+        SET snippet = nullif(
+            rtrim(left(btrim(regexp_replace(regexp_replace(body_text, '^>.*$', '', 'gn'), '\s+', ' ', 'g')), {length})),
+            ''
+        )
+        WHERE body_text IS NOT NULL AND body_text <> ''
+        """.format(length=int(SNIPPET_LENGTH))
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("messages", "snippet")
@@ -0,0 +1,93 @@
+"""store message count, participants, last sender, snippet and folders on threads
+
+Revision ID: 0014_thread_aggregates
+Revises: 0013_message_snippets
+Create Date: 2026-10-17 00:00:00.000000
+
+The aggregates are backfilled in SQL, one range of thread ids at a time,
+following the rules of ``app.utils.threading.fold_thread_aggregates`` as
+they stood when this was written; ``scripts/repair_thread_aggregates.py``
+recomputes them with the live code on a running database. Folder thread
+listings now filter on ``threads.folder_ids`` through a GIN index.
+"""
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+revision = "0014_thread_aggregates"
+down_revision = "0013_message_snippets"
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 1000
+
+# The latest message (by sent_at, then id) gives the last sender and snippet;
+# participants are the alphabetically first 50 distinct lower-cased addresses.
+BACKFILL = """
+UPDATE threads AS t SET
+    message_count = (SELECT count(*) FROM messages m WHERE m.thread_id = t.id),
+    folder_ids = coalesce(
+        (SELECT array_agg(DISTINCT m.folder_id ORDER BY m.folder_id) FROM messages m WHERE m.thread_id = t.id),
+        '{}'
+    ),
+    participants = coalesce(
+        (
+            SELECT json_agg(p.address ORDER BY p.address)
+            FROM (
+                SELECT DISTINCT lower(btrim(a.address, E' \\t\\r\\n')) COLLATE "C" AS address
+                FROM messages m
+                CROSS JOIN LATERAL (
+                    SELECT m.from_email
+                    UNION ALL
+                    SELECT json_array_elements_text(
+                        CASE WHEN json_typeof(m.to_json) = 'array' THEN m.to_json ELSE '[]'::json END
+                    )
+                    UNION ALL
+                    SELECT json_array_elements_text(
+                        CASE WHEN json_typeof(m.cc_json) = 'array' THEN m.cc_json ELSE '[]'::json END
+                    )
+                ) AS a (address)
+                WHERE m.thread_id = t.id AND btrim(a.address, E' \\t\\r\\n') <> ''
+                ORDER BY address
+                LIMIT 50
+            ) AS p
+        ),
+        '[]'::json
+    ),
+    (last_date, last_from_name, last_from_email, last_snippet) = (
+        SELECT m.sent_at, m.from_name, m.from_email, m.snippet
+        FROM messages m
+        WHERE m.thread_id = t.id
+        ORDER BY m.sent_at DESC NULLS LAST, m.id DESC
+        LIMIT 1
+    )
+WHERE t.id > :after AND t.id <= :after + :batch
+"""
+
+
+def upgrade() -> None:
+    op.add_column("threads", sa.Column("message_count", sa.Integer, nullable=False, server_default="0"))
+    op.add_column("threads", sa.Column("participants", sa.JSON))
+    op.add_column("threads", sa.Column("last_from_name", sa.String(255)))
+    op.add_column("threads", sa.Column("last_from_email", sa.String(255)))
+    op.add_column("threads", sa.Column("last_snippet", sa.String(255)))
+    op.add_column(
+        "threads",
+        sa.Column("folder_ids", postgresql.ARRAY(sa.Integer), nullable=False, server_default="{}"),
+    )
+    bind = op.get_bind()
+    max_id = bind.execute(sa.text("SELECT max(id) FROM threads")).scalar() or 0
+    for after in range(0, max_id, BATCH_SIZE):
+        bind.execute(sa.text(BACKFILL), {"after": after, "batch": BATCH_SIZE})
+    op.create_index("ix_threads_folder_ids", "threads", ["folder_ids"], postgresql_using="gin")
+
+
+def downgrade() -> None:
+    op.drop_index("ix_threads_folder_ids", table_name="threads")
+    op.drop_column("threads", "folder_ids")
+    op.drop_column("threads", "last_snippet")
+    op.drop_column("threads", "last_from_email")
+    op.drop_column("threads", "last_from_name")
+    op.drop_column("threads", "participants")
+    op.drop_column("threads", "message_count")
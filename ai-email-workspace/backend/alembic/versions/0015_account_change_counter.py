@@ -0,0 +1,24 @@
+"""add a per-account change counter for ETags on the read routes
+
+Revision ID: 0015_account_change_counter
+Revises: 0014_thread_aggregates
+Create Date: 2026-10-17 00:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0015_account_change_counter"
+down_revision = "0014_thread_aggregates"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("mail_accounts", sa.Column("change_counter", sa.BigInteger, nullable=False, server_default="0"))
+    op.add_column("mail_accounts", sa.Column("changed_at", sa.DateTime(timezone=True), server_default=sa.func.now()))
+
+
+def downgrade() -> None:
+    op.drop_column("mail_accounts", "changed_at")
+    op.drop_column("mail_accounts", "change_counter")
@@ -0,0 +1,89 @@
+"""ETag / Last-Modified validators for the read routes.
+
+The validators come from the account's change counter (see
+``app.services.account_versions``), so answering a conditional request
+costs one primary-key lookup and never touches messages or threads.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Any
+
+from fastapi import Request, Response
+from sqlalchemy import Select, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.models import MailAccount
+
+# Revalidate on every use; the responses are per user.
+CACHE_CONTROL = "private, no-cache"
+
+
+@dataclass
+class Validators:
+    etag: str
+    last_modified: str | None
+
+    def headers(self) -> dict[str, str]:
+        headers = {"ETag": self.etag, "Cache-Control": CACHE_CONTROL}
+        if self.last_modified:
+            headers["Last-Modified"] = self.last_modified
+        return headers
+
+
+def account_version_query() -> Select:
+    """Select the columns ``validators`` needs; join and filter to the resource's account."""
+    return select(MailAccount.id, MailAccount.change_counter, MailAccount.changed_at)
+
+
+async def validators(db: AsyncSession, query: Select) -> Validators | None:
+    row = (await db.execute(query)).first()
+    if row is None:
+        return None
+    # Weak: the body differs by content encoding but not in meaning.
+    etag = f'W/"{row.id}-{row.change_counter}"'
+    last_modified = None
+    if row.changed_at is not None:
+        last_modified = format_datetime(row.changed_at.astimezone(timezone.utc).replace(microsecond=0), usegmt=True)
+    return Validators(etag, last_modified)
+
+
+def _etags(header: str) -> list[str]:
+    return [tag.strip().removeprefix("W/") for tag in header.split(",") if tag.strip()]
+
+
+def _not_modified_since(header: str, last_modified: str | None) -> bool:
+    if last_modified is None:
+        return False
+    try:
+        since = parsedate_to_datetime(header)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    return parsedate_to_datetime(last_modified) <= since
+
+
+def is_not_modified(request: Request, current: Validators) -> bool:
+    """RFC 9110: If-None-Match (weak comparison) wins; If-Modified-Since only without it."""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = _etags(if_none_match)
+        return "*" in tags or current.etag.removeprefix("W/") in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    return if_modified_since is not None and _not_modified_since(if_modified_since, current.last_modified)
+
+
+def not_modified_response(current: Validators) -> Response:
+    return Response(status_code=304, headers=current.headers())
+
+
+def with_validators(result: Any, response: Response, current: Validators | None) -> Any:
+    """Attach the validators to a returned Response, or to the injected one for models."""
+    if current is not None:
+        target = result if isinstance(result, Response) else response
+        target.headers.update(current.headers())
+    return result
@@ -0,0 +1,125 @@
+"""orjson-encoded, optionally compressed responses that skip ``response_model``.
+
+Used by the listing and thread routes when FAST_JSON_RESPONSES is on. The
+routes build plain dicts in the exact shape of their response models, so
+the output matches the validated path byte for byte once decoded.
+"""
+
+from __future__ import annotations
+
+import zlib
+from typing import Any, AsyncIterator
+
+import orjson
+from fastapi import Request, Response
+from fastapi.responses import StreamingResponse
+
+try:
+    import brotli
+except ImportError:  # gzip is always available; brotli only when installed
+    brotli = None
+
+# Matches how pydantic writes UTC datetimes ("...Z").
+ORJSON_OPTIONS = orjson.OPT_UTC_Z
+# Bodies this small are not worth compressing.
+MIN_COMPRESS_BYTES = 500
+# Streamed rows are sent in chunks of about this size.
+STREAM_CHUNK_BYTES = 64 * 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 4
+
+
+def _accepted(accept_encoding: str) -> dict[str, float]:
+    accepted = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if name:
+            accepted[name.strip().lower()] = quality
+    return accepted
+
+
+def negotiate_encoding(accept_encoding: str | None) -> str | None:
+    """``br`` or ``gzip`` if the client accepts it (brotli preferred), else None."""
+    accepted = _accepted(accept_encoding or "")
+    wildcard = accepted.get("*", 0.0)
+    for encoding in ("br", "gzip"):
+        if encoding == "br" and brotli is None:
+            continue
+        if accepted.get(encoding, wildcard) > 0:
+            return encoding
+    return None
+
+
+class _Compressor:
+    def __init__(self, encoding: str) -> None:
+        self.encoding = encoding
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            self._zlib = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._brotli.process(data) if self.encoding == "br" else self._zlib.compress(data)
+
+    def finish(self) -> bytes:
+        return self._brotli.finish() if self.encoding == "br" else self._zlib.flush()
+
+
+def _headers(encoding: str | None) -> dict[str, str]:
+    headers = {"Vary": "Accept-Encoding"}
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return headers
+
+
+def dumps(value: Any) -> bytes:
+    return orjson.dumps(value, option=ORJSON_OPTIONS)
+
+
+def fast_json_response(request: Request, payload: Any) -> Response:
+    body = dumps(payload)
+    encoding = None
+    if len(body) >= MIN_COMPRESS_BYTES:
+        encoding = negotiate_encoding(request.headers.get("accept-encoding"))
+    if encoding:
+        compressor = _Compressor(encoding)
+        body = compressor.compress(body) + compressor.finish()
+    return Response(body, media_type="application/json", headers=_headers(encoding))
+
+
+async def json_array_chunks(prefix: bytes, rows: AsyncIterator[Any], suffix: bytes) -> AsyncIterator[bytes]:
+    """``prefix``, the rows as a JSON array, then ``suffix``, in chunks of about ``STREAM_CHUNK_BYTES``."""
+    buffer = bytearray(prefix + b"[")
+    first = True
+    async for row in rows:
+        if not first:
+            buffer += b","
+        buffer += dumps(row)
+        first = False
+        if len(buffer) >= STREAM_CHUNK_BYTES:
+            yield bytes(buffer)
+            buffer.clear()
+    buffer += b"]" + suffix
+    yield bytes(buffer)
+
+
+async def _compressed(chunks: AsyncIterator[bytes], compressor: _Compressor) -> AsyncIterator[bytes]:
+    async for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+def fast_json_stream(request: Request, chunks: AsyncIterator[bytes]) -> StreamingResponse:
+    encoding = negotiate_encoding(request.headers.get("accept-encoding"))
+    body = _compressed(chunks, _Compressor(encoding)) if encoding else chunks
+    return StreamingResponse(body, media_type="application/json", headers=_headers(encoding))
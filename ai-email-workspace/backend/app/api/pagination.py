@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+import base64
+import json
+from datetime import datetime
+from typing import Any, List, Optional, Tuple
+
+from sqlalchemy import Select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+Cursor = Tuple[Optional[datetime], int]
+
+
+def encode_cursor(date: Optional[datetime], row_id: int) -> str:
+    raw = json.dumps([date.isoformat() if date else None, row_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Cursor:
+    """Raises ``ValueError`` for anything ``encode_cursor`` did not produce."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        date, row_id = json.loads(raw)
+        return (datetime.fromisoformat(date) if date is not None else None), int(row_id)
+    except (TypeError, ValueError, UnicodeDecodeError) as exc:
+        raise ValueError("invalid cursor") from exc
+
+
+async def keyset_page(
+    db: AsyncSession,
+    query: Select,
+    date_column: Any,
+    id_column: Any,
+    limit: int,
+    cursor: Optional[Cursor] = None,
+) -> Tuple[List[Any], Optional[str]]:
+    """One page of ``query`` newest first by ``(date_column, id_column)``.
+
+    Each page seeks past the cursor with a row comparison, so with an index
+    on ``(..., date_column, id_column)`` a deep page costs the same as the
+    first. Rows without a date come after all dated ones; they are read by a
+    second ``IS NULL`` query, since a NULL never satisfies the comparison.
+    """
+    rows: List[Any] = []
+    if cursor is None or cursor[0] is not None:
+        dated = query.where(date_column.isnot(None))
+        if cursor is not None:
+            dated = dated.where(tuple_(date_column, id_column) < tuple_(*cursor))
+        dated = dated.order_by(date_column.desc(), id_column.desc()).limit(limit + 1)
+        rows = list((await db.scalars(dated)).all())
+    if len(rows) <= limit:
+        undated = query.where(date_column.is_(None))
+        if cursor is not None and cursor[0] is None:
+            undated = undated.where(id_column < cursor[1])
+        undated = undated.order_by(id_column.desc()).limit(limit + 1 - len(rows))
+        rows.extend((await db.scalars(undated)).all())
+    if len(rows) <= limit:
+        return rows, None
+    last = rows[limit - 1]
+    date_key, id_key = date_column.key, id_column.key
+    return rows[:limit], encode_cursor(getattr(last, date_key), getattr(last, id_key))
@@ -1,5 +1,12 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+import json
+from typing import Any, AsyncIterator
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, load_only
 
 from app.api.schemas import (
     ChatQueryRequest,
@@ -12,20 +19,156 @@ from app.api.schemas import (
     LoginResponse,
     MailAccountOut,
     MessageOut,
+    MessagePage,
     SendRequest,
     SendResponse,
     ThreadMessagesOut,
-    ThreadOut,
+    ThreadPage,
+)
+from app.api.conditional import (
+    account_version_query,
+    is_not_modified,
+    not_modified_response,
+    validators,
+    with_validators,
 )
-from app.core.db import get_db
+from app.api.fast_json import fast_json_response, fast_json_stream, json_array_chunks
+from app.api.pagination import Cursor, decode_cursor, keyset_page
+from app.core.config import settings
+from app.core.db import AsyncSessionLocal, get_async_db, get_db
 from app.models.models import Folder, MailAccount, Message, Thread
 from app.services.auth import authenticate_user
-from app.services.chat import answer_question
-from app.services.compose import draft_email, send_email
-from app.tasks.jobs import ingest_account
+from app.services.chat import aanswer_question, prepare_answer, stream_answer
+from app.services.compose import adraft_email, send_email, split_draft, stream_draft
+from app.tasks.jobs import fetch_message_body, ingest_account
 
 router = APIRouter()
 
+# Keep proxies from buffering the stream.
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+MAX_PAGE_SIZE = 200
+
+# Everything a listing shows; the bodies stay in the database. Touching any
+# other column of these rows raises instead of lazily loading it.
+MESSAGE_SUMMARY = load_only(
+    Message.id,
+    Message.folder_id,
+    Message.thread_id,
+    Message.subject,
+    Message.sent_at,
+    Message.from_name,
+    Message.from_email,
+    Message.to_json,
+    Message.snippet,
+    Message.has_attachments,
+    raiseload=True,
+)
+# A message with its body, as plain columns rather than ORM objects.
+MESSAGE_DETAIL_COLUMNS = (
+    Message.id,
+    Message.folder_id,
+    Message.thread_id,
+    Message.subject,
+    Message.sent_at,
+    Message.from_name,
+    Message.from_email,
+    Message.to_json,
+    Message.cc_json,
+    Message.bcc_json,
+    Message.body_text,
+)
+# Leaves out the centroid vector.
+THREAD_SUMMARY = load_only(
+    Thread.id,
+    Thread.subject_norm,
+    Thread.last_date,
+    Thread.message_count,
+    Thread.participants,
+    Thread.last_from_name,
+    Thread.last_from_email,
+    Thread.last_snippet,
+    Thread.folder_ids,
+    raiseload=True,
+)
+
+
+def _sse(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(jsonable_encoder(data))}\n\n"
+
+
+def _event_stream(events: AsyncIterator[str]) -> StreamingResponse:
+    return StreamingResponse(events, media_type="text/event-stream", headers=SSE_HEADERS)
+
+
+# The dicts below have exactly the fields of MessageSummaryOut, ThreadOut and
+# MessageOut, so the fast JSON path can send them without the models.
+def _message_summary(message: Message) -> dict[str, Any]:
+    return {
+        "id": message.id,
+        "folder_id": message.folder_id,
+        "thread_id": message.thread_id,
+        "subject": message.subject,
+        "sent_at": message.sent_at,
+        "from_name": message.from_name,
+        "from_email": message.from_email,
+        "to": message.to_json or [],
+        "snippet": message.snippet,
+        "has_attachments": bool(message.has_attachments),
+    }
+
+
+def _thread_summary(thread: Thread) -> dict[str, Any]:
+    return {
+        "id": thread.id,
+        "subject_norm": thread.subject_norm,
+        "last_date": thread.last_date,
+        "message_count": thread.message_count,
+        "participants": thread.participants or [],
+        "last_from_name": thread.last_from_name,
+        "last_from_email": thread.last_from_email,
+        "snippet": thread.last_snippet,
+        "folder_ids": thread.folder_ids or [],
+    }
+
+
+def _message_detail(message: Any) -> dict[str, Any]:
+    return {
+        "id": message.id,
+        "folder_id": message.folder_id,
+        "thread_id": message.thread_id,
+        "subject": message.subject,
+        "sent_at": message.sent_at,
+        "from_name": message.from_name,
+        "from_email": message.from_email,
+        "to": message.to_json or [],
+        "cc": message.cc_json or [],
+        "bcc": message.bcc_json or [],
+        "body_text": message.body_text,
+    }
+
+
+def _thread_messages_query(thread_id: int):
+    return select(*MESSAGE_DETAIL_COLUMNS).where(Message.thread_id == thread_id).order_by(Message.sent_at.asc())
+
+
+async def _stream_thread(thread_id: int) -> AsyncIterator[bytes]:
+    # A streamed body outlives the request's session, so it reads from its own.
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(_thread_messages_query(thread_id))
+        messages = (_message_detail(row) async for row in result)
+        async for chunk in json_array_chunks(b'{"thread_id":%d,"messages":' % thread_id, messages, b"}"):
+            yield chunk
+
+
+def _cursor(cursor: str | None) -> Cursor | None:
+    if cursor is None:
+        return None
+    try:
+        return decode_cursor(cursor)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail="Invalid cursor") from exc
+
 
 @router.post("/api/auth/login", response_model=LoginResponse)
 def login(payload: LoginRequest, db: Session = Depends(get_db)):
@@ -36,11 +179,11 @@ def login(payload: LoginRequest, db: Session = Depends(get_db)):
 
 
 @router.get("/api/accounts", response_model=list[MailAccountOut])
-def list_accounts(user_id: int | None = None, db: Session = Depends(get_db)):
-    query = db.query(MailAccount)
+async def list_accounts(user_id: int | None = None, db: AsyncSession = Depends(get_async_db)):
+    query = select(MailAccount)
     if user_id:
-        query = query.filter(MailAccount.user_id == user_id)
-    accounts = query.all()
+        query = query.where(MailAccount.user_id == user_id)
+    accounts = (await db.scalars(query)).all()
     return [
         MailAccountOut(
             id=acct.id,
@@ -60,95 +203,127 @@ def run_ingest(payload: IngestRequest):
     return {"status": "queued"}
 
 
+@router.post("/api/messages/{message_id}/fetch-body")
+def fetch_body(message_id: int):
+    fetch_message_body.delay(message_id)
+    return {"status": "queued"}
+
+
 @router.get("/api/folders", response_model=list[FolderOut])
-def list_folders(account_id: int, db: Session = Depends(get_db)):
-    folders = db.query(Folder).filter(Folder.account_id == account_id).all()
+async def list_folders(account_id: int, db: AsyncSession = Depends(get_async_db)):
+    folders = (await db.scalars(select(Folder).where(Folder.account_id == account_id))).all()
     return [FolderOut(id=folder.id, name=folder.name) for folder in folders]
 
 
-@router.get("/api/messages", response_model=list[MessageOut])
-def list_messages(
+@router.get("/api/messages", response_model=MessagePage)
+async def list_messages(
+    request: Request,
+    response: Response,
     account_id: int,
     folder_id: int | None = None,
-    limit: int = 50,
-    offset: int = 0,
-    db: Session = Depends(get_db),
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str | None = None,
+    db: AsyncSession = Depends(get_async_db),
 ):
-    query = db.query(Message).filter(Message.account_id == account_id)
+    """Newest first; pass the returned ``next_cursor`` back as ``cursor`` for the next page."""
+    after = _cursor(cursor)
+    current = await validators(db, account_version_query().where(MailAccount.id == account_id))
+    if current and is_not_modified(request, current):
+        return not_modified_response(current)
+    query = select(Message).options(MESSAGE_SUMMARY).where(Message.account_id == account_id)
     if folder_id:
-        query = query.filter(Message.folder_id == folder_id)
-    messages = query.order_by(Message.sent_at.desc()).limit(limit).offset(offset).all()
-    return [
-        MessageOut(
-            id=message.id,
-            folder_id=message.folder_id,
-            thread_id=message.thread_id,
-            subject=message.subject,
-            sent_at=message.sent_at,
-            from_name=message.from_name,
-            from_email=message.from_email,
-            to=message.to_json or [],
-            cc=message.cc_json or [],
-            bcc=message.bcc_json or [],
-            body_text=message.body_text,
-        )
-        for message in messages
-    ]
+        query = query.where(Message.folder_id == folder_id)
+    messages, next_cursor = await keyset_page(db, query, Message.sent_at, Message.id, limit, after)
+    page = {"items": [_message_summary(message) for message in messages], "next_cursor": next_cursor}
+    if settings.fast_json_responses:
+        return with_validators(fast_json_response(request, page), response, current)
+    return with_validators(MessagePage(**page), response, current)
+
 
+@router.get("/api/messages/{message_id}", response_model=MessageOut)
+async def get_message(
+    request: Request, response: Response, message_id: int, db: AsyncSession = Depends(get_async_db)
+):
+    version = account_version_query().join(Message, Message.account_id == MailAccount.id)
+    current = await validators(db, version.where(Message.id == message_id))
+    if current and is_not_modified(request, current):
+        return not_modified_response(current)
+    message = (await db.execute(select(*MESSAGE_DETAIL_COLUMNS).where(Message.id == message_id))).first()
+    if message is None:
+        raise HTTPException(status_code=404, detail="Message not found")
+    if settings.fast_json_responses:
+        return with_validators(fast_json_response(request, _message_detail(message)), response, current)
+    return with_validators(MessageOut(**_message_detail(message)), response, current)
 
-@router.get("/api/threads", response_model=list[ThreadOut])
-def list_threads(account_id: int, folder_id: int | None = None, db: Session = Depends(get_db)):
-    query = db.query(Thread).filter(Thread.account_id == account_id)
+
+@router.get("/api/threads", response_model=ThreadPage)
+async def list_threads(
+    request: Request,
+    response: Response,
+    account_id: int,
+    folder_id: int | None = None,
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str | None = None,
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Most recently active first, paged like ``/api/messages``; served from ``threads`` alone."""
+    after = _cursor(cursor)
+    current = await validators(db, account_version_query().where(MailAccount.id == account_id))
+    if current and is_not_modified(request, current):
+        return not_modified_response(current)
+    query = select(Thread).options(THREAD_SUMMARY).where(Thread.account_id == account_id)
     if folder_id:
-        message_thread_ids = (
-            db.query(Message.thread_id).filter(Message.folder_id == folder_id).distinct().subquery()
-        )
-        query = query.filter(Thread.id.in_(message_thread_ids))
-    threads = query.order_by(Thread.last_date.desc()).all()
-    return [
-        ThreadOut(id=thread.id, subject_norm=thread.subject_norm, last_date=thread.last_date)
-        for thread in threads
-    ]
+        query = query.where(Thread.folder_ids.contains([folder_id]))
+    threads, next_cursor = await keyset_page(db, query, Thread.last_date, Thread.id, limit, after)
+    page = {"items": [_thread_summary(thread) for thread in threads], "next_cursor": next_cursor}
+    if settings.fast_json_responses:
+        return with_validators(fast_json_response(request, page), response, current)
+    return with_validators(ThreadPage(**page), response, current)
 
 
 @router.get("/api/thread/{thread_id}", response_model=ThreadMessagesOut)
-def get_thread(thread_id: int, db: Session = Depends(get_db)):
-    messages = (
-        db.query(Message)
-        .filter(Message.thread_id == thread_id)
-        .order_by(Message.sent_at.asc())
-        .all()
-    )
-    return ThreadMessagesOut(
-        thread_id=thread_id,
-        messages=[
-            MessageOut(
-                id=message.id,
-                folder_id=message.folder_id,
-                thread_id=message.thread_id,
-                subject=message.subject,
-                sent_at=message.sent_at,
-                from_name=message.from_name,
-                from_email=message.from_email,
-                to=message.to_json or [],
-                cc=message.cc_json or [],
-                bcc=message.bcc_json or [],
-                body_text=message.body_text,
-            )
-            for message in messages
-        ],
-    )
+async def get_thread(
+    request: Request, response: Response, thread_id: int, db: AsyncSession = Depends(get_async_db)
+):
+    version = account_version_query().join(Thread, Thread.account_id == MailAccount.id)
+    current = await validators(db, version.where(Thread.id == thread_id))
+    if current and is_not_modified(request, current):
+        return not_modified_response(current)
+    if settings.fast_json_responses:
+        return with_validators(fast_json_stream(request, _stream_thread(thread_id)), response, current)
+    messages = (await db.execute(_thread_messages_query(thread_id))).all()
+    result = ThreadMessagesOut(thread_id=thread_id, messages=[_message_detail(message) for message in messages])
+    return with_validators(result, response, current)
 
 
 @router.post("/api/compose/draft", response_model=DraftResponse)
-def compose_draft(payload: DraftRequest):
+async def compose_draft(payload: DraftRequest):
     try:
-        subject, body = draft_email(payload.to, payload.subject_hint, payload.instructions)
+        subject, body = await adraft_email(payload.to, payload.subject_hint, payload.instructions)
         return DraftResponse(subject=subject, body=body)
     except RuntimeError as exc:
         raise HTTPException(status_code=503, detail=str(exc)) from exc
 
 
+@router.post("/api/compose/draft/stream")
+async def compose_draft_stream(payload: DraftRequest):
+    """Stream ``token`` events as the draft is written, then ``done`` with the parsed subject and body."""
+
+    async def events():
+        pieces = []
+        try:
+            async for piece in stream_draft(payload.to, payload.subject_hint, payload.instructions):
+                pieces.append(piece)
+                yield _sse("token", {"text": piece})
+        except RuntimeError as exc:
+            yield _sse("error", {"detail": str(exc)})
+            return
+        subject, body = split_draft("".join(pieces), payload.subject_hint)
+        yield _sse("done", DraftResponse(subject=subject, body=body))
+
+    return _event_stream(events())
+
+
 @router.post("/api/compose/send", response_model=SendResponse)
 def compose_send(payload: SendRequest, db: Session = Depends(get_db)):
     message = send_email(db, payload.account_id, payload.to, payload.subject, payload.body)
@@ -156,9 +331,9 @@ def compose_send(payload: SendRequest, db: Session = Depends(get_db)):
 
 
 @router.post("/api/chat/query", response_model=ChatQueryResponse)
-def chat_query(payload: ChatQueryRequest, db: Session = Depends(get_db)):
+async def chat_query(payload: ChatQueryRequest, db: AsyncSession = Depends(get_async_db)):
     try:
-        answer, citations = answer_question(
+        answer, citations = await aanswer_question(
             db,
             payload.account_id,
             payload.query,
@@ -167,3 +342,24 @@ def chat_query(payload: ChatQueryRequest, db: Session = Depends(get_db)):
         return ChatQueryResponse(answer=answer, citations=citations)
     except RuntimeError as exc:
         raise HTTPException(status_code=503, detail=str(exc)) from exc
+
+
+@router.post("/api/chat/query/stream")
+async def chat_query_stream(payload: ChatQueryRequest, db: AsyncSession = Depends(get_async_db)):
+    """Stream a ``citations`` event, then ``token`` events as the answer is generated, then ``done``."""
+    try:
+        prepared = await prepare_answer(db, payload.account_id, payload.query, payload.selected_thread_id)
+    except RuntimeError as exc:
+        raise HTTPException(status_code=503, detail=str(exc)) from exc
+
+    async def events():
+        yield _sse("citations", prepared.citations)
+        try:
+            async for piece in stream_answer(prepared):
+                yield _sse("token", {"text": piece})
+        except RuntimeError as exc:
+            yield _sse("error", {"detail": str(exc)})
+            return
+        yield _sse("done", {})
+
+    return _event_stream(events())
@@ -42,10 +42,39 @@ class MessageOut(BaseModel):
     body_text: Optional[str]
 
 
+class MessageSummaryOut(BaseModel):
+    id: int
+    folder_id: int
+    thread_id: int
+    subject: Optional[str]
+    sent_at: Optional[datetime]
+    from_name: Optional[str]
+    from_email: Optional[str]
+    to: List[str] = Field(default_factory=list)
+    snippet: Optional[str]
+    has_attachments: bool = False
+
+
+class MessagePage(BaseModel):
+    items: List[MessageSummaryOut]
+    next_cursor: Optional[str] = None
+
+
 class ThreadOut(BaseModel):
     id: int
     subject_norm: str
     last_date: Optional[datetime]
+    message_count: int = 0
+    participants: List[str] = Field(default_factory=list)
+    last_from_name: Optional[str] = None
+    last_from_email: Optional[str] = None
+    snippet: Optional[str] = None
+    folder_ids: List[int] = Field(default_factory=list)
+
+
+class ThreadPage(BaseModel):
+    items: List[ThreadOut]
+    next_cursor: Optional[str] = None
 
 
 class ThreadMessagesOut(BaseModel):
@@ -3,6 +3,10 @@ from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
     database_url: str = "postgresql+psycopg2://postgres:postgres@db:5432/inboxia"
+    async_database_url: str = ""
+    async_db_pool_size: int = 20
+    async_db_max_overflow: int = 20
+    fast_json_responses: bool = False
     redis_url: str = "redis://redis:6379/0"
     provider: str = "stub"
     llm_provider: str | None = None
@@ -12,7 +16,63 @@ class Settings(BaseSettings):
     openai_base_url: str = "https://api.openai.com/v1"
     openai_chat_model: str | None = None
     openai_embedding_model: str | None = None
+    llm_http_max_connections: int = 20
+    llm_http_max_keepalive_connections: int = 10
+    llm_http2: bool = False
+    embed_timeout_seconds: float = 30.0
+    chat_timeout_seconds: float = 120.0
+    llm_embed_requests_per_minute: int = 0
+    llm_embed_tokens_per_minute: int = 0
+    llm_chat_requests_per_minute: int = 0
+    llm_chat_tokens_per_minute: int = 0
+    llm_chat_priority_ms: int = 250
+    llm_max_retries: int = 4
+    llm_retry_backoff_initial: float = 1.0
+    llm_retry_backoff_max: float = 30.0
+    llm_circuit_failure_threshold: int = 5
+    llm_circuit_open_seconds: int = 60
+    vector_index_m: int = 16
+    vector_index_ef_construction: int = 64
+    hnsw_ef_search: int = 40
+    ivfflat_probes: int = 10
+    hnsw_iterative_scan: str = "strict_order"
+    embedding_partitions: int = 16
+    hybrid_candidates: int = 40
+    rrf_k: int = 60
+    retrieval_thread_candidates: int = 20
+    chat_context_candidates: int = 16
+    chat_context_token_budget: int = 3000
+    chat_context_max_per_thread: int = 2
+    chat_context_mmr_lambda: float = 0.7
+    chat_context_min_excerpt_tokens: int = 64
+    query_embedding_cache_ttl_seconds: int = 86400
+    answer_cache_ttl_seconds: int = 600
+    query_cache_lru_size: int = 1024
+    query_cache_wait_seconds: float = 60.0
     frontend_backend_url: str = "http://localhost:8000"
+    ingest_batch_size: int = 200
+    ingest_mode: str = "full"
+    ingest_max_text_part_bytes: int = 1_000_000
+    ingest_max_connections_per_account: int = 4
+    ingest_uid_range_size: int = 5000
+    ingest_flag_sync_fallback: bool = True
+    ingest_slot_retry_seconds: int = 30
+    imap_slot_ttl_seconds: int = 600
+    imap_folder_lock_ttl_seconds: int = 600
+    ingest_pending_ttl_seconds: int = 900
+    embed_batch_max_items: int = 64
+    embed_batch_max_tokens: int = 8000
+    embedding_cache_lru_size: int = 10000
+    embed_concurrency: int = 4
+    idle_folders: str = "INBOX"
+    idle_account_ids: str = ""
+    idle_max_connections: int = 100
+    idle_reserved_ingest_connections: int = 1
+    idle_check_timeout: float = 30.0
+    idle_renew_seconds: int = 1500
+    idle_stable_seconds: float = 60.0
+    idle_backoff_initial: float = 1.0
+    idle_backoff_max: float = 300.0
 
 
 settings = Settings()
@@ -1,4 +1,6 @@
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
 
 from app.core.config import settings
@@ -7,9 +9,31 @@ engine = create_engine(settings.database_url, pool_pre_ping=True)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 
+def async_database_url() -> str:
+    """ASYNC_DATABASE_URL, or DATABASE_URL switched to the asyncpg driver."""
+    if settings.async_database_url:
+        return settings.async_database_url
+    return make_url(settings.database_url).set(drivername="postgresql+asyncpg").render_as_string(hide_password=False)
+
+
+# Used by the async API routes; Celery and the sync services keep using ``engine``.
+async_engine = create_async_engine(
+    async_database_url(),
+    pool_pre_ping=True,
+    pool_size=settings.async_db_pool_size,
+    max_overflow=settings.async_db_max_overflow,
+)
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,12 @@
+import redis
+
+from app.core.config import settings
+
+_redis: redis.Redis | None = None
+
+
+def get_redis() -> redis.Redis:
+    global _redis
+    if _redis is None:
+        _redis = redis.Redis.from_url(settings.redis_url)
+    return _redis
@@ -0,0 +1,33 @@
+"""Run the IMAP IDLE listener: ``python -m app.idle_listener``."""
+
+import logging
+import signal
+
+from app.core.db import SessionLocal
+from app.services.idle import IdleListener, load_watched_folders
+
+logger = logging.getLogger(__name__)
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO)
+    db = SessionLocal()
+    try:
+        watched = load_watched_folders(db)
+    finally:
+        db.close()
+    listener = IdleListener(watched)
+    signal.signal(signal.SIGTERM, lambda *_: listener.stop_event.set())
+    logger.info("Watching %s folders for new mail", len(watched))
+    listener.start()
+    try:
+        while not listener.stop_event.wait(1):
+            pass
+    except KeyboardInterrupt:
+        pass
+    finally:
+        listener.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,8 @@ from fastapi.middleware.cors import CORSMiddleware
 
 from app.api.routes import router
 from app.core.config import settings
+from app.core.db import async_engine
+from app.providers.factory import aclose_providers
 
 app = FastAPI(title="Inboxia API")
 logger = logging.getLogger(__name__)
@@ -38,6 +40,12 @@ def validate_llm_configuration() -> None:
     logger.info("Configured LLM models: chat=%s embedding=%s", chat_model, embedding_model)
 
 
+@app.on_event("shutdown")
+async def close_pools() -> None:
+    await aclose_providers()
+    await async_engine.dispose()
+
+
 @app.get("/health")
 def health():
     return {"status": "ok"}
@@ -1,11 +1,36 @@
-from sqlalchemy import JSON, Boolean, Column, DateTime, ForeignKey, Index, Integer, String, Text
-from sqlalchemy.orm import relationship
+from sqlalchemy import (
+    DDL,
+    JSON,
+    BigInteger,
+    Boolean,
+    Column,
+    Computed,
+    DateTime,
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+    Text,
+    event,
+)
+from sqlalchemy.dialects.postgresql import ARRAY, TSVECTOR
+from sqlalchemy.orm import deferred, relationship
 from sqlalchemy.sql import func
 from pgvector.sqlalchemy import Vector
 
+from app.core.config import settings
 from app.models.base import Base
 
 
+# Text search configuration baked into the generated tsvector columns.
+SEARCH_CONFIG = "english"
+MESSAGE_SEARCH_EXPRESSION = (
+    f"setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(subject, '')), 'A') || "
+    f"setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(from_name, '') || ' ' || coalesce(from_email, '')), 'B')"
+)
+EMBEDDING_SEARCH_EXPRESSION = f"to_tsvector('{SEARCH_CONFIG}', content)"
+
+
 class User(Base):
     __tablename__ = "users"
 
@@ -29,7 +54,12 @@ class MailAccount(Base):
     smtp_host = Column(String(255), nullable=False)
     smtp_user = Column(String(255), nullable=False)
     smtp_password = Column(String(255), nullable=False)
+    ingest_batch_size = Column(Integer)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Bumped with every change to the account's messages or threads; the
+    # read routes derive their ETag and Last-Modified from these.
+    change_counter = Column(BigInteger, nullable=False, default=0, server_default="0")
+    changed_at = Column(DateTime(timezone=True), server_default=func.now())
 
     user = relationship("User", back_populates="accounts")
     folders = relationship("Folder", back_populates="account")
@@ -43,6 +73,8 @@ class Folder(Base):
     account_id = Column(Integer, ForeignKey("mail_accounts.id"), nullable=False, index=True)
     name = Column(String(255), nullable=False)
     last_uid = Column(Integer, default=0)
+    uidvalidity = Column(BigInteger)
+    highestmodseq = Column(BigInteger)
 
     account = relationship("MailAccount", back_populates="folders")
     messages = relationship("Message", back_populates="folder")
@@ -56,6 +88,18 @@ class Thread(Base):
     thread_key = Column(String(255), nullable=False, index=True)
     subject_norm = Column(String(255), nullable=False)
     last_date = Column(DateTime(timezone=True))
+    # Kept up to date as messages arrive (see app.utils.threading) so thread
+    # listings read a single row per thread.
+    message_count = Column(Integer, nullable=False, default=0, server_default="0")
+    participants = Column(JSON, default=list)
+    last_from_name = Column(String(255))
+    last_from_email = Column(String(255))
+    last_snippet = Column(String(255))
+    # An array rather than JSON so listings can filter with ``@>``.
+    folder_ids = Column(ARRAY(Integer), nullable=False, default=list, server_default="{}")
+    # Mean of the thread's chunk vectors, for picking candidate threads first.
+    centroid = Column(Vector(1536))
+    centroid_count = Column(Integer, nullable=False, default=0, server_default="0")
 
     account = relationship("MailAccount", back_populates="threads")
     messages = relationship("Message", back_populates="thread")
@@ -68,7 +112,7 @@ class Message(Base):
     account_id = Column(Integer, ForeignKey("mail_accounts.id"), nullable=False, index=True)
     folder_id = Column(Integer, ForeignKey("folders.id"), nullable=False)
     thread_id = Column(Integer, ForeignKey("threads.id"), nullable=False, index=True)
-    message_id_header = Column(String(255), unique=True, index=True)
+    message_id_header = Column(String(255), index=True)
     in_reply_to = Column(String(255))
     references = Column(Text)
     subject = Column(String(255))
@@ -78,10 +122,18 @@ class Message(Base):
     to_json = Column(JSON, default=list)
     cc_json = Column(JSON, default=list)
     bcc_json = Column(JSON, default=list)
-    body_text = Column(Text)
-    body_html = Column(Text)
-    raw_rfc822 = Column(Text)
+    # Listings read ``snippet``; the large columns load only when asked for.
+    snippet = Column(String(255))
+    body_text = deferred(Column(Text))
+    body_html = deferred(Column(Text))
+    raw_rfc822 = deferred(Column(Text))
+    imap_uid = Column(Integer)
+    size_bytes = Column(Integer)
+    has_attachments = Column(Boolean, default=False)
+    body_deferred = Column(Boolean, default=False)
+    flags_json = Column(JSON, default=list)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    search_vector = deferred(Column(TSVECTOR, Computed(MESSAGE_SEARCH_EXPRESSION, persisted=True)))
 
     folder = relationship("Folder", back_populates="messages")
     thread = relationship("Thread", back_populates="messages")
@@ -90,17 +142,92 @@ class Message(Base):
 
 class Embedding(Base):
     __tablename__ = "embeddings"
+    # Hash-partitioned by account so each partition carries its own (smaller)
+    # vector index and retrieval for one account only scans its partition.
+    __table_args__ = {"postgresql_partition_by": "HASH (account_id)"}
 
-    id = Column(Integer, primary_key=True)
-    message_id = Column(Integer, ForeignKey("messages.id"), nullable=False, index=True)
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    account_id = Column(Integer, ForeignKey("mail_accounts.id"), primary_key=True)
+    message_id = Column(Integer, ForeignKey("messages.id"), nullable=False)
     model = Column(String(128), nullable=False)
     chunk_index = Column(Integer, nullable=False)
     content = Column(Text, nullable=False)
+    content_hash = Column(String(64))
     vector = Column(Vector(1536))
+    search_vector = Column(TSVECTOR, Computed(EMBEDDING_SEARCH_EXPRESSION, persisted=True))
 
     message = relationship("Message", back_populates="embeddings")
 
 
-Index("ix_messages_account_sent", Message.account_id, Message.sent_at)
+def embedding_partition_ddl(partitions: int) -> list[str]:
+    return [
+        f"CREATE TABLE embeddings_p{remainder} PARTITION OF embeddings "
+        f"FOR VALUES WITH (MODULUS {partitions}, REMAINDER {remainder})"
+        for remainder in range(partitions)
+    ]
+
+
+for _statement in embedding_partition_ddl(settings.embedding_partitions):
+    event.listen(Embedding.__table__, "after_create", DDL(_statement).execute_if(dialect="postgresql"))
+
+
+class EmbeddingCacheEntry(Base):
+    __tablename__ = "embedding_cache"
+
+    model = Column(String(128), primary_key=True)
+    content_hash = Column(String(64), primary_key=True)
+    vector = Column(Vector(1536), nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+# Keyset pagination seeks on (sent_at, id) / (last_date, id) within an
+# account or folder.
+Index("ix_messages_account_sent", Message.account_id, Message.sent_at, Message.id)
+Index("ix_messages_folder_sent", Message.folder_id, Message.sent_at, Message.id)
+Index(
+    "ix_messages_folder_uid",
+    Message.folder_id,
+    Message.imap_uid,
+    unique=True,
+    postgresql_where=Message.imap_uid.isnot(None),
+)
+Index("ix_messages_search", Message.search_vector, postgresql_using="gin")
+# Trigram indexes let the ilike '%term%' chat filters use an index.
+Index(
+    "ix_messages_from_email_trgm",
+    Message.from_email,
+    postgresql_using="gin",
+    postgresql_ops={"from_email": "gin_trgm_ops"},
+)
+Index(
+    "ix_messages_subject_trgm",
+    Message.subject,
+    postgresql_using="gin",
+    postgresql_ops={"subject": "gin_trgm_ops"},
+)
+event.listen(
+    Message.__table__,
+    "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql"),
+)
 Index("ix_threads_account_key", Thread.account_id, Thread.thread_key)
-Index("ix_embeddings_vector", Embedding.vector, postgresql_using="ivfflat")
+Index("ix_threads_account_last_date", Thread.account_id, Thread.last_date, Thread.id)
+# Serves the ``folder_ids @> ARRAY[:id]`` filter of folder thread listings.
+Index("ix_threads_folder_ids", Thread.folder_ids, postgresql_using="gin")
+Index(
+    "ix_threads_centroid",
+    Thread.centroid,
+    postgresql_using="hnsw",
+    postgresql_with={"m": settings.vector_index_m, "ef_construction": settings.vector_index_ef_construction},
+    postgresql_ops={"centroid": "vector_cosine_ops"},
+)
+# Named and parameterized as the migrations build them.
+Index("ix_embeddings_message", Embedding.message_id)
+Index(
+    "ix_embeddings_vector",
+    Embedding.vector,
+    postgresql_using="hnsw",
+    postgresql_with={"m": settings.vector_index_m, "ef_construction": settings.vector_index_ef_construction},
+    postgresql_ops={"vector": "vector_cosine_ops"},
+)
+Index("ix_embeddings_search", Embedding.search_vector, postgresql_using="gin")
@@ -1,5 +1,26 @@
+import asyncio
 from abc import ABC, abstractmethod
-from typing import List
+from typing import AsyncIterator, List
+
+
+class ProviderUnavailable(RuntimeError):
+    """The LLM service failed a request; ``retryable`` failures may succeed later."""
+
+    def __init__(self, message: str, retryable: bool = False, retry_after: float | None = None) -> None:
+        super().__init__(message)
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+
+class CircuitOpen(ProviderUnavailable):
+    """Calls are paused after repeated failures; retry after ``retry_after`` seconds."""
+
+    def __init__(self, kind: str, retry_after: float) -> None:
+        super().__init__(
+            f"LLM {kind} requests are paused for {retry_after:.0f}s after repeated failures",
+            retryable=True,
+            retry_after=retry_after,
+        )
 
 
 class LLMProvider(ABC):
@@ -10,3 +31,28 @@ class LLMProvider(ABC):
     @abstractmethod
     def chat(self, prompt: str) -> str:
         raise NotImplementedError
+
+    async def aembed(self, texts: List[str]) -> List[List[float]]:
+        """Async ``embed``; providers without native async I/O run it in a thread."""
+        return await asyncio.to_thread(self.embed, texts)
+
+    async def achat(self, prompt: str) -> str:
+        return await asyncio.to_thread(self.chat, prompt)
+
+    async def astream_chat(self, prompt: str) -> AsyncIterator[str]:
+        """Yield the completion in pieces as they are generated; by default all at once."""
+        yield await self.achat(prompt)
+
+    def embedding_model_id(self) -> str:
+        """Identifies the vectors this provider produces, for caching and storage."""
+        return self.__class__.__name__
+
+    def chat_model_id(self) -> str:
+        """Identifies the model behind ``chat``, for caching answers."""
+        return self.__class__.__name__
+
+    def close(self) -> None:
+        """Release pooled connections; the provider must not be used afterwards."""
+
+    async def aclose(self) -> None:
+        """Release async connections opened on the running event loop."""
@@ -1,11 +1,53 @@
+import threading
+
 from app.core.config import settings
 from app.providers.base import LLMProvider
 from app.providers.openai import OpenAIProvider
+from app.providers.resilience import ResilientProvider
 from app.providers.stub import LocalStubProvider
 
+_providers: dict[tuple, LLMProvider] = {}
+_lock = threading.Lock()
+
+
+def _config_key() -> tuple:
+    return (
+        (settings.llm_provider or settings.provider).lower(),
+        settings.openai_base_url,
+        settings.openai_api_key,
+        settings.chat_model or settings.openai_chat_model,
+        settings.embedding_model or settings.openai_embedding_model,
+    )
+
 
 def get_provider() -> LLMProvider:
-    provider_name = (settings.llm_provider or settings.provider).lower()
-    if provider_name in {"openai", "openai_compatible"}:
-        return OpenAIProvider()
-    return LocalStubProvider()
+    """Return the provider for the current configuration, reusing one instance per configuration."""
+    key = _config_key()
+    provider = _providers.get(key)
+    if provider is not None:
+        return provider
+    with _lock:
+        provider = _providers.get(key)
+        if provider is None:
+            if key[0] in {"openai", "openai_compatible"}:
+                provider = ResilientProvider(OpenAIProvider())
+            else:
+                provider = LocalStubProvider()
+            _providers[key] = provider
+    return provider
+
+
+def close_providers() -> None:
+    """Close every cached provider's HTTP client (FastAPI and Celery worker shutdown)."""
+    with _lock:
+        providers = list(_providers.values())
+        _providers.clear()
+    for provider in providers:
+        provider.close()
+
+
+async def aclose_providers() -> None:
+    """Close async clients opened on the running loop, then every cached provider."""
+    for provider in list(_providers.values()):
+        await provider.aclose()
+    close_providers()
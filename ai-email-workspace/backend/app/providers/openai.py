@@ -1,18 +1,88 @@
-from typing import List
+import asyncio
+import json
+import weakref
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, AsyncIterator, List
 
 import httpx
 
 from app.core.config import settings
-from app.providers.base import LLMProvider
+from app.providers.base import LLMProvider, ProviderUnavailable
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP date)."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+def parse_stream_line(line: str) -> str:
+    """Text delta carried by one server-sent line of a streamed chat completion."""
+    if not line.startswith("data:"):
+        return ""
+    data = line[len("data:") :].strip()
+    if not data or data == "[DONE]":
+        return ""
+    choices = json.loads(data).get("choices") or [{}]
+    return (choices[0].get("delta") or {}).get("content") or ""
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=settings.llm_http_max_connections,
+        max_keepalive_connections=settings.llm_http_max_keepalive_connections,
+    )
+
+
+def build_http_client() -> httpx.Client:
+    """A long-lived client so requests reuse pooled keep-alive connections."""
+    return httpx.Client(limits=_limits(), http2=settings.llm_http2)
+
+
+def build_async_http_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(limits=_limits(), http2=settings.llm_http2)
 
 
 class OpenAIProvider(LLMProvider):
-    def __init__(self) -> None:
+    def __init__(self, client: httpx.Client | None = None) -> None:
         provider_name = (settings.llm_provider or settings.provider).lower()
         if not settings.openai_api_key and provider_name != "openai_compatible":
             raise ValueError("OPENAI_API_KEY is required for OpenAIProvider")
         self.api_key = settings.openai_api_key or ""
         self.base_url = settings.openai_base_url.rstrip("/")
+        self.client = client or build_http_client()
+        # Async connections belong to the event loop that opened them.
+        self._async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = (
+            weakref.WeakKeyDictionary()
+        )
+
+    def close(self) -> None:
+        self.client.close()
+
+    def _async_client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None or client.is_closed:
+            client = build_async_http_client()
+            self._async_clients[loop] = client
+        return client
+
+    async def aclose(self) -> None:
+        client = self._async_clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
 
     def _resolve_chat_model(self) -> str:
         if not settings.openai_chat_model:
@@ -30,18 +100,33 @@ class OpenAIProvider(LLMProvider):
             )
         return settings.embedding_model or settings.openai_embedding_model
 
+    def embedding_model_id(self) -> str:
+        return self._resolve_embedding_model()
+
+    def chat_model_id(self) -> str:
+        return self._resolve_chat_model()
+
     def _headers(self) -> dict[str, str]:
         if not self.api_key:
             return {}
         return {"Authorization": f"Bearer {self.api_key}"}
 
     def _raise_for_unreachable(self, exc: Exception) -> None:
-        raise RuntimeError(
+        # Timeouts, dropped connections, 429s and 5xx are worth retrying.
+        retryable = True
+        retry_after = None
+        if isinstance(exc, httpx.HTTPStatusError):
+            status = exc.response.status_code
+            retryable = status == 429 or status >= 500
+            retry_after = parse_retry_after(exc.response.headers.get("Retry-After"))
+        raise ProviderUnavailable(
             f"LLM service at {self.base_url} is unreachable or misconfigured. "
-            "Verify the service is running and OPENAI_BASE_URL is correct."
+            "Verify the service is running and OPENAI_BASE_URL is correct.",
+            retryable=retryable,
+            retry_after=retry_after,
         ) from exc
 
-    def embed(self, texts: List[str]) -> List[List[float]]:
+    def _embed_payload(self, texts: List[str]) -> dict[str, Any]:
         embedding_model = self._resolve_embedding_model()
         chat_model = self._resolve_chat_model()
         if embedding_model == chat_model:
@@ -49,18 +134,9 @@ class OpenAIProvider(LLMProvider):
                 "Embedding model matches the chat model. Configure OPENAI_EMBEDDING_MODEL "
                 "to a model that supports /v1/embeddings."
             )
-        payload = {"model": embedding_model, "input": texts}
-        try:
-            response = httpx.post(
-                f"{self.base_url}/embeddings",
-                json=payload,
-                headers=self._headers(),
-                timeout=30,
-            )
-            response.raise_for_status()
-        except (httpx.RequestError, httpx.HTTPStatusError) as exc:
-            self._raise_for_unreachable(exc)
-        data = response.json()
+        return {"model": embedding_model, "input": texts}
+
+    def _parse_embeddings(self, data: dict[str, Any]) -> List[List[float]]:
         if "data" in data and isinstance(data["data"], list):
             embeddings: List[List[float]] = []
             for item in data["data"]:
@@ -92,23 +168,89 @@ class OpenAIProvider(LLMProvider):
             raise RuntimeError(f"Embedding request failed: {error}")
         raise RuntimeError(f"Unexpected embedding response from {self.base_url}: {data}")
 
-    def chat(self, prompt: str) -> str:
-        payload = {
+    def _chat_payload(self, prompt: str) -> dict[str, Any]:
+        return {
             "model": self._resolve_chat_model(),
             "messages": [
                 {"role": "system", "content": "You are an assistant for an email workspace. Follow instructions."},
                 {"role": "user", "content": prompt},
             ],
         }
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        payload = self._embed_payload(texts)
+        try:
+            response = self.client.post(
+                f"{self.base_url}/embeddings",
+                json=payload,
+                headers=self._headers(),
+                timeout=settings.embed_timeout_seconds,
+            )
+            response.raise_for_status()
+        except (httpx.RequestError, httpx.HTTPStatusError) as exc:
+            self._raise_for_unreachable(exc)
+        return self._parse_embeddings(response.json())
+
+    def chat(self, prompt: str) -> str:
+        payload = self._chat_payload(prompt)
         try:
-            response = httpx.post(
+            response = self.client.post(
                 f"{self.base_url}/chat/completions",
                 json=payload,
                 headers=self._headers(),
-                timeout=30,
+                timeout=settings.chat_timeout_seconds,
             )
             response.raise_for_status()
         except (httpx.RequestError, httpx.HTTPStatusError) as exc:
             self._raise_for_unreachable(exc)
         data = response.json()
         return data["choices"][0]["message"]["content"]
+
+    async def aembed(self, texts: List[str]) -> List[List[float]]:
+        payload = self._embed_payload(texts)
+        try:
+            response = await self._async_client().post(
+                f"{self.base_url}/embeddings",
+                json=payload,
+                headers=self._headers(),
+                timeout=settings.embed_timeout_seconds,
+            )
+            response.raise_for_status()
+        except (httpx.RequestError, httpx.HTTPStatusError) as exc:
+            self._raise_for_unreachable(exc)
+        return self._parse_embeddings(response.json())
+
+    async def achat(self, prompt: str) -> str:
+        payload = self._chat_payload(prompt)
+        try:
+            response = await self._async_client().post(
+                f"{self.base_url}/chat/completions",
+                json=payload,
+                headers=self._headers(),
+                timeout=settings.chat_timeout_seconds,
+            )
+            response.raise_for_status()
+        except (httpx.RequestError, httpx.HTTPStatusError) as exc:
+            self._raise_for_unreachable(exc)
+        data = response.json()
+        return data["choices"][0]["message"]["content"]
+
+    async def astream_chat(self, prompt: str) -> AsyncIterator[str]:
+        payload = {**self._chat_payload(prompt), "stream": True}
+        try:
+            async with self._async_client().stream(
+                "POST",
+                f"{self.base_url}/chat/completions",
+                json=payload,
+                headers=self._headers(),
+                timeout=settings.chat_timeout_seconds,
+            ) as response:
+                if response.is_error:
+                    await response.aread()
+                    response.raise_for_status()
+                async for line in response.aiter_lines():
+                    delta = parse_stream_line(line)
+                    if delta:
+                        yield delta
+        except (httpx.RequestError, httpx.HTTPStatusError) as exc:
+            self._raise_for_unreachable(exc)
@@ -0,0 +1,254 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import random
+import time
+from typing import AsyncIterator, Awaitable, Callable, List, TypeVar
+
+import redis
+
+from app.core.config import settings
+from app.core.redis import get_redis
+from app.providers.base import CircuitOpen, LLMProvider, ProviderUnavailable
+from app.utils.chunking import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+EMBED = "embed"
+CHAT = "chat"
+
+# Two token buckets (requests and tokens per minute) stored as hashes of
+# level and last refill time. Both are charged or neither is; the result is
+# how many ms to wait before trying again. A bucket with capacity 0 is
+# unlimited. Chat callers that have to wait set a short-lived flag that
+# makes background embedding yield until chat is served.
+_ACQUIRE = """
+local now = tonumber(ARGV[1])
+local is_embed = ARGV[8] == '1'
+if is_embed and redis.call('EXISTS', KEYS[3]) == 1 then
+    return tonumber(ARGV[9])
+end
+local wait = 0
+local levels = {}
+for i = 1, 2 do
+    local capacity = tonumber(ARGV[2 * i])
+    local rate = tonumber(ARGV[2 * i + 1])
+    local cost = tonumber(ARGV[5 + i])
+    if capacity > 0 then
+        cost = math.min(cost, capacity)
+        local state = redis.call('HMGET', KEYS[i], 'level', 'ts')
+        local level = tonumber(state[1]) or capacity
+        local ts = tonumber(state[2]) or now
+        level = math.min(capacity, level + (now - ts) * rate)
+        levels[i] = level - cost
+        if level < cost then
+            wait = math.max(wait, math.ceil((cost - level) / rate))
+        end
+    end
+end
+if wait > 0 then
+    if not is_embed then
+        redis.call('SET', KEYS[3], 1, 'PX', wait + tonumber(ARGV[9]))
+    end
+    return wait
+end
+for i = 1, 2 do
+    if levels[i] then
+        redis.call('HSET', KEYS[i], 'level', levels[i], 'ts', now)
+        redis.call('PEXPIRE', KEYS[i], 120000)
+    end
+end
+return 0
+"""
+
+
+def _budget(kind: str) -> tuple[int, int]:
+    if kind == CHAT:
+        return settings.llm_chat_requests_per_minute, settings.llm_chat_tokens_per_minute
+    return settings.llm_embed_requests_per_minute, settings.llm_embed_tokens_per_minute
+
+
+class RateLimiter:
+    """Token buckets in Redis, shared by every API process and worker."""
+
+    def __init__(self, kind: str) -> None:
+        self.kind = kind
+        self.keys = [f"llm:bucket:{kind}:requests", f"llm:bucket:{kind}:tokens", "llm:chat-waiting"]
+
+    def try_acquire(self, tokens: int) -> float:
+        """Charge one request and ``tokens``; return seconds to wait first (0 = go)."""
+        requests_per_minute, tokens_per_minute = _budget(self.kind)
+        if not requests_per_minute and not tokens_per_minute:
+            return 0.0
+        try:
+            wait_ms = get_redis().eval(
+                _ACQUIRE,
+                3,
+                *self.keys,
+                int(time.time() * 1000),
+                requests_per_minute,
+                requests_per_minute / 60000,
+                tokens_per_minute,
+                tokens_per_minute / 60000,
+                1,
+                tokens,
+                "1" if self.kind == EMBED else "0",
+                settings.llm_chat_priority_ms,
+            )
+        except redis.RedisError:
+            logger.warning("Rate limiter unavailable; sending %s request unthrottled", self.kind, exc_info=True)
+            return 0.0
+        return int(wait_ms) / 1000
+
+
+class CircuitBreaker:
+    """Open after ``llm_circuit_failure_threshold`` consecutive failures for ``llm_circuit_open_seconds``."""
+
+    def __init__(self, kind: str) -> None:
+        self.kind = kind
+        self.failures_key = f"llm:circuit:{kind}:failures"
+        self.open_key = f"llm:circuit:{kind}:open"
+
+    def check(self) -> None:
+        try:
+            remaining_ms = get_redis().pttl(self.open_key)
+        except redis.RedisError:
+            return
+        if remaining_ms and remaining_ms > 0:
+            raise CircuitOpen(self.kind, remaining_ms / 1000)
+
+    def record_success(self) -> None:
+        try:
+            get_redis().delete(self.failures_key)
+        except redis.RedisError:
+            pass
+
+    def record_failure(self) -> None:
+        try:
+            client = get_redis()
+            failures = client.incr(self.failures_key)
+            client.expire(self.failures_key, settings.llm_circuit_open_seconds * 2)
+            if failures >= settings.llm_circuit_failure_threshold:
+                client.set(self.open_key, 1, ex=settings.llm_circuit_open_seconds)
+                client.delete(self.failures_key)
+                logger.warning(
+                    "Pausing LLM %s requests for %ss after %s failures",
+                    self.kind,
+                    settings.llm_circuit_open_seconds,
+                    failures,
+                )
+        except redis.RedisError:
+            pass
+
+
+def backoff_delay(attempt: int, retry_after: float | None = None) -> float:
+    if retry_after is not None:
+        return min(retry_after, settings.llm_retry_backoff_max)
+    delay = min(settings.llm_retry_backoff_max, settings.llm_retry_backoff_initial * (2**attempt))
+    return delay * random.uniform(0.5, 1.0)
+
+
+class ResilientProvider(LLMProvider):
+    """Wrap a provider with shared rate limits, retries and a circuit breaker per call kind."""
+
+    def __init__(self, inner: LLMProvider) -> None:
+        self.inner = inner
+        self.limiters = {kind: RateLimiter(kind) for kind in (EMBED, CHAT)}
+        self.breakers = {kind: CircuitBreaker(kind) for kind in (EMBED, CHAT)}
+
+    def _attempt_failed(self, kind: str, attempt: int, exc: ProviderUnavailable) -> float:
+        """Record the failure and return the delay before retrying, or re-raise."""
+        self.breakers[kind].record_failure()
+        if not exc.retryable or attempt >= settings.llm_max_retries:
+            raise exc
+        # Waiting longer in-process would hold a request or a worker; let the caller reschedule.
+        if exc.retry_after is not None and exc.retry_after > settings.llm_retry_backoff_max:
+            raise exc
+        delay = backoff_delay(attempt, exc.retry_after)
+        logger.info("LLM %s request failed; retry %s in %.1fs", kind, attempt + 1, delay)
+        return delay
+
+    def _call(self, kind: str, tokens: int, call: Callable[[], T]) -> T:
+        attempt = 0
+        while True:
+            self.breakers[kind].check()
+            wait = self.limiters[kind].try_acquire(tokens)
+            if wait:
+                time.sleep(wait)
+                continue
+            try:
+                result = call()
+            except ProviderUnavailable as exc:
+                time.sleep(self._attempt_failed(kind, attempt, exc))
+                attempt += 1
+                continue
+            self.breakers[kind].record_success()
+            return result
+
+    async def _acall(self, kind: str, tokens: int, call: Callable[[], Awaitable[T]]) -> T:
+        attempt = 0
+        while True:
+            self.breakers[kind].check()
+            wait = await asyncio.to_thread(self.limiters[kind].try_acquire, tokens)
+            if wait:
+                await asyncio.sleep(wait)
+                continue
+            try:
+                result = await call()
+            except ProviderUnavailable as exc:
+                await asyncio.sleep(self._attempt_failed(kind, attempt, exc))
+                attempt += 1
+                continue
+            self.breakers[kind].record_success()
+            return result
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        return self._call(EMBED, sum(estimate_tokens(text) for text in texts), lambda: self.inner.embed(texts))
+
+    def chat(self, prompt: str) -> str:
+        return self._call(CHAT, estimate_tokens(prompt), lambda: self.inner.chat(prompt))
+
+    async def aembed(self, texts: List[str]) -> List[List[float]]:
+        return await self._acall(EMBED, sum(estimate_tokens(text) for text in texts), lambda: self.inner.aembed(texts))
+
+    async def achat(self, prompt: str) -> str:
+        return await self._acall(CHAT, estimate_tokens(prompt), lambda: self.inner.achat(prompt))
+
+    async def astream_chat(self, prompt: str) -> AsyncIterator[str]:
+        # Same loop as _acall, but a stream can only be retried before its first piece.
+        attempt = 0
+        while True:
+            self.breakers[CHAT].check()
+            wait = await asyncio.to_thread(self.limiters[CHAT].try_acquire, estimate_tokens(prompt))
+            if wait:
+                await asyncio.sleep(wait)
+                continue
+            started = False
+            try:
+                async for piece in self.inner.astream_chat(prompt):
+                    started = True
+                    yield piece
+            except ProviderUnavailable as exc:
+                if started:
+                    self.breakers[CHAT].record_failure()
+                    raise
+                await asyncio.sleep(self._attempt_failed(CHAT, attempt, exc))
+                attempt += 1
+                continue
+            self.breakers[CHAT].record_success()
+            return
+
+    def embedding_model_id(self) -> str:
+        return self.inner.embedding_model_id()
+
+    def chat_model_id(self) -> str:
+        return self.inner.chat_model_id()
+
+    def close(self) -> None:
+        self.inner.close()
+
+    async def aclose(self) -> None:
+        await self.inner.aclose()
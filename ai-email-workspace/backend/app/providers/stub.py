@@ -1,5 +1,7 @@
+import asyncio
 import hashlib
-from typing import List
+import re
+from typing import AsyncIterator, List
 
 from app.providers.base import LLMProvider
 
@@ -20,3 +22,15 @@ class LocalStubProvider(LLMProvider):
             "Stub response: This is a deterministic answer based on the prompt hash "
             f"{digest}. Please replace with a real provider in production."
         )
+
+    async def aembed(self, texts: List[str]) -> List[List[float]]:
+        return self.embed(texts)
+
+    async def achat(self, prompt: str) -> str:
+        return self.chat(prompt)
+
+    async def astream_chat(self, prompt: str) -> AsyncIterator[str]:
+        # Word by word, so clients exercise incremental rendering without a real model.
+        for piece in re.findall(r"\S+\s*", self.chat(prompt)):
+            await asyncio.sleep(0)
+            yield piece
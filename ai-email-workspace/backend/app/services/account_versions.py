@@ -0,0 +1,26 @@
+from __future__ import annotations
+
+from typing import Iterable
+
+from sqlalchemy import func, update
+from sqlalchemy.orm import Session
+
+from app.models.models import MailAccount
+
+
+def bump_account_versions(db: Session, account_ids: Iterable[int]) -> None:
+    """Mark the accounts' mail as changed, invalidating ETags handed out for it.
+
+    Call it in the transaction that makes the change. ``clock_timestamp()``
+    rather than ``now()``: the row lock makes a concurrent bump wait for
+    this one, so ``changed_at`` only ever moves forward.
+    """
+    account_ids = sorted(set(account_ids))
+    if not account_ids:
+        return
+    db.execute(
+        update(MailAccount)
+        .where(MailAccount.id.in_(account_ids))
+        .values(change_counter=MailAccount.change_counter + 1, changed_at=func.clock_timestamp()),
+        execution_options={"synchronize_session": False},
+    )
@@ -1,13 +1,24 @@
 from __future__ import annotations
 
+import asyncio
+import logging
 import re
+from dataclasses import dataclass
 from datetime import datetime
-from typing import List, Tuple
+from typing import AsyncIterator, Dict, Iterable, List, Tuple
 
+from sqlalchemy import func, text
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from app.models.models import Embedding, Message
+from app.core.config import settings
+from app.models.models import SEARCH_CONFIG, Embedding, Message, Thread
+from app.providers.base import ProviderUnavailable
 from app.providers.factory import get_provider
+from app.services.context_packer import pack_context, source_header
+from app.services.query_cache import query_cache
+
+logger = logging.getLogger(__name__)
 
 FILTER_RE = re.compile(r"(from|to|subject|before|after):([^\s]+)")
 
@@ -40,6 +51,141 @@ def _apply_filters(query, filters: dict[str, str]):
     return query
 
 
+def set_vector_search_params(db: Session, top_k: int) -> None:
+    """Tune ANN recall for the current transaction (HNSW or ivfflat, whichever the index is).
+
+    With iterative scans enabled (pgvector 0.8+), a selective filter keeps
+    the index scan going until ``top_k`` rows pass instead of returning fewer.
+    """
+    db.execute(
+        text(
+            "SELECT set_config('hnsw.ef_search', :ef_search, true), "
+            "set_config('ivfflat.probes', :probes, true), "
+            "set_config('hnsw.iterative_scan', :iterative_scan, true), "
+            "set_config('ivfflat.iterative_scan', :ivfflat_iterative_scan, true)"
+        ),
+        {
+            "ef_search": str(max(settings.hnsw_ef_search, top_k)),
+            "probes": str(settings.ivfflat_probes),
+            "iterative_scan": settings.hnsw_iterative_scan,
+            # ivfflat only supports relaxed ordering.
+            "ivfflat_iterative_scan": "off" if settings.hnsw_iterative_scan == "off" else "relaxed_order",
+        },
+    )
+
+
+def reciprocal_rank_fusion(rankings: Iterable[List[int]], k: int | None = None) -> List[int]:
+    """Merge ranked id lists, scoring each id by the sum of 1 / (k + rank)."""
+    k = settings.rrf_k if k is None else k
+    scores: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=lambda item: scores[item], reverse=True)
+
+
+def _lexical_ids(base_query, clean_query: str, limit: int) -> List[int]:
+    tsquery = func.websearch_to_tsquery(SEARCH_CONFIG, clean_query)
+    # Chunk matches ranked by density, with a boost when the subject or sender matches too.
+    rank = func.ts_rank_cd(Embedding.search_vector, tsquery) + func.ts_rank(Message.search_vector, tsquery)
+    rows = (
+        base_query.with_entities(Embedding.id)
+        .filter(Embedding.search_vector.op("@@")(tsquery))
+        .order_by(rank.desc())
+        .limit(limit)
+        .all()
+    )
+    return [row.id for row in rows]
+
+
+def _candidate_threads(db: Session, account_id: int, query_vector: List[float], limit: int) -> List[int]:
+    rows = (
+        db.query(Thread.id)
+        .filter(Thread.account_id == account_id, Thread.centroid.isnot(None))
+        .order_by(Thread.centroid.cosine_distance(query_vector))
+        .limit(limit)
+        .all()
+    )
+    return [row.id for row in rows]
+
+
+def _vector_ids(base_query, query_vector: List[float], limit: int) -> List[int]:
+    rows = (
+        base_query.with_entities(Embedding.id)
+        .order_by(Embedding.vector.cosine_distance(query_vector))
+        .limit(limit)
+        .all()
+    )
+    return [row.id for row in rows]
+
+
+def _load_results(db: Session, account_id: int, ids: List[int]) -> List[Tuple[Embedding, Message]]:
+    if not ids:
+        return []
+    rows = (
+        db.query(Embedding, Message)
+        .join(Message, Embedding.message_id == Message.id)
+        .filter(Embedding.account_id == account_id, Embedding.id.in_(ids))
+        .all()
+    )
+    order = {item: position for position, item in enumerate(ids)}
+    return sorted(rows, key=lambda row: order[row[0].id])
+
+
+def _best_chunk_per_message(results: List[Tuple[Embedding, Message]]) -> List[Tuple[Embedding, Message]]:
+    seen = set()
+    unique = []
+    for embedding, message in results:
+        if message.id not in seen:
+            seen.add(message.id)
+            unique.append((embedding, message))
+    return unique
+
+
+def _split_query(query: str, selected_thread_id: int | None) -> tuple[str, dict[str, str]]:
+    # Inside a selected thread the whole question is search text.
+    return (query, {}) if selected_thread_id else _parse_filters(query)
+
+
+def _embedding_unavailable(clean_query: str, exc: ProviderUnavailable) -> None:
+    if not clean_query:
+        raise exc
+    logger.warning("Embedding provider unavailable; answering from full-text matches only", exc_info=True)
+
+
+def search_chunks(
+    db: Session,
+    account_id: int,
+    clean_query: str,
+    filters: dict[str, str],
+    selected_thread_id: int | None,
+    query_vector: List[float] | None,
+    top_k: int,
+) -> List[Tuple[Embedding, Message]]:
+    """The database half of retrieval; ``query_vector`` None means full-text only."""
+    base_query = db.query(Embedding, Message).join(Message, Embedding.message_id == Message.id)
+    # Filtering on the partition key prunes the search to this account's partition.
+    base_query = base_query.filter(Embedding.account_id == account_id, Message.account_id == account_id)
+    if selected_thread_id:
+        base_query = base_query.filter(Message.thread_id == selected_thread_id)
+    base_query = _apply_filters(base_query, filters)
+    candidates = max(top_k, settings.hybrid_candidates)
+    rankings = []
+    if clean_query:
+        rankings.append(_lexical_ids(base_query, clean_query, candidates))
+    if query_vector is not None:
+        set_vector_search_params(db, candidates)
+        vector_query = base_query
+        if not selected_thread_id and not filters and settings.retrieval_thread_candidates:
+            thread_ids = _candidate_threads(db, account_id, query_vector, settings.retrieval_thread_candidates)
+            # No centroids yet (before the backfill) means a flat search.
+            if thread_ids:
+                vector_query = base_query.filter(Message.thread_id.in_(thread_ids))
+        rankings.append(_vector_ids(vector_query, query_vector, candidates))
+    fused = reciprocal_rank_fusion(rankings)[:candidates]
+    return _best_chunk_per_message(_load_results(db, account_id, fused))[:top_k]
+
+
 def retrieve_context(
     db: Session,
     account_id: int,
@@ -47,27 +193,47 @@ def retrieve_context(
     selected_thread_id: int | None = None,
     top_k: int = 8,
 ) -> List[Tuple[Embedding, Message]]:
-    base_query = db.query(Embedding, Message).join(Message, Embedding.message_id == Message.id)
-    base_query = base_query.filter(Message.account_id == account_id)
-    if selected_thread_id:
-        base_query = base_query.filter(Message.thread_id == selected_thread_id)
-        clean_query = query
-    else:
-        clean_query, filters = _parse_filters(query)
-        base_query = _apply_filters(base_query, filters)
-    provider = get_provider()
-    query_vector = provider.embed([clean_query])[0]
-    return (
-        base_query.order_by(Embedding.vector.cosine_distance(query_vector))
-        .limit(top_k)
-        .all()
+    """Return the best chunks of up to ``top_k`` messages, fusing full-text and vector rankings.
+
+    Unless the search is already narrowed to a thread or by filters, the
+    vector ranking first picks the threads whose centroids are closest and
+    then ranks only their chunks. When the embedding provider is unavailable
+    the full-text ranking is used on its own, so exact-term questions still
+    find their messages.
+    """
+    clean_query, filters = _split_query(query, selected_thread_id)
+    query_vector = None
+    try:
+        query_vector = query_cache.query_embedding(get_provider(), clean_query)
+    except ProviderUnavailable as exc:
+        _embedding_unavailable(clean_query, exc)
+    return search_chunks(db, account_id, clean_query, filters, selected_thread_id, query_vector, top_k)
+
+
+async def aretrieve_context(
+    db: AsyncSession,
+    account_id: int,
+    query: str,
+    selected_thread_id: int | None = None,
+    top_k: int = 8,
+) -> List[Tuple[Embedding, Message]]:
+    """``retrieve_context`` for async routes: the query is embedded with ``aembed``."""
+    clean_query, filters = _split_query(query, selected_thread_id)
+    query_vector = None
+    try:
+        query_vector = await query_cache.aquery_embedding(get_provider(), clean_query)
+    except ProviderUnavailable as exc:
+        _embedding_unavailable(clean_query, exc)
+    return await db.run_sync(
+        search_chunks, account_id, clean_query, filters, selected_thread_id, query_vector, top_k
     )
 
 
 def build_prompt(query: str, results: List[Tuple[Embedding, Message]]) -> tuple[str, List[dict]]:
     citations = []
     context_parts = []
-    for embedding, message in results:
+    for chunk in pack_context(results):
+        message = chunk.message
         citations.append(
             {
                 "message_id": message.id,
@@ -76,14 +242,7 @@ def build_prompt(query: str, results: List[Tuple[Embedding, Message]]) -> tuple[
                 "subject": message.subject,
             }
         )
-        context_parts.append(
-            "\n".join(
-                [
-                    f"[Message {message.id} | {message.sent_at} | From: {message.from_email} | Subject: {message.subject}]",
-                    embedding.content[:800],
-                ]
-            )
-        )
+        context_parts.append(f"{source_header(message)}\n{chunk.text}")
     context = "\n\n".join(context_parts)
     prompt = (
         "Answer the question using only the context below. "
@@ -94,8 +253,63 @@ def build_prompt(query: str, results: List[Tuple[Embedding, Message]]) -> tuple[
 
 
 def answer_question(db: Session, account_id: int, query: str, selected_thread_id: int | None = None):
-    results = retrieve_context(db, account_id, query, selected_thread_id)
+    results = retrieve_context(db, account_id, query, selected_thread_id, top_k=settings.chat_context_candidates)
     provider = get_provider()
     prompt, citations = build_prompt(query, results)
-    answer = provider.chat(prompt)
-    return answer, citations
+    return query_cache.answer(
+        provider,
+        query,
+        [embedding.id for embedding, _ in results],
+        lambda: (provider.chat(prompt), citations),
+    )
+
+
+async def aanswer_question(
+    db: AsyncSession, account_id: int, query: str, selected_thread_id: int | None = None
+) -> tuple[str, List[dict]]:
+    results = await aretrieve_context(
+        db, account_id, query, selected_thread_id, top_k=settings.chat_context_candidates
+    )
+    provider = get_provider()
+    prompt, citations = build_prompt(query, results)
+
+    async def compute() -> tuple[str, List[dict]]:
+        return await provider.achat(prompt), citations
+
+    return await query_cache.aanswer(provider, query, [embedding.id for embedding, _ in results], compute)
+
+
+@dataclass
+class PreparedAnswer:
+    query: str
+    prompt: str
+    citations: List[dict]
+    context_ids: List[int]
+    cached: str | None = None
+
+
+async def prepare_answer(
+    db: AsyncSession, account_id: int, query: str, selected_thread_id: int | None = None
+) -> PreparedAnswer:
+    """Retrieve context and look up a cached answer before streaming starts."""
+    results = await aretrieve_context(
+        db, account_id, query, selected_thread_id, top_k=settings.chat_context_candidates
+    )
+    prompt, citations = build_prompt(query, results)
+    context_ids = [embedding.id for embedding, _ in results]
+    cached = await asyncio.to_thread(query_cache.cached_answer, get_provider(), query, context_ids)
+    return PreparedAnswer(query, prompt, citations, context_ids, cached)
+
+
+async def stream_answer(prepared: PreparedAnswer) -> AsyncIterator[str]:
+    if prepared.cached is not None:
+        yield prepared.cached
+        return
+    provider = get_provider()
+    pieces = []
+    async for piece in provider.astream_chat(prepared.prompt):
+        pieces.append(piece)
+        yield piece
+    await asyncio.to_thread(
+        query_cache.store_answer, provider, prepared.query, prepared.context_ids, "".join(pieces), prepared.citations
+    )
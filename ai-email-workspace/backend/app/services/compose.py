@@ -1,28 +1,30 @@
 from __future__ import annotations
 
 import smtplib
-from email.message import EmailMessage
-from typing import List
-
 from datetime import datetime, timezone
+from email.message import EmailMessage
+from typing import AsyncIterator, List
 
 from sqlalchemy.orm import Session
 
 from app.models.models import Folder, MailAccount, Message
 from app.providers.factory import get_provider
-from app.utils.threading import find_or_create_thread, update_thread_last_date
+from app.services.account_versions import bump_account_versions
+from app.utils.snippets import make_snippet
+from app.utils.threading import add_to_thread_aggregates, find_or_create_thread, message_aggregate_row
 
 
-def draft_email(to: List[str], subject_hint: str, instructions: str) -> tuple[str, str]:
-    provider = get_provider()
-    prompt = (
+def draft_prompt(to: List[str], subject_hint: str, instructions: str) -> str:
+    return (
         "Write a concise email draft.\n"
         f"To: {', '.join(to)}\n"
         f"Subject hint: {subject_hint}\n"
         f"Instructions: {instructions}\n"
         "Return a subject line and body separated by a blank line."
     )
-    response = provider.chat(prompt)
+
+
+def split_draft(response: str, subject_hint: str) -> tuple[str, str]:
     if "\n\n" in response:
         subject, body = response.split("\n\n", 1)
     else:
@@ -30,6 +32,21 @@ def draft_email(to: List[str], subject_hint: str, instructions: str) -> tuple[st
     return subject.strip(), body.strip()
 
 
+def draft_email(to: List[str], subject_hint: str, instructions: str) -> tuple[str, str]:
+    provider = get_provider()
+    return split_draft(provider.chat(draft_prompt(to, subject_hint, instructions)), subject_hint)
+
+
+async def adraft_email(to: List[str], subject_hint: str, instructions: str) -> tuple[str, str]:
+    provider = get_provider()
+    return split_draft(await provider.achat(draft_prompt(to, subject_hint, instructions)), subject_hint)
+
+
+async def stream_draft(to: List[str], subject_hint: str, instructions: str) -> AsyncIterator[str]:
+    async for piece in get_provider().astream_chat(draft_prompt(to, subject_hint, instructions)):
+        yield piece
+
+
 def send_email(
     db: Session,
     account_id: int,
@@ -78,10 +95,13 @@ def send_email(
         subject=subject,
         from_email=account.smtp_user,
         to_json=to,
+        snippet=make_snippet(body),
         body_text=body,
         sent_at=sent_at,
     )
-    update_thread_last_date(thread, message.sent_at)
     db.add(message)
+    db.flush()
+    add_to_thread_aggregates(db, [message_aggregate_row(message)])
+    bump_account_versions(db, [account_id])
     db.commit()
     return message
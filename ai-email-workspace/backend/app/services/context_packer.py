@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+import math
+import re
+from dataclasses import dataclass
+from typing import Dict, List, Sequence, Tuple
+
+from app.core.config import settings
+from app.models.models import Embedding, Message
+from app.utils.chunking import estimate_tokens, strip_embedding_header
+
+QUOTE_INTRO_RE = re.compile(r"^On .+ wrote:$")
+
+
+@dataclass
+class PackedChunk:
+    embedding: Embedding
+    message: Message
+    text: str
+
+
+def source_header(message: Message) -> str:
+    return f"[Message {message.id} | {message.sent_at} | From: {message.from_email} | Subject: {message.subject}]"
+
+
+def strip_quoted(text: str) -> str:
+    """Drop quoted reply lines; the messages they quote are retrieved on their own."""
+    lines = [line for line in text.splitlines() if not line.lstrip().startswith(">")]
+    while lines and (not lines[-1].strip() or QUOTE_INTRO_RE.match(lines[-1].strip())):
+        lines.pop()
+    return "\n".join(lines).strip()
+
+
+def _cosine(a: Sequence[float], b: Sequence[float], norm_a: float, norm_b: float) -> float:
+    if not norm_a or not norm_b:
+        return 0.0
+    return sum(x * y for x, y in zip(a, b)) / (norm_a * norm_b)
+
+
+def mmr_order(vectors: List[Sequence[float] | None], lambda_: float) -> List[int]:
+    """Order retrieved chunks by maximal marginal relevance.
+
+    ``vectors`` come in retrieval rank order, which stands in for relevance;
+    each pick trades that off against similarity to the chunks already picked.
+    """
+    count = len(vectors)
+    norms = [math.sqrt(sum(value * value for value in vector)) if vector is not None else 0.0 for vector in vectors]
+    relevance = [1.0 - index / count for index in range(count)]
+    redundancy = [0.0] * count
+    remaining = list(range(count))
+    order: List[int] = []
+    while remaining:
+        best = max(remaining, key=lambda index: lambda_ * relevance[index] - (1 - lambda_) * redundancy[index])
+        remaining.remove(best)
+        order.append(best)
+        if vectors[best] is None:
+            continue
+        for index in remaining:
+            if vectors[index] is not None:
+                similarity = _cosine(vectors[best], vectors[index], norms[best], norms[index])
+                redundancy[index] = max(redundancy[index], similarity)
+    return order
+
+
+def pack_context(
+    results: List[Tuple[Embedding, Message]],
+    token_budget: int | None = None,
+    max_per_thread: int | None = None,
+    lambda_: float | None = None,
+) -> List[PackedChunk]:
+    """Pick chunk bodies for the prompt until ``token_budget`` is spent.
+
+    Chunks are taken in MMR order, at most one per message and
+    ``max_per_thread`` per thread. The Subject/Date/From/To header built
+    into every chunk and quoted replies are stripped, since each excerpt
+    gets a one-line ``source_header`` instead, and repeated bodies are
+    skipped. The last chunk that fits is truncated rather than dropped.
+    """
+    token_budget = settings.chat_context_token_budget if token_budget is None else token_budget
+    max_per_thread = settings.chat_context_max_per_thread if max_per_thread is None else max_per_thread
+    lambda_ = settings.chat_context_mmr_lambda if lambda_ is None else lambda_
+
+    packed: List[PackedChunk] = []
+    seen_messages = set()
+    seen_bodies = set()
+    per_thread: Dict[int, int] = {}
+    remaining = token_budget
+    for index in mmr_order([embedding.vector for embedding, _ in results], lambda_):
+        embedding, message = results[index]
+        if message.id in seen_messages or per_thread.get(message.thread_id, 0) >= max_per_thread:
+            continue
+        text = strip_quoted(strip_embedding_header(embedding.content))
+        if not text or text in seen_bodies:
+            continue
+        header_tokens = estimate_tokens(source_header(message))
+        tokens = header_tokens + estimate_tokens(text)
+        if tokens > remaining:
+            room = remaining - header_tokens
+            # Too little room left to be worth a truncated excerpt.
+            if room < settings.chat_context_min_excerpt_tokens:
+                break
+            text = text[: room * 4].rstrip() + " …"
+            tokens = remaining
+        seen_messages.add(message.id)
+        seen_bodies.add(text)
+        per_thread[message.thread_id] = per_thread.get(message.thread_id, 0) + 1
+        packed.append(PackedChunk(embedding, message, text))
+        remaining -= tokens
+        if remaining <= 0:
+            break
+    return packed
@@ -1,18 +1,26 @@
-from sqlalchemy.orm import Session
+from __future__ import annotations
 
+import asyncio
+import logging
+from typing import Dict, Iterator, List, Sequence
+
+from sqlalchemy import insert
+from sqlalchemy.orm import Session, load_only
+
+from app.core.config import settings
 from app.core.db import SessionLocal
 from app.models.models import Embedding, Message
+from app.providers.base import LLMProvider
 from app.providers.factory import get_provider
-from app.utils.chunking import build_embedding_content, chunk_body
+from app.services.embedding_cache import content_hash, embedding_cache
+from app.utils.chunking import build_embedding_content, chunk_body, estimate_tokens
+from app.utils.threading import add_to_thread_centroids, recompute_thread_centroids
 
+logger = logging.getLogger(__name__)
 
-def embed_message_by_id(db: Session, message_id: int) -> int:
-    message = db.query(Message).filter(Message.id == message_id).first()
-    if not message:
-        return 0
-    provider = get_provider()
-    chunks = chunk_body(message.body_text or "")
-    content_list = [
+
+def message_contents(message: Message) -> List[str]:
+    return [
         build_embedding_content(
             message.subject,
             message.sent_at.isoformat() if message.sent_at else "",
@@ -20,22 +28,172 @@ def embed_message_by_id(db: Session, message_id: int) -> int:
             ", ".join(message.to_json or []),
             chunk,
         )
-        for chunk in chunks
+        for chunk in chunk_body(message.body_text or "")
     ]
-    vectors = provider.embed(content_list)
-    db.query(Embedding).filter(Embedding.message_id == message.id).delete()
-    for idx, (content, vector) in enumerate(zip(content_list, vectors)):
-        db.add(
-            Embedding(
-                message_id=message.id,
-                model=provider.__class__.__name__,
-                chunk_index=idx,
-                content=content,
-                vector=vector,
+
+
+def request_batches(texts: Sequence[str], max_items: int, max_tokens: int) -> Iterator[slice]:
+    """Split ``texts`` into consecutive provider requests within both budgets.
+
+    A single text over the token budget still gets a request of its own.
+    """
+    start = 0
+    tokens = 0
+    for index, text in enumerate(texts):
+        cost = estimate_tokens(text)
+        if index > start and (index - start >= max_items or tokens + cost > max_tokens):
+            yield slice(start, index)
+            start, tokens = index, 0
+        tokens += cost
+    if start < len(texts):
+        yield slice(start, len(texts))
+
+
+async def aembed_texts(
+    provider: LLMProvider,
+    texts: List[str],
+    concurrency: int | None = None,
+) -> List[List[float]]:
+    """Embed ``texts`` as concurrent sub-batch requests, returning vectors in input order.
+
+    At most ``concurrency`` (default ``embed_concurrency``) requests are in
+    flight at once.
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency or settings.embed_concurrency))
+
+    async def run(batch: slice) -> List[List[float]]:
+        async with semaphore:
+            return await provider.aembed(texts[batch])
+
+    batches = list(request_batches(texts, settings.embed_batch_max_items, settings.embed_batch_max_tokens))
+    results = await asyncio.gather(*(run(batch) for batch in batches))
+    return [vector for vectors in results for vector in vectors]
+
+
+def embed_texts(provider: LLMProvider, texts: List[str]) -> List[List[float]]:
+    batches = list(request_batches(texts, settings.embed_batch_max_items, settings.embed_batch_max_tokens))
+    if len(batches) > 1 and settings.embed_concurrency > 1 and not _in_event_loop():
+
+        async def run() -> List[List[float]]:
+            try:
+                return await aembed_texts(provider, texts)
+            finally:
+                await provider.aclose()
+
+        return asyncio.run(run())
+    vectors: List[List[float]] = []
+    for batch in batches:
+        vectors.extend(provider.embed(texts[batch]))
+    return vectors
+
+
+def _in_event_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+def embed_message_by_id(db: Session, message_id: int) -> int:
+    return embed_messages(db, [message_id])
+
+
+def embed_messages(db: Session, message_ids: List[int]) -> int:
+    """Embed many messages with as few provider requests as the budgets allow.
+
+    Only chunks that are new or whose content changed are written; their
+    vectors come from the embedding cache where possible, and the remaining
+    texts are packed into requests of at most ``embed_batch_max_items`` texts
+    and ``embed_batch_max_tokens`` estimated tokens. Stale rows go in one
+    DELETE and new ones in one multi-row INSERT. Returns the number of chunks
+    of the messages.
+    """
+    if not message_ids:
+        return 0
+    messages = (
+        db.query(Message)
+        .options(
+            load_only(
+                Message.id,
+                Message.account_id,
+                Message.thread_id,
+                Message.subject,
+                Message.sent_at,
+                Message.from_email,
+                Message.to_json,
+                Message.body_text,
             )
         )
+        .filter(Message.id.in_(message_ids))
+        .order_by(Message.id)
+        .all()
+    )
+    if not messages:
+        return 0
+    provider = get_provider()
+    model = provider.embedding_model_id()
+    account_ids = {message.id: message.account_id for message in messages}
+    thread_ids = {message.id: message.thread_id for message in messages}
+    wanted: Dict[tuple[int, int], tuple[str, str]] = {}
+    for message in messages:
+        for idx, content in enumerate(message_contents(message)):
+            wanted[(message.id, idx)] = (content, content_hash(content))
+    total = len(wanted)
+
+    stale: List[int] = []
+    stale_threads = set()
+    for row in (
+        db.query(Embedding.id, Embedding.message_id, Embedding.chunk_index, Embedding.model, Embedding.content_hash)
+        .filter(
+            Embedding.account_id.in_(set(account_ids.values())),
+            Embedding.message_id.in_(list(account_ids)),
+        )
+        .all()
+    ):
+        current = wanted.get((row.message_id, row.chunk_index))
+        if current and row.model == model and row.content_hash == current[1]:
+            del wanted[(row.message_id, row.chunk_index)]
+        else:
+            stale.append(row.id)
+            stale_threads.add(thread_ids[row.message_id])
+    if stale:
+        db.query(Embedding).filter(
+            Embedding.account_id.in_(set(account_ids.values())), Embedding.id.in_(stale)
+        ).delete(synchronize_session=False)
+    if wanted:
+        texts = [content for content, _ in wanted.values()]
+        vectors = embedding_cache.get_or_embed(db, model, texts, lambda missing: embed_texts(provider, missing))
+        db.execute(
+            insert(Embedding),
+            [
+                {
+                    "account_id": account_ids[message_id],
+                    "message_id": message_id,
+                    "model": model,
+                    "chunk_index": idx,
+                    "content": content,
+                    "content_hash": digest,
+                    "vector": vector,
+                }
+                for ((message_id, idx), (content, digest)), vector in zip(wanted.items(), vectors)
+            ],
+        )
+        # Threads that lost chunks are recomputed below; the rest take a running mean.
+        added: Dict[int, List[List[float]]] = {}
+        for (message_id, _), vector in zip(wanted, vectors):
+            if thread_ids[message_id] not in stale_threads:
+                added.setdefault(thread_ids[message_id], []).append(vector)
+        add_to_thread_centroids(db, added)
+    recompute_thread_centroids(db, stale_threads)
     db.commit()
-    return len(content_list)
+    logger.info(
+        "Embedded %s new or changed chunks for %s messages; embedding cache %s",
+        len(wanted),
+        len(messages),
+        embedding_cache.stats.as_dict(),
+    )
+    return total
 
 
 def embed_message_service(message_id: int) -> int:
@@ -49,3 +207,11 @@ def embed_message_service(message_id: int) -> int:
         return embed_message_by_id(db, message_id)
     finally:
         db.close()
+
+
+def embed_messages_service(message_ids: List[int]) -> int:
+    db = SessionLocal()
+    try:
+        return embed_messages(db, message_ids)
+    finally:
+        db.close()
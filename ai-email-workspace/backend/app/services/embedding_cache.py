@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Sequence
+
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.models import EmbeddingCacheEntry
+
+Vector = List[float]
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class CacheStats:
+    memory_hits: int = 0
+    db_hits: int = 0
+    misses: int = 0
+
+    @property
+    def lookups(self) -> int:
+        return self.memory_hits + self.db_hits + self.misses
+
+    @property
+    def hit_rate(self) -> float:
+        return (self.memory_hits + self.db_hits) / self.lookups if self.lookups else 0.0
+
+    def as_dict(self) -> Dict[str, float]:
+        return {
+            "memory_hits": self.memory_hits,
+            "db_hits": self.db_hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hit_rate, 4),
+        }
+
+
+class EmbeddingCache:
+    """Embeddings keyed by (model, sha256(content)).
+
+    Postgres (``embedding_cache``) is the shared store; a per-process LRU of
+    ``embedding_cache_lru_size`` entries sits in front of it (0 disables it).
+    """
+
+    def __init__(self, lru_size: int | None = None) -> None:
+        self.lru_size = settings.embedding_cache_lru_size if lru_size is None else lru_size
+        self._lru: OrderedDict[tuple[str, str], Vector] = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = CacheStats()
+
+    def _lru_get(self, key: tuple[str, str]) -> Vector | None:
+        with self._lock:
+            vector = self._lru.get(key)
+            if vector is not None:
+                self._lru.move_to_end(key)
+            return vector
+
+    def _lru_put(self, key: tuple[str, str], vector: Vector) -> None:
+        if self.lru_size <= 0:
+            return
+        with self._lock:
+            self._lru[key] = vector
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.lru_size:
+                self._lru.popitem(last=False)
+
+    def get_or_embed(
+        self,
+        db: Session,
+        model: str,
+        texts: Sequence[str],
+        embed: Callable[[List[str]], List[Vector]],
+    ) -> List[Vector]:
+        """Return a vector per text, calling ``embed`` once for the distinct misses."""
+        hashes = [content_hash(text) for text in texts]
+        found: Dict[str, Vector] = {}
+        for digest in set(hashes):
+            vector = self._lru_get((model, digest))
+            if vector is not None:
+                found[digest] = vector
+        memory_hits = len(found)
+        lookup = [digest for digest in set(hashes) if digest not in found]
+        if lookup:
+            rows = (
+                db.query(EmbeddingCacheEntry.content_hash, EmbeddingCacheEntry.vector)
+                .filter(EmbeddingCacheEntry.model == model, EmbeddingCacheEntry.content_hash.in_(lookup))
+                .all()
+            )
+            for row in rows:
+                found[row.content_hash] = [float(value) for value in row.vector]
+                self._lru_put((model, row.content_hash), found[row.content_hash])
+        db_hits = len(found) - memory_hits
+
+        missing: Dict[str, str] = {}
+        for digest, text in zip(hashes, texts):
+            if digest not in found:
+                missing.setdefault(digest, text)
+        if missing:
+            vectors = embed(list(missing.values()))
+            fresh = dict(zip(missing, vectors))
+            db.execute(
+                insert(EmbeddingCacheEntry).on_conflict_do_nothing(),
+                [{"model": model, "content_hash": digest, "vector": vector} for digest, vector in fresh.items()],
+            )
+            for digest, vector in fresh.items():
+                found[digest] = vector
+                self._lru_put((model, digest), vector)
+
+        with self._lock:
+            self.stats.memory_hits += memory_hits
+            self.stats.db_hits += db_hits
+            self.stats.misses += len(missing)
+        return [found[digest] for digest in hashes]
+
+
+embedding_cache = EmbeddingCache()
@@ -0,0 +1,222 @@
+from __future__ import annotations
+
+import email
+from typing import Any, Dict, Iterable, Iterator, List
+
+from imapclient import IMAPClient
+from sqlalchemy import func, update
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.models import Embedding, Folder, Message
+from app.services.account_versions import bump_account_versions
+from app.utils.threading import refresh_threads
+
+MESSAGE_ID_FIELD = b"BODY[HEADER.FIELDS (MESSAGE-ID)]"
+
+
+def uid_batches(uids: List[int], batch_size: int) -> Iterator[List[int]]:
+    ordered = sorted(uids)
+    for start in range(0, len(ordered), batch_size):
+        yield ordered[start : start + batch_size]
+
+
+def decode_flags(flags: Iterable[Any]) -> List[str]:
+    return sorted(flag.decode() if isinstance(flag, bytes) else str(flag) for flag in flags)
+
+
+def count_known_uids(db: Session, folder: Folder) -> int:
+    return (
+        db.query(func.count(Message.id))
+        .filter(Message.folder_id == folder.id, Message.imap_uid.isnot(None))
+        .scalar()
+        or 0
+    )
+
+
+def count_missing_uids(db: Session, folder: Folder) -> int:
+    return (
+        db.query(func.count(Message.id))
+        .filter(Message.folder_id == folder.id, Message.imap_uid.is_(None))
+        .scalar()
+        or 0
+    )
+
+
+def delete_messages(db: Session, message_ids: List[int]) -> None:
+    """Delete messages with their embeddings and fix up the threads they leave."""
+    if not message_ids:
+        return
+    rows = db.query(Message.account_id, Message.thread_id).filter(Message.id.in_(message_ids)).distinct().all()
+    db.query(Embedding).filter(Embedding.message_id.in_(message_ids)).delete(synchronize_session=False)
+    db.query(Message).filter(Message.id.in_(message_ids)).delete(synchronize_session=False)
+    refresh_threads(db, [row.thread_id for row in rows])
+    bump_account_versions(db, [row.account_id for row in rows])
+
+
+def _stored_uid_pages(db: Session, folder: Folder, batch_size: int) -> Iterator[List[int]]:
+    after = 0
+    while True:
+        uids = [
+            row.imap_uid
+            for row in db.query(Message.imap_uid)
+            .filter(Message.folder_id == folder.id, Message.imap_uid > after)
+            .order_by(Message.imap_uid)
+            .limit(batch_size)
+            .all()
+        ]
+        if not uids:
+            return
+        yield uids
+        after = uids[-1]
+
+
+def _apply_flags(db: Session, folder: Folder, fetched: Dict[int, Dict[bytes, Any]]) -> int:
+    if not fetched:
+        return 0
+    flags_by_uid = {uid: decode_flags(data.get(b"FLAGS", ())) for uid, data in fetched.items()}
+    rows = (
+        db.query(Message.id, Message.imap_uid, Message.flags_json)
+        .filter(Message.folder_id == folder.id, Message.imap_uid.in_(list(flags_by_uid)))
+        .all()
+    )
+    changes = [
+        {"id": row.id, "flags_json": flags_by_uid[row.imap_uid]}
+        for row in rows
+        if (row.flags_json or []) != flags_by_uid[row.imap_uid]
+    ]
+    if changes:
+        db.execute(update(Message), changes)
+    return len(changes)
+
+
+def sync_flag_changes(
+    db: Session,
+    client: IMAPClient,
+    folder: Folder,
+    highestmodseq: int | None,
+    batch_size: int | None = None,
+) -> int:
+    """Copy flag changes of already-ingested messages into ``flags_json``.
+
+    With CONDSTORE only messages changed since the stored HIGHESTMODSEQ are
+    returned; without it the fallback fetches FLAGS alone, never bodies, for
+    the stored UIDs one page at a time.
+    """
+    if not folder.last_uid:
+        return 0
+    if highestmodseq is not None and folder.highestmodseq:
+        if highestmodseq == folder.highestmodseq:
+            return 0
+        fetched = client.fetch(
+            f"1:{folder.last_uid}", [b"FLAGS"], modifiers=[f"CHANGEDSINCE {folder.highestmodseq}"]
+        )
+        return _apply_flags(db, folder, fetched)
+    if not settings.ingest_flag_sync_fallback:
+        return 0
+    changed = 0
+    for uids in _stored_uid_pages(db, folder, batch_size or settings.ingest_batch_size):
+        changed += _apply_flags(db, folder, client.fetch(uids, [b"FLAGS"]))
+    return changed
+
+
+def reconcile_expunged(db: Session, client: IMAPClient, folder: Folder) -> int:
+    """Delete ingested messages whose UID no longer exists on the server."""
+    server_uids = set(client.search(["ALL"]))
+    rows = (
+        db.query(Message.id, Message.imap_uid)
+        .filter(Message.folder_id == folder.id, Message.imap_uid.isnot(None))
+        .all()
+    )
+    vanished = [row.id for row in rows if row.imap_uid not in server_uids]
+    delete_messages(db, vanished)
+    return len(vanished)
+
+
+def _match_missing_uids(db: Session, client: IMAPClient, folder: Folder, uids: List[int], batch_size: int) -> int | None:
+    """Give stored rows without a UID the UID of the server message with their Message-ID.
+
+    Server messages are read in pages of ``batch_size`` and only their
+    Message-ID header is fetched. Returns the lowest server UID no stored row
+    matched, or None when every server message matched.
+    """
+    first_unmatched = None
+    for batch in uid_batches(uids, batch_size):
+        fetched = client.fetch(batch, [b"BODY.PEEK[HEADER.FIELDS (MESSAGE-ID)]"])
+        uid_by_message_id = {}
+        for uid, data in fetched.items():
+            message_id = email.message_from_bytes(data.get(MESSAGE_ID_FIELD) or b"").get("Message-ID")
+            if message_id:
+                uid_by_message_id.setdefault(message_id.strip(), uid)
+        rows = (
+            db.query(Message.id, Message.message_id_header)
+            .filter(
+                Message.folder_id == folder.id,
+                Message.imap_uid.is_(None),
+                Message.message_id_header.in_(list(uid_by_message_id)),
+            )
+            .all()
+            if uid_by_message_id
+            else []
+        )
+        matched = []
+        for row in rows:
+            uid = uid_by_message_id.pop((row.message_id_header or "").strip(), None)
+            if uid is not None:
+                matched.append({"id": row.id, "imap_uid": uid})
+        if matched:
+            db.execute(update(Message), matched)
+        matched_uids = {item["imap_uid"] for item in matched}
+        unmatched = [uid for uid in batch if uid not in matched_uids]
+        if unmatched and first_unmatched is None:
+            first_unmatched = min(unmatched)
+    return first_unmatched
+
+
+def _delete_rows_without_uid(db: Session, folder: Folder) -> int:
+    vanished = [
+        row.id
+        for row in db.query(Message.id).filter(Message.folder_id == folder.id, Message.imap_uid.is_(None)).all()
+    ]
+    delete_messages(db, vanished)
+    return len(vanished)
+
+
+def backfill_missing_uids(db: Session, client: IMAPClient, folder: Folder, batch_size: int) -> int:
+    """Attach UIDs to rows stored before UIDs were tracked, once per folder.
+
+    Rows whose Message-ID is no longer on the server are deleted, so the
+    EXISTS check compares like with like afterwards. Returns how many rows
+    were missing a UID.
+    """
+    missing = count_missing_uids(db, folder)
+    if not missing or not folder.last_uid:
+        return 0
+    uids = [uid for uid in client.search(["UID", f"1:{folder.last_uid}"]) if uid <= folder.last_uid]
+    _match_missing_uids(db, client, folder, uids, batch_size)
+    _delete_rows_without_uid(db, folder)
+    return missing
+
+
+def remap_uidvalidity(db: Session, client: IMAPClient, folder: Folder, batch_size: int) -> None:
+    """Re-attach stored messages to new UIDs after a UIDVALIDITY reset.
+
+    Stored UIDs are cleared and rematched by Message-ID in pages of
+    ``batch_size`` server messages; stored messages keep their rows, so only
+    messages that could not be matched are downloaded again by the normal
+    ingest pass. Rows left without a match are deleted.
+    """
+    db.execute(
+        update(Message).where(Message.folder_id == folder.id).values(imap_uid=None),
+        execution_options={"synchronize_session": False},
+    )
+    uids = client.search(["ALL"])
+    first_unmatched = _match_missing_uids(db, client, folder, uids, batch_size)
+    _delete_rows_without_uid(db, folder)
+    # Resume below the first unmatched UID; matched UIDs above it are skipped
+    # by the ingest pass because their rows already carry the new UID.
+    if first_unmatched is not None:
+        folder.last_uid = first_unmatched - 1
+    else:
+        folder.last_uid = max(uids, default=0)
+    folder.highestmodseq = None
@@ -0,0 +1,232 @@
+from __future__ import annotations
+
+import logging
+import random
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List
+
+from imapclient import IMAPClient
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.models import Folder, MailAccount
+from app.services.locks import AccountConnectionSlots, mark_ingest_pending
+
+logger = logging.getLogger(__name__)
+
+ClientFactory = Callable[[MailAccount], IMAPClient]
+NewMailCallback = Callable[[int, int], None]
+
+
+def _default_client_factory(account: MailAccount) -> IMAPClient:
+    return IMAPClient(account.imap_host, timeout=settings.idle_check_timeout * 2)
+
+
+def _queue_folder_ingest(account_id: int, folder_id: int) -> None:
+    """Queue a folder sync unless one is already queued and not yet started."""
+    # Local import to avoid services importing Celery tasks at module import time.
+    from app.tasks.jobs import ingest_folders
+
+    if mark_ingest_pending(folder_id):
+        ingest_folders.delay(account_id, [folder_id])
+
+
+def idle_slot_limit() -> int:
+    """Connection slots IDLE may hold per account; the reserved rest stay free for ingest."""
+    return max(0, settings.ingest_max_connections_per_account - settings.idle_reserved_ingest_connections)
+
+
+def _has_new_mail(responses: list) -> bool:
+    return any(len(item) > 1 and item[1] in (b"EXISTS", b"RECENT") for item in responses)
+
+
+class FolderWatcher:
+    """Hold an IMAP IDLE session on one folder and report new mail.
+
+    A catch-up ingest is requested on every (re)connect, since mail may have
+    arrived while the connection was down. The connection holds one of the
+    account's connection slots, shared with ingest tasks, but never one of
+    the ``idle_reserved_ingest_connections`` kept for ingest. Failures reconnect
+    with jittered exponential backoff until ``stop()`` is called; the backoff
+    only resets once a session has stayed up for ``idle_stable_seconds``.
+    """
+
+    def __init__(
+        self,
+        account: MailAccount,
+        folder: Folder,
+        on_new_mail: NewMailCallback,
+        client_factory: ClientFactory = _default_client_factory,
+        stop_event: threading.Event | None = None,
+    ) -> None:
+        self.account = account
+        self.folder_id = folder.id
+        self.folder_name = folder.name
+        self.on_new_mail = on_new_mail
+        self.client_factory = client_factory
+        self.stop_event = stop_event or threading.Event()
+        self._established_at: float | None = None
+
+    def stop(self) -> None:
+        self.stop_event.set()
+
+    def _backoff(self, attempt: int) -> float:
+        delay = min(settings.idle_backoff_max, settings.idle_backoff_initial * (2**attempt))
+        return delay * random.uniform(0.5, 1.0)
+
+    def _notify(self) -> None:
+        try:
+            self.on_new_mail(self.account.id, self.folder_id)
+        except Exception:
+            logger.exception("Failed to queue ingest for folder %s", self.folder_id)
+
+    def _idle_session(self, client: IMAPClient, heartbeat: Callable[[], None]) -> None:
+        client.login(self.account.imap_user, self.account.imap_password)
+        client.select_folder(self.folder_name, readonly=True)
+        self._notify()
+        while not self.stop_event.is_set():
+            client.idle()
+            if self._established_at is None:
+                self._established_at = time.monotonic()
+            # Servers drop IDLE after 30 minutes, so re-issue it periodically.
+            renew_at = time.monotonic() + settings.idle_renew_seconds
+            new_mail = False
+            try:
+                while not self.stop_event.is_set() and time.monotonic() < renew_at:
+                    if _has_new_mail(client.idle_check(timeout=settings.idle_check_timeout)):
+                        new_mail = True
+                        break
+                    heartbeat()
+            finally:
+                _, responses = client.idle_done()
+            if new_mail or _has_new_mail(responses):
+                self._notify()
+
+    def _was_stable(self) -> bool:
+        return (
+            self._established_at is not None
+            and time.monotonic() - self._established_at >= settings.idle_stable_seconds
+        )
+
+    def _connect_and_idle(self) -> bool:
+        """Run one session; return False if no connection slot was free."""
+        slots = AccountConnectionSlots(self.account.id, limit=idle_slot_limit())
+        token = slots.acquire()
+        if token is None:
+            return False
+        try:
+            client = self.client_factory(self.account)
+            try:
+                self._idle_session(client, lambda: slots.refresh(token))
+            finally:
+                try:
+                    client.logout()
+                except Exception:
+                    pass
+        finally:
+            slots.release(token)
+        return True
+
+    def run(self) -> None:
+        attempt = 0
+        while not self.stop_event.is_set():
+            self._established_at = None
+            try:
+                if not self._connect_and_idle():
+                    logger.info(
+                        "No free IMAP connection slot for account %s; IDLE on %s waits",
+                        self.account.id,
+                        self.folder_name,
+                    )
+                    self.stop_event.wait(settings.ingest_slot_retry_seconds)
+            except Exception:
+                if self._was_stable():
+                    attempt = 0
+                delay = self._backoff(attempt)
+                attempt += 1
+                logger.warning(
+                    "IDLE connection for account %s folder %s failed; retrying in %.1fs",
+                    self.account.id,
+                    self.folder_name,
+                    delay,
+                    exc_info=True,
+                )
+                self.stop_event.wait(delay)
+
+
+def _parse_ids(value: str) -> List[int]:
+    return [int(item) for item in value.split(",") if item.strip()]
+
+
+def load_watched_folders(db: Session) -> List[tuple[MailAccount, Folder]]:
+    query = db.query(MailAccount)
+    account_ids = _parse_ids(settings.idle_account_ids)
+    if account_ids:
+        query = query.filter(MailAccount.id.in_(account_ids))
+    names = [name.strip() for name in settings.idle_folders.split(",") if name.strip()]
+    watched: List[tuple[MailAccount, Folder]] = []
+    for account in query.all():
+        folders = (
+            db.query(Folder)
+            .filter(Folder.account_id == account.id, Folder.name.in_(names))
+            .all()
+        )
+        if not folders:
+            logger.warning("Account %s has none of the IDLE folders %s yet; run an ingest first", account.id, names)
+        watched.extend((account, folder) for folder in folders)
+    return watched
+
+
+class TooManyWatchers(RuntimeError):
+    pass
+
+
+class IdleListener:
+    """Run one IDLE watcher thread per watched folder, up to ``idle_max_connections``.
+
+    A listener refuses to start with more folders than that; split accounts
+    across listener processes with ``IDLE_ACCOUNT_IDS`` instead.
+    """
+
+    def __init__(
+        self,
+        watched: List[tuple[MailAccount, Folder]],
+        on_new_mail: NewMailCallback = _queue_folder_ingest,
+        client_factory: ClientFactory = _default_client_factory,
+    ) -> None:
+        self.stop_event = threading.Event()
+        self.watchers = [
+            FolderWatcher(account, folder, on_new_mail, client_factory, self.stop_event)
+            for account, folder in watched
+        ]
+        self._executor: ThreadPoolExecutor | None = None
+
+    def start(self) -> None:
+        if not self.watchers:
+            return
+        if len(self.watchers) > settings.idle_max_connections:
+            raise TooManyWatchers(
+                f"{len(self.watchers)} folders to watch but IDLE_MAX_CONNECTIONS is "
+                f"{settings.idle_max_connections}; raise it or split accounts with IDLE_ACCOUNT_IDS"
+            )
+        per_account = Counter(watcher.account.id for watcher in self.watchers)
+        for account_id, count in sorted(per_account.items()):
+            if count > idle_slot_limit():
+                logger.warning(
+                    "Account %s has %s IDLE folders but only %s connection slots for IDLE; the rest wait",
+                    account_id,
+                    count,
+                    idle_slot_limit(),
+                )
+        self._executor = ThreadPoolExecutor(max_workers=len(self.watchers), thread_name_prefix="imap-idle")
+        for watcher in self.watchers:
+            self._executor.submit(watcher.run)
+
+    def stop(self) -> None:
+        self.stop_event.set()
+        if self._executor:
+            self._executor.shutdown(wait=True)
+            self._executor = None
@@ -1,21 +1,35 @@
 from __future__ import annotations
 
-from datetime import datetime, timezone
-from typing import List
+import logging
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Tuple
 
 from imapclient import IMAPClient
 from sqlalchemy.orm import Session
 
+from app.core.config import settings
 from app.core.db import SessionLocal
 from app.models.models import Folder, MailAccount, Message
+from app.services.account_versions import bump_account_versions
+from app.services.folder_sync import (
+    backfill_missing_uids,
+    count_known_uids,
+    decode_flags,
+    reconcile_expunged,
+    remap_uidvalidity,
+    sync_flag_changes,
+    uid_batches,
+)
+from app.services.locks import AccountConnectionSlots, FolderLock, clear_ingest_pending, folder_lock
+from app.services.message_writer import MessageItem, write_messages
+from app.utils.bodystructure import TextPart, decode_part, find_text_parts, has_attachments
 from app.utils.email_parse import parse_rfc822
-from app.utils.threading import find_or_create_thread, update_thread_last_date
+from app.utils.sanitize import html_to_text
+from app.utils.snippets import make_snippet
+from app.utils.threading import recompute_thread_aggregates
 
-
-def _parse_references(value: str | None) -> List[str]:
-    if not value:
-        return []
-    return [item.strip() for item in value.replace("\n", " ").split() if item.strip()]
+logger = logging.getLogger(__name__)
 
 
 def _ensure_folders(db: Session, account_id: int, names: List[str]) -> List[Folder]:
@@ -31,68 +45,405 @@ def _ensure_folders(db: Session, account_id: int, names: List[str]) -> List[Fold
     return folders
 
 
+def _batch_size_for(account: MailAccount) -> int:
+    return max(1, account.ingest_batch_size or settings.ingest_batch_size)
+
+
+def _ingest_full_batch(
+    db: Session, client: IMAPClient, account: MailAccount, folder: Folder, batch: List[int]
+) -> List[int]:
+    items: List[MessageItem] = []
+    for uid, data in client.fetch(batch, [b"RFC822", b"RFC822.SIZE", b"FLAGS"]).items():
+        raw = data[b"RFC822"]
+        columns = {
+            "imap_uid": uid,
+            "size_bytes": data.get(b"RFC822.SIZE") or len(raw),
+            "flags_json": decode_flags(data.get(b"FLAGS", ())),
+            "raw_rfc822": raw.decode("utf-8", errors="replace"),
+        }
+        items.append((parse_rfc822(raw), columns))
+    return write_messages(db, account.id, folder.id, items)
+
+
+def _apply_text_parts(parsed: dict[str, Any], parts: List[TextPart], payloads: dict[str, bytes]) -> None:
+    body_text = ""
+    body_html = None
+    for part in parts:
+        payload = payloads.get(part.section)
+        if payload is None:
+            continue
+        text = decode_part(payload, part)
+        if part.subtype == "plain":
+            body_text += text
+        else:
+            body_html = text
+    if body_html and not body_text:
+        body_text = html_to_text(body_html)
+    parsed["body_text"] = body_text.strip()
+    parsed["body_html"] = body_html
+
+
+def _ingest_headers_first_batch(
+    db: Session, client: IMAPClient, account: MailAccount, folder: Folder, batch: List[int]
+) -> List[int]:
+    """Parse headers and BODYSTRUCTURE, then download only the inline text parts.
+
+    Attachments are never transferred, so ``raw_rfc822`` stays empty. Text
+    parts larger than ``INGEST_MAX_TEXT_PART_BYTES`` are skipped and the row
+    is marked ``body_deferred`` for ``fetch_deferred_body`` to fill later.
+    """
+    pending: dict[int, tuple[MessageItem, List[TextPart]]] = {}
+    headers = client.fetch(batch, [b"BODY.PEEK[HEADER]", b"RFC822.SIZE", b"BODYSTRUCTURE", b"FLAGS"])
+    for uid, data in headers.items():
+        structure = data[b"BODYSTRUCTURE"]
+        columns = {
+            "imap_uid": uid,
+            "size_bytes": data.get(b"RFC822.SIZE"),
+            "has_attachments": has_attachments(structure),
+            "flags_json": decode_flags(data.get(b"FLAGS", ())),
+        }
+        text_parts = find_text_parts(structure)
+        parts = [part for part in text_parts if part.size <= settings.ingest_max_text_part_bytes]
+        columns["body_deferred"] = len(parts) < len(text_parts)
+        pending[uid] = ((parse_rfc822(data[b"BODY[HEADER]"]), columns), parts)
+
+    # Messages with the same part layout (usually "1" or "1.1"/"1.2") share one FETCH.
+    by_sections: dict[tuple[str, ...], List[int]] = defaultdict(list)
+    for uid, (_, parts) in pending.items():
+        sections = tuple(part.section for part in parts)
+        if sections:
+            by_sections[sections].append(uid)
+    for sections, uids in by_sections.items():
+        fetched = client.fetch(uids, [f"BODY.PEEK[{section}]".encode() for section in sections])
+        for uid, data in fetched.items():
+            (parsed, _), parts = pending[uid]
+            payloads = {section: data.get(f"BODY[{section}]".encode()) for section in sections}
+            _apply_text_parts(parsed, parts, payloads)
+    return write_messages(db, account.id, folder.id, [item for item, _ in pending.values()])
+
+
+def fetch_deferred_body(db: Session, message_id: int) -> bool:
+    """Download the text parts skipped by header-first ingest, regardless of size.
+
+    The message's chunks were built from its empty body, so it is queued for
+    embedding again once the body is stored.
+    """
+    # Local import to avoid services importing Celery tasks at module import time.
+    from app.tasks.jobs import embed_messages
+
+    message = db.query(Message).filter(Message.id == message_id).first()
+    if not message or not message.body_deferred or message.imap_uid is None:
+        return False
+    account = db.query(MailAccount).filter(MailAccount.id == message.account_id).first()
+    folder = db.query(Folder).filter(Folder.id == message.folder_id).first()
+    with IMAPClient(account.imap_host) as client:
+        _login(client, account)
+        client.select_folder(folder.name, readonly=True)
+        structure = client.fetch([message.imap_uid], [b"BODYSTRUCTURE"]).get(message.imap_uid, {}).get(b"BODYSTRUCTURE")
+        if structure is None:
+            return False
+        parts = find_text_parts(structure)
+        data = {}
+        if parts:
+            sections = [f"BODY.PEEK[{part.section}]".encode() for part in parts]
+            data = client.fetch([message.imap_uid], sections).get(message.imap_uid, {})
+    parsed: dict[str, Any] = {}
+    _apply_text_parts(parsed, parts, {part.section: data.get(f"BODY[{part.section}]".encode()) for part in parts})
+    message.snippet = make_snippet(parsed["body_text"])
+    message.body_text = parsed["body_text"]
+    message.body_html = parsed["body_html"]
+    message.body_deferred = False
+    # The thread shows the snippet of its latest message, which may be this one.
+    db.flush()
+    recompute_thread_aggregates(db, [message.thread_id])
+    bump_account_versions(db, [message.account_id])
+    db.commit()
+    embed_messages.delay([message.id])
+    return True
+
+
+def _known_uids(db: Session, folder: Folder, batch: List[int]) -> set[int]:
+    rows = db.query(Message.imap_uid).filter(Message.folder_id == folder.id, Message.imap_uid.in_(batch)).all()
+    return {row.imap_uid for row in rows}
+
+
+def _new_uids(client: IMAPClient, folder: Folder, uidnext: int | None) -> List[int]:
+    if uidnext is not None and uidnext <= folder.last_uid + 1:
+        return []
+    return [uid for uid in client.search(["UID", f"{folder.last_uid + 1}:*"]) if uid > folder.last_uid]
+
+
+def ingest_folder_messages(
+    db: Session,
+    client: IMAPClient,
+    account: MailAccount,
+    folder: Folder,
+    heartbeat: Callable[[], None] | None = None,
+) -> int:
+    """Sync one folder: state changes first, then new messages in UID windows.
+
+    The SELECT response drives the incremental sync. A changed UIDVALIDITY
+    remaps stored rows by Message-ID (as does the one-off backfill of rows
+    stored before UIDs were tracked), HIGHESTMODSEQ/CONDSTORE limits flag
+    sync to changed messages, UIDNEXT skips the search when nothing is new,
+    and an EXISTS mismatch triggers expunge reconciliation. New messages are
+    fetched one window at a time, and ``folder.last_uid`` advances with every
+    committed window so an interrupted sync resumes from the last completed
+    batch. ``heartbeat`` is called after every window so callers can extend
+    the locks they hold for the duration of the sync.
+    """
+    # Local import to avoid services importing Celery tasks at module import time.
+    from app.tasks.jobs import embed_messages
+
+    ingest_batch = (
+        _ingest_headers_first_batch if settings.ingest_mode == "headers_first" else _ingest_full_batch
+    )
+    status = client.select_folder(folder.name)
+    uidvalidity = status.get(b"UIDVALIDITY")
+    highestmodseq = status.get(b"HIGHESTMODSEQ")
+    batch_size = _batch_size_for(account)
+    if folder.uidvalidity and uidvalidity and uidvalidity != folder.uidvalidity:
+        remap_uidvalidity(db, client, folder, batch_size)
+    else:
+        backfill_missing_uids(db, client, folder, batch_size)
+        sync_flag_changes(db, client, folder, highestmodseq, batch_size)
+    folder.uidvalidity = uidvalidity
+    db.commit()
+
+    ingested = 0
+    for batch in uid_batches(_new_uids(client, folder, status.get(b"UIDNEXT")), batch_size):
+        known = _known_uids(db, folder, batch)
+        pending = [uid for uid in batch if uid not in known]
+        message_ids = ingest_batch(db, client, account, folder, pending) if pending else []
+        folder.last_uid = batch[-1]
+        db.commit()
+        if message_ids:
+            embed_messages.delay(message_ids)
+        ingested += len(message_ids)
+        if heartbeat:
+            heartbeat()
+
+    exists = status.get(b"EXISTS")
+    if exists is not None and exists != count_known_uids(db, folder):
+        reconcile_expunged(db, client, folder)
+    folder.highestmodseq = highestmodseq
+    db.commit()
+    return ingested
+
+
+def _login(client: IMAPClient, account: MailAccount) -> None:
+    client.login(account.imap_user, account.imap_password)
+    # HIGHESTMODSEQ is only reported on SELECT once CONDSTORE is enabled.
+    if client.has_capability("CONDSTORE") and client.has_capability("ENABLE"):
+        client.enable("CONDSTORE")
+
+
+def _list_folder_names(client: IMAPClient) -> List[str]:
+    return [name.decode() if isinstance(name, bytes) else name for _, _, name in client.list_folders()]
+
+
+def _partition_folders(folder_ids: List[int], max_connections: int) -> List[List[int]]:
+    groups: List[List[int]] = [[] for _ in range(min(len(folder_ids), max(1, max_connections)))]
+    for index, folder_id in enumerate(folder_ids):
+        groups[index % len(groups)].append(folder_id)
+    return groups
+
+
+def _sync_locked_folders(
+    db: Session,
+    client: IMAPClient,
+    account: MailAccount,
+    folders: List[Folder],
+    slots: AccountConnectionSlots,
+    slot: str,
+    lock_tokens: Dict[int, str] | None = None,
+) -> int:
+    """Sync folders one after another.
+
+    A folder another sync has locked is queued again for later, so changes
+    that sync has already passed over are not missed. ``lock_tokens`` hands
+    over folder locks taken by ``plan_account_ingest`` for split folders.
+    """
+    # Local import to avoid services importing Celery tasks at module import time.
+    from app.tasks.jobs import ingest_folders
+
+    lock_tokens = lock_tokens or {}
+    ingested = 0
+    for folder in folders:
+        with folder_lock(folder.id, lock_tokens.get(folder.id)) as lock:
+            if lock is None:
+                logger.info("Folder %s is locked by another sync; queueing it again", folder.id)
+                ingest_folders.apply_async(
+                    (account.id, [folder.id]), countdown=settings.ingest_slot_retry_seconds
+                )
+                continue
+            # Mail arriving from here on needs a new sync, so let IDLE queue one.
+            clear_ingest_pending(folder.id)
+
+            def heartbeat() -> None:
+                slots.refresh(slot)
+                lock.refresh()
+
+            ingested += ingest_folder_messages(db, client, account, folder, heartbeat)
+        slots.refresh(slot)
+    return ingested
+
+
 def ingest_account_messages(db: Session, account_id: int) -> int:
     account = db.query(MailAccount).filter(MailAccount.id == account_id).first()
     if not account:
         return 0
-    ingested = 0
-    with IMAPClient(account.imap_host) as client:
-        client.login(account.imap_user, account.imap_password)
-        folders = [name.decode() if isinstance(name, bytes) else name for _, _, name in client.list_folders()]
-        db_folders = _ensure_folders(db, account_id, folders)
+    slots = AccountConnectionSlots(account_id)
+    with slots.hold() as slot, IMAPClient(account.imap_host) as client:
+        _login(client, account)
+        db_folders = _ensure_folders(db, account_id, _list_folder_names(client))
+        return _sync_locked_folders(db, client, account, db_folders, slots, slot)
+
+
+@dataclass
+class SplitFolder:
+    """A folder whose new UIDs are fetched as ranges in parallel before its regular sync."""
+
+    folder_id: int
+    uidvalidity: int | None
+    lock_token: str
+    ranges: List[Tuple[int, int]]
+
+
+@dataclass
+class IngestPlan:
+    folder_groups: List[List[int]] = field(default_factory=list)
+    split_folders: List[SplitFolder] = field(default_factory=list)
+
+
+def _plan_uid_ranges(client: IMAPClient, folder: Folder) -> SplitFolder | None:
+    """Split a folder with more than ``ingest_uid_range_size`` new UIDs into UID ranges.
+
+    The folder lock is taken here and handed to the range tasks and the
+    regular sync after them, so other syncs of the folder wait meanwhile.
+    """
+    range_size = settings.ingest_uid_range_size
+    if range_size <= 0:
+        return None
+    status = client.folder_status(folder.name, [b"MESSAGES", b"UIDVALIDITY"])
+    if (status.get(b"MESSAGES") or 0) <= range_size:
+        return None
+    uidvalidity = status.get(b"UIDVALIDITY")
+    if folder.uidvalidity and uidvalidity != folder.uidvalidity:
+        # The regular sync remaps the stored UIDs first.
+        return None
+    client.select_folder(folder.name, readonly=True)
+    uids = _new_uids(client, folder, None)
+    if len(uids) <= range_size:
+        return None
+    lock = FolderLock(folder.id)
+    if not lock.acquire():
+        return None
+    ranges = [(batch[0], batch[-1]) for batch in uid_batches(uids, range_size)]
+    return SplitFolder(folder.id, uidvalidity, lock.token, ranges)
+
+
+def plan_account_ingest(db: Session, account_id: int) -> IngestPlan:
+    """List the account's folders and split them into per-connection work.
+
+    Folders with many new messages are split into UID ranges, each fetched
+    by its own task; the rest are grouped so that each group is synced by
+    one task on its own IMAP connection, as many groups as the account's
+    concurrent connection cap.
+    """
+    account = db.query(MailAccount).filter(MailAccount.id == account_id).first()
+    if not account:
+        return IngestPlan()
+    split_folders: List[SplitFolder] = []
+    with AccountConnectionSlots(account_id).hold(), IMAPClient(account.imap_host) as client:
+        _login(client, account)
+        db_folders = _ensure_folders(db, account_id, _list_folder_names(client))
         for folder in db_folders:
-            client.select_folder(folder.name)
-            uids = client.search(["UID", f"{folder.last_uid + 1}:*"])
-            if not uids:
-                continue
-            fetch = client.fetch(uids, [b"RFC822"])
-            for uid, data in fetch.items():
-                raw = data[b"RFC822"]
-                parsed = parse_rfc822(raw)
-                references = _parse_references(parsed.get("references"))
-                if parsed.get("in_reply_to"):
-                    references.append(parsed["in_reply_to"])
-                sent_at = parsed.get("sent_at") or datetime.now(timezone.utc)
-                thread = find_or_create_thread(
-                    db,
-                    account_id=account.id,
-                    subject=parsed.get("subject"),
-                    from_email=parsed.get("from_email"),
-                    to_emails=parsed.get("to") or [],
-                    sent_at=sent_at,
-                    references=references,
-                )
-                message = Message(
-                    account_id=account.id,
-                    folder_id=folder.id,
-                    thread_id=thread.id,
-                    message_id_header=parsed.get("message_id"),
-                    in_reply_to=parsed.get("in_reply_to"),
-                    references=" ".join(references),
-                    subject=parsed.get("subject"),
-                    sent_at=sent_at,
-                    from_name=parsed.get("from_name"),
-                    from_email=parsed.get("from_email"),
-                    to_json=parsed.get("to"),
-                    cc_json=parsed.get("cc"),
-                    bcc_json=parsed.get("bcc"),
-                    body_text=parsed.get("body_text"),
-                    body_html=parsed.get("body_html"),
-                    raw_rfc822=raw.decode("utf-8", errors="replace"),
-                )
-                db.add(message)
-                update_thread_last_date(thread, sent_at)
-                db.flush()
-                # Local import to avoid services importing Celery tasks at module import time.
-                from app.tasks.jobs import embed_message
-
-                embed_message.delay(message.id)
-                ingested += 1
-            folder.last_uid = max(uids)
+            split = _plan_uid_ranges(client, folder)
+            if split:
+                split_folders.append(split)
+    db.commit()
+    split_ids = {split.folder_id for split in split_folders}
+    whole = [folder.id for folder in db_folders if folder.id not in split_ids]
+    return IngestPlan(_partition_folders(whole, settings.ingest_max_connections_per_account), split_folders)
+
+
+def ingest_uid_range_messages(
+    db: Session,
+    account_id: int,
+    folder_id: int,
+    low: int,
+    high: int,
+    uidvalidity: int | None,
+    lock_token: str,
+) -> int:
+    """Fetch and store the new messages of one UID range of a split folder.
+
+    Only messages are written: flags, expunges and ``folder.last_uid`` are
+    left to the regular sync that runs after all ranges, which skips the
+    UIDs stored here. The range is skipped if UIDVALIDITY changed since the
+    plan was made.
+    """
+    # Local import to avoid services importing Celery tasks at module import time.
+    from app.tasks.jobs import embed_messages
+
+    account = db.query(MailAccount).filter(MailAccount.id == account_id).first()
+    folder = db.query(Folder).filter(Folder.id == folder_id, Folder.account_id == account_id).first()
+    if not account or not folder:
+        return 0
+    ingest_batch = (
+        _ingest_headers_first_batch if settings.ingest_mode == "headers_first" else _ingest_full_batch
+    )
+    lock = FolderLock(folder_id, token=lock_token)
+    slots = AccountConnectionSlots(account_id)
+    ingested = 0
+    with slots.hold() as slot, IMAPClient(account.imap_host) as client:
+        _login(client, account)
+        status = client.select_folder(folder.name, readonly=True)
+        if uidvalidity is not None and status.get(b"UIDVALIDITY") != uidvalidity:
+            logger.info("UIDVALIDITY of folder %s changed; skipping UIDs %s:%s", folder_id, low, high)
+            return 0
+        uids = [uid for uid in client.search(["UID", f"{low}:{high}"]) if low <= uid <= high]
+        for batch in uid_batches(uids, _batch_size_for(account)):
+            known = _known_uids(db, folder, batch)
+            pending = [uid for uid in batch if uid not in known]
+            message_ids = ingest_batch(db, client, account, folder, pending) if pending else []
             db.commit()
+            if message_ids:
+                embed_messages.delay(message_ids)
+            ingested += len(message_ids)
+            slots.refresh(slot)
+            lock.refresh()
     return ingested
 
 
+def ingest_folders_messages(
+    db: Session, account_id: int, folder_ids: List[int], lock_tokens: Dict[int, str] | None = None
+) -> int:
+    """Sync a group of folders on one IMAP connection.
+
+    The connection takes one of the account's connection slots, shared with
+    other ingest tasks and the IDLE listener, and raises
+    ``ConnectionSlotsExhausted`` when none is free. Folders already locked by
+    another sync are queued again for later.
+    """
+    account = db.query(MailAccount).filter(MailAccount.id == account_id).first()
+    if not account:
+        return 0
+    folders = (
+        db.query(Folder)
+        .filter(Folder.account_id == account_id, Folder.id.in_(folder_ids))
+        .order_by(Folder.id)
+        .all()
+    )
+    if not folders:
+        return 0
+    slots = AccountConnectionSlots(account_id)
+    with slots.hold() as slot, IMAPClient(account.imap_host) as client:
+        _login(client, account)
+        return _sync_locked_folders(db, client, account, folders, slots, slot, lock_tokens)
+
+
 def ingest_account_service(account_id: int) -> int:
     """Ingest messages using a dedicated DB session for task orchestration."""
     db = SessionLocal()
@@ -100,3 +451,47 @@ def ingest_account_service(account_id: int) -> int:
         return ingest_account_messages(db, account_id)
     finally:
         db.close()
+
+
+def plan_account_ingest_service(account_id: int) -> IngestPlan:
+    db = SessionLocal()
+    try:
+        return plan_account_ingest(db, account_id)
+    finally:
+        db.close()
+
+
+def fetch_deferred_body_service(message_id: int) -> bool:
+    db = SessionLocal()
+    try:
+        return fetch_deferred_body(db, message_id)
+    finally:
+        db.close()
+
+
+def ingest_folders_service(account_id: int, folder_ids: List[int]) -> int:
+    """Ingest a group of folders on one IMAP connection with its own DB session."""
+    db = SessionLocal()
+    try:
+        return ingest_folders_messages(db, account_id, folder_ids)
+    finally:
+        db.close()
+
+
+def ingest_uid_range_service(
+    account_id: int, folder_id: int, low: int, high: int, uidvalidity: int | None, lock_token: str
+) -> int:
+    db = SessionLocal()
+    try:
+        return ingest_uid_range_messages(db, account_id, folder_id, low, high, uidvalidity, lock_token)
+    finally:
+        db.close()
+
+
+def ingest_split_folder_service(account_id: int, folder_id: int, lock_token: str) -> int:
+    """The regular sync of a split folder, under the lock its ranges ran with."""
+    db = SessionLocal()
+    try:
+        return ingest_folders_messages(db, account_id, [folder_id], {folder_id: lock_token})
+    finally:
+        db.close()
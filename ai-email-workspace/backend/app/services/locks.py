@@ -0,0 +1,143 @@
+from __future__ import annotations
+
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Iterator
+
+from app.core.config import settings
+from app.core.redis import get_redis
+
+# Counting semaphore stored as a sorted set of token -> expiry (ms). Expired
+# holders (crashed workers) are pruned before counting.
+_ACQUIRE_SLOT = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+if redis.call('ZCARD', KEYS[1]) < tonumber(ARGV[3]) then
+    redis.call('ZADD', KEYS[1], ARGV[2], ARGV[4])
+    redis.call('PEXPIRE', KEYS[1], ARGV[5])
+    return 1
+end
+return 0
+"""
+
+_RELEASE_LOCK = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+_REFRESH_LOCK = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+class ConnectionSlotsExhausted(RuntimeError):
+    pass
+
+
+class AccountConnectionSlots:
+    """Cap concurrent IMAP connections per account across all processes.
+
+    Ingest tasks and IDLE watchers each hold a slot while connected. Slots
+    expire after ``ttl`` seconds unless refreshed, so a crashed holder cannot
+    leak one forever. A holder with a lower ``limit`` only gets a slot while
+    fewer than ``limit`` are taken, which keeps the rest for other holders.
+    """
+
+    def __init__(self, account_id: int, limit: int | None = None, ttl: float | None = None) -> None:
+        self.key = f"imap:slots:{account_id}"
+        self.limit = settings.ingest_max_connections_per_account if limit is None else limit
+        self.ttl_ms = int((ttl or settings.imap_slot_ttl_seconds) * 1000)
+
+    def acquire(self) -> str | None:
+        token = uuid.uuid4().hex
+        now = _now_ms()
+        acquired = get_redis().eval(
+            _ACQUIRE_SLOT, 1, self.key, now, now + self.ttl_ms, self.limit, token, self.ttl_ms
+        )
+        return token if acquired else None
+
+    def refresh(self, token: str) -> bool:
+        client = get_redis()
+        refreshed = client.zadd(self.key, {token: _now_ms() + self.ttl_ms}, xx=True, ch=True)
+        client.pexpire(self.key, self.ttl_ms)
+        return bool(refreshed) or client.zscore(self.key, token) is not None
+
+    def release(self, token: str) -> None:
+        get_redis().zrem(self.key, token)
+
+    @contextmanager
+    def hold(self) -> Iterator[str]:
+        token = self.acquire()
+        if token is None:
+            raise ConnectionSlotsExhausted(f"All {self.limit} IMAP connection slots are in use")
+        try:
+            yield token
+        finally:
+            self.release(token)
+
+
+class RedisLock:
+    """Exclusive lock on ``key`` that expires after ``ttl`` seconds unless refreshed.
+
+    Passing the ``token`` of a lock taken elsewhere lets another process
+    refresh and release it.
+    """
+
+    def __init__(self, key: str, ttl: float, token: str | None = None) -> None:
+        self.key = key
+        self.ttl_ms = int(ttl * 1000)
+        self.token = token or uuid.uuid4().hex
+
+    def acquire(self) -> bool:
+        return bool(get_redis().set(self.key, self.token, nx=True, px=self.ttl_ms))
+
+    def refresh(self) -> bool:
+        return bool(get_redis().eval(_REFRESH_LOCK, 1, self.key, self.token, self.ttl_ms))
+
+    def release(self) -> None:
+        get_redis().eval(_RELEASE_LOCK, 1, self.key, self.token)
+
+
+class FolderLock(RedisLock):
+    """Exclusive, expiring lock so only one sync runs per folder at a time."""
+
+    def __init__(self, folder_id: int, ttl: float | None = None, token: str | None = None) -> None:
+        super().__init__(f"imap:folder-lock:{folder_id}", ttl or settings.imap_folder_lock_ttl_seconds, token)
+
+
+@contextmanager
+def folder_lock(folder_id: int, token: str | None = None) -> Iterator[FolderLock | None]:
+    """Yield the held lock, or None when another sync owns the folder.
+
+    With ``token``, a lock already taken under that token is taken over.
+    """
+    lock = FolderLock(folder_id, token=token)
+    if not ((token and lock.refresh()) or lock.acquire()):
+        yield None
+        return
+    try:
+        yield lock
+    finally:
+        lock.release()
+
+
+def _pending_key(folder_id: int) -> str:
+    return f"imap:ingest-pending:{folder_id}"
+
+
+def mark_ingest_pending(folder_id: int) -> bool:
+    """Return True if no sync of the folder was queued yet, marking one as queued."""
+    return bool(get_redis().set(_pending_key(folder_id), 1, nx=True, ex=settings.ingest_pending_ttl_seconds))
+
+
+def clear_ingest_pending(folder_id: int) -> None:
+    get_redis().delete(_pending_key(folder_id))
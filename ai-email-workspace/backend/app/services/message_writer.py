@@ -0,0 +1,198 @@
+from __future__ import annotations
+
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Tuple
+
+from sqlalchemy import Column, Integer, insert, update, values
+from sqlalchemy.orm import Session
+
+from app.models.models import Message, Thread
+from app.services.account_versions import bump_account_versions
+from app.utils.snippets import make_snippet
+from app.utils.threading import (
+    ThreadResolver,
+    ThreadSlot,
+    add_to_thread_aggregates,
+    derive_thread_key,
+    empty_thread_aggregates,
+    fold_thread_aggregates,
+    refresh_threads,
+)
+
+# A parsed message (as returned by ``parse_rfc822``) plus extra Message columns.
+MessageItem = Tuple[Dict[str, Any], Dict[str, Any]]
+
+
+def parse_references(value: str | None) -> List[str]:
+    if not value:
+        return []
+    return [item.strip() for item in value.replace("\n", " ").split() if item.strip()]
+
+
+def _references(parsed: Dict[str, Any]) -> List[str]:
+    references = parse_references(parsed.get("references"))
+    if parsed.get("in_reply_to"):
+        references.append(parsed["in_reply_to"])
+    return references
+
+
+def _sent_at(parsed: Dict[str, Any]) -> datetime:
+    sent_at = parsed.get("sent_at") or datetime.now(timezone.utc)
+    if sent_at.tzinfo is None:
+        sent_at = sent_at.replace(tzinfo=timezone.utc)
+    return sent_at
+
+
+def _stored_keys(db: Session, folder_id: int, uids: List[int], message_ids: List[str]) -> Tuple[set[int], set[str]]:
+    """Return the UIDs and the UID-less Message-IDs already stored in the folder."""
+    stored_uids: set[int] = set()
+    stored_message_ids: set[str] = set()
+    if uids:
+        rows = db.query(Message.imap_uid).filter(Message.folder_id == folder_id, Message.imap_uid.in_(uids)).all()
+        stored_uids = {row.imap_uid for row in rows}
+    if message_ids:
+        rows = (
+            db.query(Message.message_id_header)
+            .filter(Message.folder_id == folder_id, Message.message_id_header.in_(message_ids))
+            .all()
+        )
+        stored_message_ids = {row.message_id_header for row in rows}
+    return stored_uids, stored_message_ids
+
+
+def _dedupe(db: Session, folder_id: int, items: List[MessageItem]) -> List[MessageItem]:
+    """Drop messages the folder already holds.
+
+    Messages fetched from IMAP are keyed on their UID, so the same Message-ID
+    may be stored in several folders and accounts, and duplicate copies within
+    one folder are kept to match the server's EXISTS count. Messages without a
+    UID (fixture imports) are keyed on the folder and their Message-ID.
+    """
+    uids = [columns["imap_uid"] for _, columns in items if columns.get("imap_uid") is not None]
+    message_ids = [
+        parsed["message_id"] for parsed, columns in items if columns.get("imap_uid") is None and parsed.get("message_id")
+    ]
+    stored_uids, stored_message_ids = _stored_keys(db, folder_id, uids, message_ids)
+    unique: List[MessageItem] = []
+    for parsed, columns in items:
+        uid = columns.get("imap_uid")
+        if uid is not None:
+            if uid in stored_uids:
+                continue
+            stored_uids.add(uid)
+        elif parsed.get("message_id"):
+            if parsed["message_id"] in stored_message_ids:
+                continue
+            stored_message_ids.add(parsed["message_id"])
+        unique.append((parsed, columns))
+    return unique
+
+
+def _thread_key(parsed: Dict[str, Any]) -> str:
+    return derive_thread_key(parsed.get("subject"), parsed.get("from_email"), parsed.get("to") or [], parsed["sent_at"])
+
+
+def _resolve_threads(db: Session, account_id: int, items: List[MessageItem]) -> Tuple[ThreadResolver, List[ThreadSlot]]:
+    resolver = ThreadResolver(account_id)
+    resolver.prefill(
+        db,
+        message_ids=[parsed["message_id"] for parsed, _ in items if parsed.get("message_id")],
+        references=[ref for parsed, _ in items for ref in _references(parsed)],
+        thread_keys=[_thread_key(parsed) for parsed, _ in items],
+    )
+    slots: List[ThreadSlot] = [0] * len(items)
+    # Walk in date order so parents are usually seen before their replies.
+    for index in sorted(range(len(items)), key=lambda index: items[index][0]["sent_at"]):
+        parsed = items[index][0]
+        slots[index] = resolver.resolve(
+            parsed.get("message_id"),
+            _references(parsed),
+            parsed.get("subject"),
+            parsed.get("from_email"),
+            parsed.get("to") or [],
+            parsed["sent_at"],
+        )
+    return resolver, [resolver.find(slot) for slot in slots]
+
+
+def _merge_threads(db: Session, merged: Dict[int, int]) -> None:
+    """Move messages of regrouped threads to the surviving thread and drop them."""
+    moves = values(Column("old_id", Integer), Column("new_id", Integer), name="moves").data(list(merged.items()))
+    db.execute(
+        update(Message).where(Message.thread_id == moves.c.old_id).values(thread_id=moves.c.new_id),
+        execution_options={"synchronize_session": False},
+    )
+    db.query(Thread).filter(Thread.id.in_(list(merged))).delete(synchronize_session=False)
+    refresh_threads(db, merged.values())
+
+
+def write_messages(db: Session, account_id: int, folder_id: int, items: List[MessageItem]) -> List[int]:
+    """Insert a batch of parsed messages with a fixed number of statements.
+
+    Messages the folder already holds are skipped (see ``_dedupe``). Threads are
+    resolved for the whole batch by a prefilled ``ThreadResolver``, new
+    threads (with their aggregates) and messages are inserted with
+    multi-row INSERT ... RETURNING, existing threads get the batch folded
+    into their aggregates by one bulk UPDATE, and threads the resolver
+    regrouped are merged.
+    Returns the ids of the inserted messages.
+    """
+    items = _dedupe(db, folder_id, items)
+    if not items:
+        return []
+    for parsed, _ in items:
+        parsed["sent_at"] = _sent_at(parsed)
+    resolver, slots = _resolve_threads(db, account_id, items)
+
+    message_rows = [
+        {
+            "account_id": account_id,
+            "folder_id": folder_id,
+            "message_id_header": parsed.get("message_id"),
+            "in_reply_to": parsed.get("in_reply_to"),
+            "references": " ".join(_references(parsed)),
+            "subject": parsed.get("subject"),
+            "sent_at": parsed["sent_at"],
+            "from_name": parsed.get("from_name"),
+            "from_email": parsed.get("from_email"),
+            "to_json": parsed.get("to") or [],
+            "cc_json": parsed.get("cc") or [],
+            "bcc_json": parsed.get("bcc") or [],
+            "snippet": make_snippet(parsed.get("body_text")),
+            "body_text": parsed.get("body_text"),
+            "body_html": parsed.get("body_html"),
+            **columns,
+        }
+        for parsed, columns in items
+    ]
+
+    rows_by_slot: Dict[ThreadSlot, List[Dict[str, Any]]] = defaultdict(list)
+    for row, slot in zip(message_rows, slots):
+        rows_by_slot[slot].append(row)
+    new_threads = resolver.threads_to_create()
+    for key, thread in new_threads.items():
+        thread.update(fold_thread_aggregates(empty_thread_aggregates(), rows_by_slot[key]))
+    created: Dict[str, int] = {}
+    if new_threads:
+        rows = db.execute(
+            insert(Thread).returning(Thread.id, Thread.thread_key, sort_by_parameter_order=True),
+            [{"account_id": account_id, **thread} for thread in new_threads.values()],
+        ).all()
+        created = {row.thread_key: row.id for row in rows}
+
+    for row, slot in zip(message_rows, slots):
+        row["thread_id"] = created[slot] if isinstance(slot, str) else slot
+    message_ids = list(
+        db.scalars(insert(Message).returning(Message.id, sort_by_parameter_order=True), message_rows)
+    )
+    existing_rows = [row for slot, rows in rows_by_slot.items() if not isinstance(slot, str) for row in rows]
+    add_to_thread_aggregates(db, existing_rows)
+    merged = {
+        old_id: created[slot] if isinstance(slot, str) else slot
+        for old_id, slot in resolver.merged_threads().items()
+    }
+    if merged:
+        _merge_threads(db, merged)
+    bump_account_versions(db, [account_id])
+    return message_ids
@@ -0,0 +1,266 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Tuple
+
+import redis
+
+from app.core.config import settings
+from app.core.redis import get_redis
+from app.providers.base import LLMProvider
+from app.services.locks import RedisLock
+
+logger = logging.getLogger(__name__)
+
+Vector = List[float]
+
+
+def normalize_query(text: str) -> str:
+    return " ".join(text.split()).casefold()
+
+
+def _encode(value: Any) -> str:
+    return json.dumps(value, default=lambda item: item.isoformat() if isinstance(item, datetime) else str(item))
+
+
+def _digest(*parts: Any) -> str:
+    return hashlib.sha256(_encode(parts).encode("utf-8")).hexdigest()
+
+
+class _Flight:
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.ok = False
+        self.value: Any = None
+
+
+class QueryCache:
+    """Chat query embeddings and answers, cached in Redis with a TTL.
+
+    A per-process LRU of ``query_cache_lru_size`` entries sits in front of
+    Redis (0 disables it); its entries expire with the Redis key they were
+    stored or read with. Identical lookups that miss are coalesced: within
+    a process followers wait for the leader thread, and across processes a
+    short Redis lock makes other callers poll for the leader's result
+    instead of calling the provider themselves. Redis being unavailable only
+    disables sharing; values are still computed.
+    """
+
+    def __init__(self, lru_size: int | None = None) -> None:
+        self.lru_size = settings.query_cache_lru_size if lru_size is None else lru_size
+        # key -> (monotonic expiry, value)
+        self._lru: OrderedDict[str, Tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._flights: Dict[str, _Flight] = {}
+        self._tasks: Dict[str, asyncio.Future] = {}
+
+    def _lru_get(self, key: str) -> Any:
+        with self._lock:
+            entry = self._lru.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if time.monotonic() >= expires_at:
+                del self._lru[key]
+                return None
+            self._lru.move_to_end(key)
+            return value
+
+    def _lru_put(self, key: str, value: Any, ttl: float) -> None:
+        if self.lru_size <= 0 or ttl <= 0:
+            return
+        with self._lock:
+            self._lru[key] = (time.monotonic() + ttl, value)
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.lru_size:
+                self._lru.popitem(last=False)
+
+    def _shared_entry(self, key: str) -> Tuple[Any, float]:
+        """The stored value (or None) and the seconds its key has left."""
+        try:
+            raw, ttl_ms = get_redis().pipeline().get(key).pttl(key).execute()
+        except redis.RedisError:
+            logger.warning("Query cache unavailable; reading %s skipped", key, exc_info=True)
+            return None, 0.0
+        if raw is None:
+            return None, 0.0
+        return json.loads(raw), max(0, ttl_ms) / 1000
+
+    def _shared_get(self, key: str) -> Any:
+        return self._shared_entry(key)[0]
+
+    def _shared_set(self, key: str, encoded: str, ttl: int) -> None:
+        try:
+            get_redis().set(key, encoded, ex=ttl)
+        except redis.RedisError:
+            logger.warning("Query cache unavailable; %s not stored", key, exc_info=True)
+
+    def _compute_once(self, key: str, ttl: int, compute: Callable[[], Any]) -> Any:
+        lock = RedisLock(f"{key}:lock", settings.query_cache_wait_seconds)
+        try:
+            leader = lock.acquire()
+        except redis.RedisError:
+            leader = True
+        if not leader:
+            deadline = time.monotonic() + settings.query_cache_wait_seconds
+            while time.monotonic() < deadline:
+                time.sleep(0.05)
+                value = self._shared_get(key)
+                if value is not None:
+                    return value
+            # The other process is slow or died; do the work here.
+        try:
+            # Round-trip through JSON so every caller sees the same types.
+            encoded = _encode(compute())
+            self._shared_set(key, encoded, ttl)
+            return json.loads(encoded)
+        finally:
+            if leader:
+                try:
+                    lock.release()
+                except redis.RedisError:
+                    pass
+
+    def get_or_compute(self, key: str, ttl: int, compute: Callable[[], Any]) -> Any:
+        value = self._lru_get(key)
+        if value is not None:
+            return value
+        value, remaining = self._shared_entry(key)
+        if value is None:
+            remaining = ttl
+            with self._lock:
+                flight = self._flights.get(key)
+                leader = flight is None
+                if leader:
+                    flight = self._flights[key] = _Flight()
+            if not leader:
+                flight.done.wait(settings.query_cache_wait_seconds)
+                if flight.ok:
+                    return flight.value
+                # The leader failed (try again, possibly leading) or is still busy (don't wait longer).
+                return self.get_or_compute(key, ttl, compute) if flight.done.is_set() else compute()
+            try:
+                value = self._compute_once(key, ttl, compute)
+                flight.value, flight.ok = value, True
+            finally:
+                with self._lock:
+                    self._flights.pop(key, None)
+                flight.done.set()
+        self._lru_put(key, value, remaining)
+        return value
+
+    async def _acompute_once(self, key: str, ttl: int, compute: Callable[[], Awaitable[Any]]) -> Any:
+        lock = RedisLock(f"{key}:lock", settings.query_cache_wait_seconds)
+        try:
+            leader = await asyncio.to_thread(lock.acquire)
+        except redis.RedisError:
+            leader = True
+        if not leader:
+            deadline = time.monotonic() + settings.query_cache_wait_seconds
+            while time.monotonic() < deadline:
+                await asyncio.sleep(0.05)
+                value = await asyncio.to_thread(self._shared_get, key)
+                if value is not None:
+                    return value
+        try:
+            encoded = _encode(await compute())
+            await asyncio.to_thread(self._shared_set, key, encoded, ttl)
+            return json.loads(encoded)
+        finally:
+            if leader:
+                try:
+                    await asyncio.to_thread(lock.release)
+                except redis.RedisError:
+                    pass
+
+    async def aget_or_compute(self, key: str, ttl: int, compute: Callable[[], Awaitable[Any]]) -> Any:
+        """``get_or_compute`` for the event loop; concurrent callers await one shared task."""
+        value = self._lru_get(key)
+        if value is not None:
+            return value
+        value, remaining = await asyncio.to_thread(self._shared_entry, key)
+        if value is None:
+            remaining = ttl
+            task = self._tasks.get(key)
+            if task is None:
+                task = asyncio.ensure_future(self._acompute_once(key, ttl, compute))
+                self._tasks[key] = task
+                task.add_done_callback(lambda _: self._tasks.pop(key, None))
+            # A cancelled caller must not cancel the computation others wait on.
+            value = await asyncio.shield(task)
+        self._lru_put(key, value, remaining)
+        return value
+
+    def query_embedding(self, provider: LLMProvider, query: str) -> Vector:
+        text = normalize_query(query)
+        model = provider.embedding_model_id()
+        return self.get_or_compute(
+            f"chat:query-embedding:{_digest(model, text)}",
+            settings.query_embedding_cache_ttl_seconds,
+            lambda: [float(value) for value in provider.embed([text])[0]],
+        )
+
+    async def aquery_embedding(self, provider: LLMProvider, query: str) -> Vector:
+        text = normalize_query(query)
+        model = provider.embedding_model_id()
+
+        async def compute() -> Vector:
+            return [float(value) for value in (await provider.aembed([text]))[0]]
+
+        return await self.aget_or_compute(
+            f"chat:query-embedding:{_digest(model, text)}", settings.query_embedding_cache_ttl_seconds, compute
+        )
+
+    def _answer_key(self, provider: LLMProvider, query: str, context_ids: Iterable[int]) -> str:
+        return f"chat:answer:{_digest(provider.chat_model_id(), normalize_query(query), sorted(context_ids))}"
+
+    def answer(
+        self,
+        provider: LLMProvider,
+        query: str,
+        context_ids: Iterable[int],
+        compute: Callable[[], Tuple[str, List[dict]]],
+    ) -> Tuple[str, List[dict]]:
+        """Cache an answer by question and retrieved chunks; new or changed mail changes the key."""
+        key = self._answer_key(provider, query, context_ids)
+        answer, citations = self.get_or_compute(key, settings.answer_cache_ttl_seconds, lambda: list(compute()))
+        return answer, citations
+
+    async def aanswer(
+        self,
+        provider: LLMProvider,
+        query: str,
+        context_ids: Iterable[int],
+        compute: Callable[[], Awaitable[Tuple[str, List[dict]]]],
+    ) -> Tuple[str, List[dict]]:
+        key = self._answer_key(provider, query, context_ids)
+
+        async def compute_list() -> list:
+            return list(await compute())
+
+        answer, citations = await self.aget_or_compute(key, settings.answer_cache_ttl_seconds, compute_list)
+        return answer, citations
+
+    def cached_answer(self, provider: LLMProvider, query: str, context_ids: Iterable[int]) -> str | None:
+        """The cached answer text, if any, without computing or waiting for one."""
+        key = self._answer_key(provider, query, context_ids)
+        value = self._lru_get(key) or self._shared_get(key)
+        return None if value is None else value[0]
+
+    def store_answer(
+        self, provider: LLMProvider, query: str, context_ids: Iterable[int], answer: str, citations: List[dict]
+    ) -> None:
+        key = self._answer_key(provider, query, context_ids)
+        encoded = _encode([answer, citations])
+        self._shared_set(key, encoded, settings.answer_cache_ttl_seconds)
+        self._lru_put(key, json.loads(encoded), settings.answer_cache_ttl_seconds)
+
+
+query_cache = QueryCache()
@@ -1,4 +1,5 @@
 from celery import Celery
+from celery.signals import worker_process_shutdown, worker_shutdown
 
 from app.core.config import settings
 
@@ -10,3 +11,12 @@ celery_app = Celery(
 )
 
 celery_app.conf.update(task_serializer="json", result_serializer="json", accept_content=["json"])
+
+
+@worker_shutdown.connect
+@worker_process_shutdown.connect
+def close_llm_clients(**kwargs) -> None:
+    # Local import keeps provider modules out of the Celery app import path.
+    from app.providers.factory import close_providers
+
+    close_providers()
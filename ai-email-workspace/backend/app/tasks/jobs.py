@@ -1,17 +1,119 @@
-from celery import shared_task
+from celery import chord, shared_task
+
+
+@shared_task(bind=True, max_retries=None)
+def ingest_account(self, account_id: int) -> int:
+    """Fan out the account's folder groups and UID ranges and sum their counts.
+
+    Each folder group is one ``ingest_folders`` task. A split folder's UID
+    ranges run as parallel ``ingest_uid_range`` tasks followed by the
+    folder's regular sync. The task replaces itself with the chord, so its
+    result is the total number of messages ingested across all folders.
+    """
+    # Local import keeps service modules out of task import paths for FastAPI startup.
+    from app.core.config import settings
+    from app.services.ingest import plan_account_ingest_service
+    from app.services.locks import ConnectionSlotsExhausted
+
+    try:
+        plan = plan_account_ingest_service(account_id)
+    except ConnectionSlotsExhausted as exc:
+        raise self.retry(exc=exc, countdown=settings.ingest_slot_retry_seconds)
+    header = [ingest_folders.s(account_id, folder_ids) for folder_ids in plan.folder_groups]
+    for split in plan.split_folders:
+        ranges = [
+            ingest_uid_range.s(account_id, split.folder_id, low, high, split.uidvalidity, split.lock_token)
+            for low, high in split.ranges
+        ]
+        header.append(chord(ranges, ingest_split_folder.s(account_id, split.folder_id, split.lock_token)))
+    if not header:
+        return 0
+    return self.replace(chord(header, sum_ingested.s()))
+
+
+@shared_task(bind=True, max_retries=None)
+def ingest_folders(self, account_id: int, folder_ids: list[int]) -> int:
+    """Sync a folder group, retrying later while the account has no free connection slot."""
+    # Local import keeps service modules out of task import paths for FastAPI startup.
+    from app.core.config import settings
+    from app.services.ingest import ingest_folders_service
+    from app.services.locks import ConnectionSlotsExhausted
+
+    try:
+        return ingest_folders_service(account_id, folder_ids)
+    except ConnectionSlotsExhausted as exc:
+        raise self.retry(exc=exc, countdown=settings.ingest_slot_retry_seconds)
+
+
+@shared_task(bind=True, max_retries=None)
+def ingest_uid_range(
+    self, account_id: int, folder_id: int, low: int, high: int, uidvalidity: int | None, lock_token: str
+) -> int:
+    """Fetch one UID range of a split folder, retrying later while no connection slot is free."""
+    # Local import keeps service modules out of task import paths for FastAPI startup.
+    from app.core.config import settings
+    from app.services.ingest import ingest_uid_range_service
+    from app.services.locks import ConnectionSlotsExhausted
+
+    try:
+        return ingest_uid_range_service(account_id, folder_id, low, high, uidvalidity, lock_token)
+    except ConnectionSlotsExhausted as exc:
+        raise self.retry(exc=exc, countdown=settings.ingest_slot_retry_seconds)
+
+
+@shared_task(bind=True, max_retries=None)
+def ingest_split_folder(self, range_counts: list[int], account_id: int, folder_id: int, lock_token: str) -> int:
+    """Run a split folder's regular sync once its ranges are stored; returns the folder's total."""
+    # Local import keeps service modules out of task import paths for FastAPI startup.
+    from app.core.config import settings
+    from app.services.ingest import ingest_split_folder_service
+    from app.services.locks import ConnectionSlotsExhausted
+
+    try:
+        return sum(range_counts) + ingest_split_folder_service(account_id, folder_id, lock_token)
+    except ConnectionSlotsExhausted as exc:
+        raise self.retry(exc=exc, countdown=settings.ingest_slot_retry_seconds)
 
 
 @shared_task
-def ingest_account(account_id: int) -> int:
+def fetch_message_body(message_id: int) -> bool:
     # Local import keeps service modules out of task import paths for FastAPI startup.
-    from app.services.ingest import ingest_account_service
+    from app.services.ingest import fetch_deferred_body_service
 
-    return ingest_account_service(account_id)
+    return fetch_deferred_body_service(message_id)
 
 
 @shared_task
-def embed_message(message_id: int) -> int:
+def sum_ingested(counts: list[int]) -> int:
+    return sum(counts)
+
+
+@shared_task(bind=True, max_retries=None)
+def embed_message(self, message_id: int) -> int:
     # Local import keeps service modules out of task import paths for FastAPI startup.
+    from app.core.config import settings
+    from app.providers.base import ProviderUnavailable
     from app.services.embedding import embed_message_service
 
-    return embed_message_service(message_id)
+    try:
+        return embed_message_service(message_id)
+    except ProviderUnavailable as exc:
+        if not exc.retryable:
+            raise
+        raise self.retry(exc=exc, countdown=exc.retry_after or settings.llm_circuit_open_seconds)
+
+
+@shared_task(bind=True, max_retries=None)
+def embed_messages(self, message_ids: list[int]) -> int:
+    """Embed a batch; while the provider is down or its circuit is open the task waits and retries."""
+    # Local import keeps service modules out of task import paths for FastAPI startup.
+    from app.core.config import settings
+    from app.providers.base import ProviderUnavailable
+    from app.services.embedding import embed_messages_service
+
+    try:
+        return embed_messages_service(message_ids)
+    except ProviderUnavailable as exc:
+        if not exc.retryable:
+            raise
+        raise self.retry(exc=exc, countdown=exc.retry_after or settings.llm_circuit_open_seconds)
@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+import base64
+import binascii
+import quopri
+from dataclasses import dataclass
+from typing import Any, Iterator, List
+
+
+@dataclass(frozen=True)
+class TextPart:
+    section: str
+    subtype: str
+    charset: str
+    encoding: str
+    size: int
+
+
+def _text(value: Any) -> str:
+    if isinstance(value, bytes):
+        return value.decode("ascii", errors="replace")
+    return str(value or "")
+
+
+def _params(value: Any) -> dict[str, str]:
+    if not isinstance(value, tuple):
+        return {}
+    items = list(value)
+    return {_text(key).lower(): _text(val) for key, val in zip(items[::2], items[1::2])}
+
+
+def _disposition_index(part: tuple) -> int:
+    # RFC 3501 body-type-1part: seven basic fields, then type-specific fields
+    # (text: lines; message/rfc822: envelope, body, lines), then MD5 and the
+    # disposition.
+    body_type = _text(part[0]).lower()
+    if body_type == "text":
+        return 9
+    if body_type == "message" and _text(part[1]).lower() == "rfc822":
+        return 11
+    return 8
+
+
+def _disposition(part: tuple) -> str:
+    index = _disposition_index(part)
+    if len(part) <= index:
+        return ""
+    value = part[index]
+    if isinstance(value, tuple) and value:
+        return _text(value[0]).lower()
+    return ""
+
+
+def _walk(structure: Any, prefix: str) -> Iterator[tuple[str, tuple]]:
+    if isinstance(structure[0], list):
+        for index, child in enumerate(structure[0], start=1):
+            section = f"{prefix}.{index}" if prefix else str(index)
+            yield from _walk(child, section)
+        return
+    yield prefix or "1", structure
+
+
+def find_text_parts(structure: Any) -> List[TextPart]:
+    """Return the inline text/plain and text/html sections of a BODYSTRUCTURE."""
+    parts: List[TextPart] = []
+    for section, part in _walk(structure, ""):
+        if _text(part[0]).lower() != "text":
+            continue
+        subtype = _text(part[1]).lower()
+        if subtype not in {"plain", "html"} or _disposition(part) == "attachment":
+            continue
+        parts.append(
+            TextPart(
+                section=section,
+                subtype=subtype,
+                charset=_params(part[2]).get("charset") or "utf-8",
+                encoding=_text(part[5]).lower() or "7bit",
+                size=int(part[6] or 0),
+            )
+        )
+    return parts
+
+
+def has_attachments(structure: Any) -> bool:
+    for _, part in _walk(structure, ""):
+        if _disposition(part) == "attachment" or _text(part[0]).lower() not in {"text", "multipart"}:
+            return True
+    return False
+
+
+def decode_part(payload: bytes, part: TextPart) -> str:
+    """Decode a fetched section; malformed transfer encoding yields the raw text."""
+    try:
+        if part.encoding == "base64":
+            payload = base64.b64decode(payload)
+        elif part.encoding == "quoted-printable":
+            payload = quopri.decodestring(payload)
+    except (binascii.Error, ValueError):
+        pass
+    try:
+        return payload.decode(part.charset, errors="replace")
+    except LookupError:
+        return payload.decode("utf-8", errors="replace")
@@ -37,3 +37,14 @@ def build_embedding_content(
         f"To: {to_line or ''}\n\n"
     )
     return f"{header}Body: {body}"
+
+
+def strip_embedding_header(content: str) -> str:
+    """The body part of ``build_embedding_content`` output."""
+    _, separator, body = content.partition("\n\nBody: ")
+    return body if separator else content
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token) for request budgets."""
+    return len(text) // 4 + 1
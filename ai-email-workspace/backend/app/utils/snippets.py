@@ -0,0 +1,17 @@
+import re
+
+SNIPPET_LENGTH = 200
+
+QUOTED_LINE_RE = re.compile(r"^>.*$", re.MULTILINE)
+WHITESPACE_RE = re.compile(r"\s+")
+
+
+def make_snippet(body_text: str | None) -> str | None:
+    """The list preview: the body with quoted lines dropped and whitespace collapsed.
+
+    Migration 0013 backfills existing rows with the same rules in SQL.
+    """
+    if not body_text:
+        return None
+    text = WHITESPACE_RE.sub(" ", QUOTED_LINE_RE.sub("", body_text)).strip()
+    return text[:SNIPPET_LENGTH].rstrip() or None
@@ -1,11 +1,13 @@
 from __future__ import annotations
 
+from collections import defaultdict
 from datetime import datetime, timezone
-from typing import Iterable
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, Set, Union
 
+from sqlalchemy import exists, func, select, update
 from sqlalchemy.orm import Session
 
-from app.models.models import Message, Thread
+from app.models.models import Embedding, Message, Thread
 from app.utils.subjects import normalize_subject
 
 
@@ -69,3 +71,309 @@ def find_or_create_thread(
 def update_thread_last_date(thread: Thread, sent_at: datetime) -> None:
     if not thread.last_date or sent_at > thread.last_date:
         thread.last_date = sent_at
+
+
+# Message columns the thread aggregates are folded from.
+AGGREGATE_MESSAGE_COLUMNS = (
+    "thread_id",
+    "folder_id",
+    "sent_at",
+    "from_name",
+    "from_email",
+    "to_json",
+    "cc_json",
+    "snippet",
+)
+MAX_THREAD_PARTICIPANTS = 50
+
+
+def empty_thread_aggregates() -> Dict[str, Any]:
+    return {
+        "message_count": 0,
+        "last_date": None,
+        "last_from_name": None,
+        "last_from_email": None,
+        "last_snippet": None,
+        "participants": [],
+        "folder_ids": [],
+    }
+
+
+def fold_thread_aggregates(aggregates: Mapping[str, Any], messages: Iterable[Mapping[str, Any]]) -> Dict[str, Any]:
+    """Add ``messages`` (mappings with ``AGGREGATE_MESSAGE_COLUMNS``) to a thread's aggregates.
+
+    Participants are the alphabetically first ``MAX_THREAD_PARTICIPANTS``
+    addresses, which folds the same way whether messages arrive one batch at
+    a time or all at once.
+    """
+    result = {**empty_thread_aggregates(), **{key: value for key, value in aggregates.items() if value is not None}}
+    participants = set(result["participants"])
+    folder_ids = set(result["folder_ids"])
+    for message in messages:
+        result["message_count"] += 1
+        folder_ids.add(message["folder_id"])
+        participants.update(
+            address.strip().lower()
+            for address in [message["from_email"], *(message["to_json"] or []), *(message["cc_json"] or [])]
+            if address and address.strip()
+        )
+        sent_at = message["sent_at"]
+        if result["last_date"] is None or (sent_at is not None and sent_at >= result["last_date"]):
+            result["last_date"] = sent_at
+            result["last_from_name"] = message["from_name"]
+            result["last_from_email"] = message["from_email"]
+            result["last_snippet"] = message["snippet"]
+    result["participants"] = sorted(participants)[:MAX_THREAD_PARTICIPANTS]
+    result["folder_ids"] = sorted(folder_ids)
+    return result
+
+
+def message_aggregate_row(message: Message) -> Dict[str, Any]:
+    return {column: getattr(message, column) for column in AGGREGATE_MESSAGE_COLUMNS}
+
+
+def add_to_thread_aggregates(db: Session, messages: Iterable[Mapping[str, Any]]) -> None:
+    """Fold newly stored messages into their (existing) threads' aggregates."""
+    by_thread: Dict[int, List[Mapping[str, Any]]] = defaultdict(list)
+    for message in messages:
+        by_thread[message["thread_id"]].append(message)
+    if not by_thread:
+        return
+    columns = [getattr(Thread, key) for key in empty_thread_aggregates()]
+    threads = (
+        db.query(Thread.id, *columns)
+        .filter(Thread.id.in_(list(by_thread)))
+        .order_by(Thread.id)
+        .with_for_update()
+        .all()
+    )
+    rows = []
+    for thread in threads:
+        current = thread._asdict()
+        thread_id = current.pop("id")
+        rows.append({"id": thread_id, **fold_thread_aggregates(current, by_thread[thread_id])})
+    if rows:
+        db.execute(update(Thread), rows)
+
+
+def recompute_thread_aggregates(db: Session, thread_ids: Iterable[int]) -> None:
+    """Recompute thread aggregates from their messages, e.g. after messages moved or were deleted."""
+    thread_ids = list(set(thread_ids))
+    if not thread_ids:
+        return
+    by_thread: Dict[int, List[Mapping[str, Any]]] = defaultdict(list)
+    messages = (
+        db.query(*[getattr(Message, column) for column in AGGREGATE_MESSAGE_COLUMNS])
+        .filter(Message.thread_id.in_(thread_ids))
+        .order_by(Message.thread_id, Message.sent_at, Message.id)
+    )
+    for message in messages:
+        by_thread[message.thread_id].append(message._asdict())
+    rows = [
+        {"id": thread_id, **fold_thread_aggregates(empty_thread_aggregates(), by_thread[thread_id])}
+        for thread_id in sorted(thread_ids)
+    ]
+    db.execute(update(Thread), rows)
+
+
+def thread_id_batches(db: Session, batch_size: int, account_id: int | None = None) -> Iterator[List[int]]:
+    """All thread ids (of one account, if given) in ascending batches."""
+    after = 0
+    while True:
+        query = db.query(Thread.id).filter(Thread.id > after)
+        if account_id is not None:
+            query = query.filter(Thread.account_id == account_id)
+        batch = [row.id for row in query.order_by(Thread.id).limit(batch_size)]
+        if not batch:
+            return
+        yield batch
+        after = batch[-1]
+
+
+def _centroid_values() -> Dict[str, Any]:
+    def over_chunks(aggregate):
+        return (
+            select(aggregate)
+            .select_from(Embedding)
+            .join(Message, Embedding.message_id == Message.id)
+            .where(Message.thread_id == Thread.id, Embedding.vector.isnot(None))
+            .scalar_subquery()
+        )
+
+    return {"centroid": over_chunks(func.avg(Embedding.vector)), "centroid_count": over_chunks(func.count())}
+
+
+def recompute_thread_centroids(db: Session, thread_ids: Iterable[int]) -> None:
+    """Recompute thread centroids from scratch, e.g. after chunks were replaced."""
+    thread_ids = list(set(thread_ids))
+    if not thread_ids:
+        return
+    db.execute(
+        update(Thread).where(Thread.id.in_(thread_ids)).values(**_centroid_values()),
+        execution_options={"synchronize_session": False},
+    )
+
+
+def add_to_thread_centroids(db: Session, vectors_by_thread: Dict[int, List[List[float]]]) -> None:
+    """Fold newly embedded chunks into their threads' running means."""
+    if not vectors_by_thread:
+        return
+    threads = (
+        db.query(Thread.id, Thread.centroid, Thread.centroid_count)
+        .filter(Thread.id.in_(list(vectors_by_thread)))
+        .order_by(Thread.id)
+        .with_for_update()
+        .all()
+    )
+    rows = []
+    for thread in threads:
+        vectors = vectors_by_thread[thread.id]
+        count = thread.centroid_count or 0
+        sums = [sum(values) for values in zip(*vectors)]
+        if thread.centroid is not None and count:
+            sums = [total + mean * count for total, mean in zip(sums, thread.centroid)]
+        else:
+            count = 0
+        new_count = count + len(vectors)
+        rows.append({"id": thread.id, "centroid": [total / new_count for total in sums], "centroid_count": new_count})
+    if rows:
+        db.execute(update(Thread), rows)
+
+
+def refresh_threads(db: Session, thread_ids: Iterable[int]) -> None:
+    """Recompute aggregates and centroids from the remaining messages and drop empty threads."""
+    thread_ids = list(set(thread_ids))
+    if not thread_ids:
+        return
+    recompute_thread_aggregates(db, thread_ids)
+    recompute_thread_centroids(db, thread_ids)
+    db.query(Thread).filter(
+        Thread.id.in_(thread_ids),
+        ~exists().where(Message.thread_id == Thread.id),
+    ).delete(synchronize_session=False)
+
+
+# Either the id of an existing thread or the key of a thread not yet inserted.
+ThreadSlot = Union[int, str]
+
+
+class ThreadResolver:
+    """Batch-scoped index from Message-ID and thread_key to thread.
+
+    ``prefill`` loads everything a batch can refer to with one query per map;
+    ``resolve`` then assigns messages without touching the database, seeing
+    messages resolved earlier in the same batch. Threads are regrouped
+    JWZ-style: a message whose ancestors sit in different threads, or a
+    parent arriving after replies that already formed their own thread,
+    unions those threads, with existing (lowest id) threads surviving.
+    """
+
+    def __init__(self, account_id: int) -> None:
+        self.account_id = account_id
+        self.by_message_id: Dict[str, ThreadSlot] = {}
+        self.by_key: Dict[str, ThreadSlot] = {}
+        self.children: Dict[str, Set[ThreadSlot]] = defaultdict(set)
+        self.new_threads: Dict[str, Dict[str, Any]] = {}
+        self._parent: Dict[ThreadSlot, ThreadSlot] = {}
+
+    def prefill(
+        self,
+        db: Session,
+        message_ids: Iterable[str],
+        references: Iterable[str],
+        thread_keys: Iterable[str],
+    ) -> None:
+        message_ids = set(message_ids)
+        references = set(references)
+        thread_keys = set(thread_keys)
+        # Stored copies of the batch's own messages (e.g. in another folder) too.
+        known = message_ids | references
+        if known:
+            rows = (
+                db.query(Message.message_id_header, Message.thread_id)
+                .filter(Message.account_id == self.account_id, Message.message_id_header.in_(known))
+                .all()
+            )
+            self.by_message_id.update({row.message_id_header: row.thread_id for row in rows})
+        if message_ids:
+            rows = (
+                db.query(Message.in_reply_to, Message.thread_id)
+                .filter(Message.account_id == self.account_id, Message.in_reply_to.in_(message_ids))
+                .all()
+            )
+            for row in rows:
+                self.children[row.in_reply_to].add(row.thread_id)
+        if thread_keys:
+            rows = (
+                db.query(Thread.thread_key, Thread.id)
+                .filter(Thread.account_id == self.account_id, Thread.thread_key.in_(thread_keys))
+                .all()
+            )
+            self.by_key.update({row.thread_key: row.id for row in rows})
+
+    def find(self, slot: ThreadSlot) -> ThreadSlot:
+        root = slot
+        while root in self._parent:
+            root = self._parent[root]
+        while slot != root:
+            next_slot = self._parent[slot]
+            self._parent[slot] = root
+            slot = next_slot
+        return root
+
+    def _union(self, slots: Iterable[ThreadSlot]) -> ThreadSlot | None:
+        roots = {self.find(slot) for slot in slots}
+        if not roots:
+            return None
+        # Existing threads win over new ones, and the oldest existing thread wins.
+        existing = [root for root in roots if isinstance(root, int)]
+        survivor = min(existing) if existing else min(roots)
+        for root in roots:
+            if root != survivor:
+                self._parent[root] = survivor
+        return survivor
+
+    def resolve(
+        self,
+        message_id: str | None,
+        references: List[str],
+        subject: str | None,
+        from_email: str | None,
+        to_emails: Iterable[str],
+        sent_at: datetime,
+    ) -> ThreadSlot:
+        related = [self.by_message_id[ref] for ref in references if ref in self.by_message_id]
+        if message_id:
+            if message_id in self.by_message_id:
+                related.append(self.by_message_id[message_id])
+            related.extend(self.children.get(message_id, ()))
+        slot = self._union(related)
+        if slot is None:
+            thread_key = derive_thread_key(subject, from_email, to_emails, sent_at)
+            slot = self.by_key.get(thread_key)
+            if slot is None:
+                slot = thread_key
+                self.by_key[thread_key] = slot
+                self.new_threads[thread_key] = {
+                    "thread_key": thread_key,
+                    "subject_norm": normalize_subject(subject),
+                }
+            slot = self.find(slot)
+        if message_id:
+            self.by_message_id[message_id] = slot
+        for ref in references:
+            # A referenced message we have not seen yet belongs here too, so
+            # it will join this thread when it arrives later in the batch.
+            self.children[ref].add(slot)
+        return slot
+
+    def merged_threads(self) -> Dict[int, ThreadSlot]:
+        """Existing thread ids that were folded into another thread."""
+        return {
+            slot: self.find(slot)
+            for slot in list(self._parent)
+            if isinstance(slot, int) and self.find(slot) != slot
+        }
+
+    def threads_to_create(self) -> Dict[str, Dict[str, Any]]:
+        return {key: row for key, row in self.new_threads.items() if self.find(key) == key}
@@ -0,0 +1,126 @@
+"""Compare ingest write throughput: per-message flushes vs ``write_messages``.
+
+Run against a scratch database, since it recreates all tables:
+
+    DATABASE_URL=postgresql+psycopg2://... python scripts/bench_message_writer.py 5000
+
+The bulk writer is expected to be at least 10x faster than the per-message path.
+"""
+
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+# When executed as a standalone script, ensure the app package is importable.
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from app.core.config import settings
+from app.models.base import Base
+from app.models.models import Folder, MailAccount, Message, User
+from app.services.auth import hash_password
+from app.services.message_writer import write_messages
+from app.utils.threading import find_or_create_thread, update_thread_last_date
+
+
+def synthetic_items(count: int, prefix: str):
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    items = []
+    for index in range(count):
+        # Every fifth message replies to the one before it.
+        reply_to = f"<{prefix}-{index - 1}@bench>" if index % 5 else None
+        parsed = {
+            "message_id": f"<{prefix}-{index}@bench>",
+            "in_reply_to": reply_to,
+            "references": reply_to,
+            "subject": f"Topic {index // 5}",
+            "sent_at": start + timedelta(minutes=index),
+            "from_email": "sender@example.com",
+            "to": ["me@example.com"],
+            "body_text": "Benchmark body " * 20,
+        }
+        items.append((parsed, {"imap_uid": index + 1}))
+    return items
+
+
+def per_message(db, account_id: int, folder_id: int, items) -> None:
+    for parsed, columns in items:
+        references = [parsed["in_reply_to"]] if parsed["in_reply_to"] else []
+        thread = find_or_create_thread(
+            db,
+            account_id=account_id,
+            subject=parsed["subject"],
+            from_email=parsed["from_email"],
+            to_emails=parsed["to"],
+            sent_at=parsed["sent_at"],
+            references=references,
+        )
+        db.add(
+            Message(
+                account_id=account_id,
+                folder_id=folder_id,
+                thread_id=thread.id,
+                message_id_header=parsed["message_id"],
+                in_reply_to=parsed["in_reply_to"],
+                subject=parsed["subject"],
+                sent_at=parsed["sent_at"],
+                from_email=parsed["from_email"],
+                to_json=parsed["to"],
+                body_text=parsed["body_text"],
+                **columns,
+            )
+        )
+        db.flush()
+        update_thread_last_date(thread, parsed["sent_at"])
+
+
+def bulk(db, account_id: int, folder_id: int, items) -> None:
+    for start in range(0, len(items), settings.ingest_batch_size):
+        write_messages(db, account_id, folder_id, items[start : start + settings.ingest_batch_size])
+
+
+def main() -> None:
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    engine = create_engine(settings.database_url)
+    with engine.connect() as conn:
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
+        conn.commit()
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine)()
+    user = User(email="bench@example.com", password_hash=hash_password("bench"))
+    db.add(user)
+    db.flush()
+    account = MailAccount(
+        user_id=user.id,
+        kind="imap",
+        imap_host="bench",
+        imap_user="bench",
+        imap_password="bench",
+        smtp_host="bench",
+        smtp_user="bench",
+        smtp_password="bench",
+    )
+    db.add(account)
+    db.flush()
+    rates = {}
+    for name, writer in (("per-message", per_message), ("write_messages", bulk)):
+        folder = Folder(account_id=account.id, name=name)
+        db.add(folder)
+        db.flush()
+        items = synthetic_items(count, name)
+        started = time.perf_counter()
+        writer(db, account.id, folder.id, items)
+        db.commit()
+        rates[name] = count / (time.perf_counter() - started)
+        print(f"{name:>15}: {rates[name]:,.0f} messages/sec")
+    print(f"speedup: {rates['write_messages'] / rates['per-message']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
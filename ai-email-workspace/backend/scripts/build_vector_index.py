@@ -0,0 +1,89 @@
+"""Rebuild the embeddings vector index without blocking writes.
+
+    python scripts/build_vector_index.py                 # HNSW, m/ef_construction from settings
+    python scripts/build_vector_index.py --type ivfflat --lists 1000
+
+The new index is built with CREATE INDEX CONCURRENTLY under a temporary
+name and then swapped in for ``ix_embeddings_vector``. Postgres cannot do
+that on a partitioned table, so there each partition's index is built
+concurrently and then attached to an index created ``ON ONLY`` the parent.
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+from sqlalchemy import create_engine
+
+# When executed as a standalone script, ensure the app package is importable.
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from app.core.config import settings
+
+INDEX = "ix_embeddings_vector"
+BUILDING = f"{INDEX}_building"
+
+
+def index_sql(
+    index_type: str, m: int, ef_construction: int, lists: int, name: str = BUILDING, on: str = "embeddings"
+) -> str:
+    if index_type == "hnsw":
+        options = f"m = {m}, ef_construction = {ef_construction}"
+    else:
+        options = f"lists = {lists}"
+    return f"CREATE INDEX CONCURRENTLY {name} ON {on} USING {index_type} (vector vector_cosine_ops) WITH ({options})"
+
+
+def partitions(conn) -> list[str]:
+    return list(
+        conn.exec_driver_sql(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = 'embeddings'::regclass ORDER BY c.relname"
+        ).scalars()
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--type", choices=["hnsw", "ivfflat"], default="hnsw")
+    parser.add_argument("--m", type=int, default=settings.vector_index_m)
+    parser.add_argument("--ef-construction", type=int, default=settings.vector_index_ef_construction)
+    parser.add_argument("--lists", type=int, default=100, help="ivfflat lists (about rows / 1000)")
+    parser.add_argument("--maintenance-work-mem", default="1GB")
+    args = parser.parse_args()
+
+    engine = create_engine(settings.database_url, isolation_level="AUTOCOMMIT")
+    with engine.connect() as conn:
+        conn.exec_driver_sql(f"SET maintenance_work_mem = '{args.maintenance_work_mem}'")
+        names = partitions(conn)
+        if not names:
+            # A failed earlier run leaves an invalid index behind.
+            conn.exec_driver_sql(f"DROP INDEX CONCURRENTLY IF EXISTS {BUILDING}")
+            print(f"Building {args.type} index concurrently...")
+            conn.exec_driver_sql(index_sql(args.type, args.m, args.ef_construction, args.lists))
+            conn.exec_driver_sql(f"DROP INDEX CONCURRENTLY IF EXISTS {INDEX}")
+        else:
+            # Leftovers of a failed earlier run, attached or not.
+            conn.exec_driver_sql(f"DROP INDEX IF EXISTS {BUILDING}")
+            for name in names:
+                conn.exec_driver_sql(f"DROP INDEX CONCURRENTLY IF EXISTS {name}_vector_building")
+                print(f"Building {args.type} index on {name} concurrently...")
+                conn.exec_driver_sql(
+                    index_sql(args.type, args.m, args.ef_construction, args.lists, f"{name}_vector_building", name)
+                )
+            parent = index_sql(args.type, args.m, args.ef_construction, args.lists)
+            conn.exec_driver_sql(parent.replace("CONCURRENTLY ", "").replace(" ON embeddings ", " ON ONLY embeddings "))
+            for name in names:
+                conn.exec_driver_sql(f"ALTER INDEX {BUILDING} ATTACH PARTITION {name}_vector_building")
+            # Dropping the old partitioned index drops its per-partition indexes too.
+            conn.exec_driver_sql(f"DROP INDEX IF EXISTS {INDEX}")
+            for name in names:
+                conn.exec_driver_sql(f"ALTER INDEX {name}_vector_building RENAME TO {name}_vector_idx")
+        conn.exec_driver_sql(f"ALTER INDEX {BUILDING} RENAME TO {INDEX}")
+    print(f"{INDEX} rebuilt")
+
+
+if __name__ == "__main__":
+    main()
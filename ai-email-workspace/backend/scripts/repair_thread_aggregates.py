@@ -0,0 +1,54 @@
+"""Recompute the denormalized thread aggregates from the messages table.
+
+    python scripts/repair_thread_aggregates.py                  # every thread
+    python scripts/repair_thread_aggregates.py --account-id 3 --batch-size 500
+
+Ingest and sending keep the aggregates up to date incrementally; this is
+for repairing them after manual edits or a bug. Each batch of threads is
+committed separately, so the script can be interrupted and rerun. The
+accounts' change counters are bumped at the end, so clients refetch.
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+# When executed as a standalone script, ensure the app package is importable.
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from app.core.config import settings
+from app.models.models import MailAccount
+from app.services.account_versions import bump_account_versions
+from app.utils.threading import recompute_thread_aggregates, thread_id_batches
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--account-id", type=int)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    engine = create_engine(settings.database_url)
+    db = sessionmaker(bind=engine)()
+    total = 0
+    try:
+        for batch in thread_id_batches(db, args.batch_size, args.account_id):
+            recompute_thread_aggregates(db, batch)
+            db.commit()
+            total += len(batch)
+            print(f"Repaired {total} threads (up to id {batch[-1]})")
+        account_ids = [args.account_id] if args.account_id is not None else [row.id for row in db.query(MailAccount.id)]
+        bump_account_versions(db, account_ids)
+        db.commit()
+    finally:
+        db.close()
+    print(f"Thread aggregates repaired for {total} threads")
+
+
+if __name__ == "__main__":
+    main()
@@ -17,7 +17,13 @@ from app.models.models import Embedding, Folder, MailAccount, Message, User
 from app.providers.stub import LocalStubProvider
 from app.services.auth import hash_password
 from app.utils.chunking import build_embedding_content, chunk_body
-from app.utils.threading import find_or_create_thread, update_thread_last_date
+from app.utils.snippets import make_snippet
+from app.utils.threading import (
+    add_to_thread_aggregates,
+    find_or_create_thread,
+    message_aggregate_row,
+    recompute_thread_centroids,
+)
 
 
 def ensure_folder(db, account_id: int, name: str) -> Folder:
@@ -64,11 +70,12 @@ def seed_message(
         sent_at=sent_at,
         from_email=from_email,
         to_json=to_emails,
+        snippet=make_snippet(body_text),
         body_text=body_text,
     )
     db.add(message)
     db.flush()
-    update_thread_last_date(thread, sent_at)
+    add_to_thread_aggregates(db, [message_aggregate_row(message)])
     content_list = [
         build_embedding_content(
             message.subject,
@@ -84,6 +91,7 @@ def seed_message(
     for idx, (content, vector) in enumerate(zip(content_list, vectors)):
         db.add(
             Embedding(
+                account_id=message.account_id,
                 message_id=message.id,
                 model=provider.__class__.__name__,
                 chunk_index=idx,
@@ -91,6 +99,8 @@ def seed_message(
                 vector=vector,
             )
         )
+    db.flush()
+    recompute_thread_centroids(db, [thread.id])
 
 
 def main():
@@ -0,0 +1,34 @@
+import fakeredis
+import pytest
+
+from app.providers import resilience
+from app.services import locks, query_cache
+
+
+@pytest.fixture(autouse=True)
+def fake_redis(monkeypatch):
+    """One in-memory Redis per test for every module that talks to Redis."""
+    client = fakeredis.FakeRedis()
+    for module in (locks, query_cache, resilience):
+        monkeypatch.setattr(module, "get_redis", lambda: client)
+    return client
+
+
+class Result:
+    """Stands in for the result of ``AsyncSession.execute``/``scalars``/``stream``."""
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def all(self):
+        return self.rows
+
+    def first(self):
+        return self.rows[0] if self.rows else None
+
+    def __aiter__(self):
+        async def rows():
+            for row in self.rows:
+                yield row
+
+        return rows()
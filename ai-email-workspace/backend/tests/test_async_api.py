@@ -0,0 +1,131 @@
+import asyncio
+from types import SimpleNamespace
+
+from fastapi.testclient import TestClient
+
+from app.providers.stub import LocalStubProvider
+from app.services.query_cache import QueryCache
+
+from conftest import Result
+
+
+def test_async_database_url_defaults_to_asyncpg(monkeypatch):
+    from app.core import db
+
+    monkeypatch.setattr(db.settings, "async_database_url", "")
+    monkeypatch.setattr(db.settings, "database_url", "postgresql+psycopg2://u:secret@db:5432/inboxia")
+
+    assert db.async_database_url() == "postgresql+asyncpg://u:secret@db:5432/inboxia"
+
+
+def test_concurrent_async_lookups_share_one_computation():
+    cache = QueryCache(lru_size=10)
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return [1.0, 2.0]
+
+    async def run():
+        return await asyncio.gather(*(cache.aget_or_compute("chat:test", 60, compute) for _ in range(5)))
+
+    assert asyncio.run(run()) == [[1.0, 2.0]] * 5
+    assert calls == [1]
+
+
+def test_async_retrieval_awaits_the_provider_and_runs_sql_on_the_session(monkeypatch):
+    from app.services import chat
+
+    class AsyncOnlyProvider(LocalStubProvider):
+        def embed(self, texts):
+            raise AssertionError("blocking embed called from the event loop")
+
+        async def aembed(self, texts):
+            return LocalStubProvider.embed(self, texts)
+
+    monkeypatch.setattr(chat, "get_provider", AsyncOnlyProvider)
+    monkeypatch.setattr(chat, "query_cache", QueryCache(lru_size=0))
+    searched = []
+
+    def search_chunks(db, account_id, clean_query, filters, thread_id, query_vector, top_k):
+        searched.append((db, account_id, clean_query, filters, len(query_vector), top_k))
+        return ["chunk"]
+
+    monkeypatch.setattr(chat, "search_chunks", search_chunks)
+
+    class FakeAsyncSession:
+        async def run_sync(self, fn, *args):
+            return fn("sync-session", *args)
+
+    results = asyncio.run(chat.aretrieve_context(FakeAsyncSession(), 3, "from:alice invoice", top_k=5))
+
+    assert results == ["chunk"]
+    assert searched == [("sync-session", 3, "invoice", {"from": "alice"}, 1536, 5)]
+
+
+def test_read_endpoints_use_the_async_session():
+    from app.core.db import get_async_db
+    from app.main import app
+
+    class FakeAsyncSession:
+        def __init__(self):
+            self.statements = []
+
+        async def scalars(self, statement):
+            self.statements.append(statement)
+            return Result([SimpleNamespace(id=1, name="INBOX")])
+
+    session = FakeAsyncSession()
+    app.dependency_overrides[get_async_db] = lambda: session
+    try:
+        response = TestClient(app).get("/api/folders", params={"account_id": 7})
+    finally:
+        app.dependency_overrides.clear()
+
+    assert response.json() == [{"id": 1, "name": "INBOX"}]
+    assert "folders.account_id" in str(session.statements[0])
+
+
+def test_message_listing_selects_the_summary_columns_only():
+    from app.core.db import get_async_db
+    from app.main import app
+
+    row = SimpleNamespace(
+        id=5,
+        folder_id=1,
+        thread_id=2,
+        subject="Invoice",
+        sent_at=None,
+        from_name="Alice",
+        from_email="alice@example.com",
+        to_json=["bob@example.com"],
+        snippet="Please find the invoice attached.",
+        has_attachments=True,
+    )
+
+    class FakeAsyncSession:
+        def __init__(self):
+            self.statements = []
+
+        async def execute(self, statement):
+            return Result([])
+
+        async def scalars(self, statement):
+            self.statements.append(statement)
+            return Result([row] if len(self.statements) == 1 else [])
+
+    session = FakeAsyncSession()
+    app.dependency_overrides[get_async_db] = lambda: session
+    try:
+        response = TestClient(app).get("/api/messages", params={"account_id": 7})
+    finally:
+        app.dependency_overrides.clear()
+
+    item = response.json()["items"][0]
+    assert item["snippet"] == "Please find the invoice attached."
+    assert "body_text" not in item
+    for statement in session.statements:
+        sql = str(statement)
+        assert "messages.snippet" in sql
+        assert "body_text" not in sql and "raw_rfc822" not in sql and "search_vector" not in sql
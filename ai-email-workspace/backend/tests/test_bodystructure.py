@@ -0,0 +1,79 @@
+from app.utils.bodystructure import TextPart, _disposition, decode_part, find_text_parts, has_attachments
+
+MIXED = (
+    [
+        (
+            [
+                (b"TEXT", b"PLAIN", (b"CHARSET", b"utf-8"), None, None, b"QUOTED-PRINTABLE", 12, 1, None, None, None, None),
+                (b"TEXT", b"HTML", (b"CHARSET", b"utf-8"), None, None, b"BASE64", 40, 1, None, None, None, None),
+            ],
+            b"ALTERNATIVE",
+            (b"BOUNDARY", b"y"),
+            None,
+            None,
+            None,
+        ),
+        (
+            b"APPLICATION",
+            b"PDF",
+            (b"NAME", b"a.pdf"),
+            None,
+            None,
+            b"BASE64",
+            9000,
+            None,
+            (b"ATTACHMENT", (b"FILENAME", b"a.pdf")),
+            None,
+            None,
+        ),
+    ],
+    b"MIXED",
+    (b"BOUNDARY", b"x"),
+    None,
+    None,
+    None,
+)
+
+
+def test_find_text_parts_skips_attachments():
+    parts = find_text_parts(MIXED)
+    assert [(part.section, part.subtype) for part in parts] == [("1.1", "plain"), ("1.2", "html")]
+    assert parts[0].encoding == "quoted-printable"
+    assert has_attachments(MIXED)
+
+
+def test_single_part_message_uses_section_one():
+    structure = (b"TEXT", b"PLAIN", (b"CHARSET", b"us-ascii"), None, None, b"7BIT", 5, 1, None, None, None, None)
+    parts = find_text_parts(structure)
+    assert [part.section for part in parts] == ["1"]
+    assert not has_attachments(structure)
+
+
+def test_decode_part():
+    part = TextPart(section="1", subtype="plain", charset="utf-8", encoding="base64", size=8)
+    assert decode_part(b"aGVsbG8=\r\n", part) == "hello"
+    part = TextPart(section="1", subtype="plain", charset="utf-8", encoding="quoted-printable", size=8)
+    assert decode_part(b"caf=C3=A9", part) == "café"
+
+
+def test_message_rfc822_envelope_is_not_read_as_disposition():
+    envelope = (b"Mon, 1 Jan 2024 00:00:00 +0000", b"Forwarded", None, None, None, None, None, None, None, None)
+    inner = (b"TEXT", b"PLAIN", (b"CHARSET", b"utf-8"), None, None, b"7BIT", 5, 1, None, None, None, None)
+    structure = (
+        [
+            (b"TEXT", b"PLAIN", (b"CHARSET", b"utf-8"), None, None, b"7BIT", 5, 1, None, None, None, None),
+            (b"MESSAGE", b"RFC822", None, None, None, b"7BIT", 500, envelope, inner, 20, None, (b"INLINE", None), None, None),
+        ],
+        b"MIXED",
+        (b"BOUNDARY", b"x"),
+        None,
+        None,
+        None,
+    )
+    assert [part.section for part in find_text_parts(structure)] == ["1"]
+    assert _disposition(structure[0][1]) == "inline"
+
+
+def test_decode_part_tolerates_malformed_base64():
+    part = TextPart(section="1", subtype="plain", charset="utf-8", encoding="base64", size=8)
+    assert decode_part(b"abc", part) == "abc"
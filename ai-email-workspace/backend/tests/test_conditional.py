@@ -0,0 +1,104 @@
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.dialects import postgresql
+from starlette.requests import Request
+
+from app.api.conditional import Validators, is_not_modified
+from app.core.db import get_async_db
+from app.main import app
+from app.services.account_versions import bump_account_versions
+
+from conftest import Result
+
+CHANGED_AT = datetime(2024, 5, 1, 12, 0, 30, 123456, tzinfo=timezone.utc)
+
+
+def _request(**headers):
+    raw = [(name.replace("_", "-").lower().encode(), value.encode()) for name, value in headers.items()]
+    return Request({"type": "http", "method": "GET", "headers": raw})
+
+
+CURRENT = Validators('W/"7-42"', "Wed, 01 May 2024 12:00:30 GMT")
+
+
+@pytest.mark.parametrize(
+    "headers, expected",
+    [
+        ({}, False),
+        ({"if_none_match": 'W/"7-42"'}, True),
+        ({"if_none_match": '"7-42"'}, True),
+        ({"if_none_match": 'W/"7-41", W/"7-42"'}, True),
+        ({"if_none_match": "*"}, True),
+        ({"if_none_match": 'W/"7-41"'}, False),
+        ({"if_modified_since": "Wed, 01 May 2024 12:00:30 GMT"}, True),
+        ({"if_modified_since": "Wed, 01 May 2024 12:00:29 GMT"}, False),
+        ({"if_modified_since": "not a date"}, False),
+        # If-None-Match decides whenever it is present.
+        ({"if_none_match": 'W/"7-41"', "if_modified_since": "Wed, 01 May 2024 12:00:30 GMT"}, False),
+    ],
+)
+def test_conditional_request_matching(headers, expected):
+    assert is_not_modified(_request(**headers), CURRENT) is expected
+
+
+class VersionedSession:
+    """Knows one account at change 42; records every query it is asked to run."""
+
+    def __init__(self):
+        self.statements = []
+
+    async def execute(self, statement):
+        self.statements.append(statement)
+        if statement.selected_columns[0].table.name == "mail_accounts":
+            return Result([SimpleNamespace(id=7, change_counter=42, changed_at=CHANGED_AT)])
+        return Result([])
+
+    async def scalars(self, statement):
+        self.statements.append(statement)
+        return Result([])
+
+
+@pytest.fixture
+def session():
+    session = VersionedSession()
+    app.dependency_overrides[get_async_db] = lambda: session
+    yield session
+    app.dependency_overrides.clear()
+
+
+@pytest.mark.parametrize("path", ["/api/threads?account_id=7", "/api/messages?account_id=7", "/api/thread/3"])
+def test_reads_carry_validators_and_answer_304_from_the_version_alone(session, path):
+    client = TestClient(app)
+
+    first = client.get(path)
+    assert first.status_code == 200
+    assert first.headers["etag"] == 'W/"7-42"'
+    assert first.headers["last-modified"] == "Wed, 01 May 2024 12:00:30 GMT"
+    assert first.headers["cache-control"] == "private, no-cache"
+
+    session.statements.clear()
+    repeat = client.get(path, headers={"If-None-Match": first.headers["etag"]})
+
+    assert repeat.status_code == 304
+    assert repeat.content == b""
+    assert repeat.headers["etag"] == 'W/"7-42"'
+    assert len(session.statements) == 1
+
+
+def test_bump_increments_the_counter_once_per_account():
+    from unittest.mock import MagicMock
+
+    db = MagicMock()
+
+    bump_account_versions(db, [3, 1, 3])
+    bump_account_versions(db, [])
+
+    assert db.execute.call_count == 1
+    statement = db.execute.call_args.args[0]
+    sql = str(statement.compile(dialect=postgresql.dialect()))
+    assert "change_counter=(mail_accounts.change_counter + " in sql
+    assert "changed_at=clock_timestamp()" in sql
+    assert statement.compile().params["id_1"] == [1, 3]
@@ -0,0 +1,57 @@
+from types import SimpleNamespace
+
+from app.services.context_packer import mmr_order, pack_context, strip_quoted
+from app.utils.chunking import build_embedding_content, estimate_tokens, strip_embedding_header
+
+
+def _result(chunk_id, message_id, thread_id, body, vector):
+    content = build_embedding_content("Plan", "2024-01-01", "a@example.com", "b@example.com", body)
+    return (
+        SimpleNamespace(id=chunk_id, content=content, vector=vector),
+        SimpleNamespace(id=message_id, thread_id=thread_id, sent_at=None, from_email="a@example.com", subject="Plan"),
+    )
+
+
+def test_strip_embedding_header_returns_the_body():
+    content = build_embedding_content("Plan", "2024-01-01", "a@example.com", "b@example.com", "Ship it")
+    assert strip_embedding_header(content) == "Ship it"
+
+
+def test_strip_quoted_drops_reply_quotes():
+    body = "Sounds good.\n\nOn Mon, Jan 1, 2024 Alice wrote:\n> Shall we ship?\n> Thanks"
+    assert strip_quoted(body) == "Sounds good."
+
+
+def test_mmr_prefers_distinct_chunks_over_near_duplicates():
+    vectors = [[1.0, 0.0], [0.99, 0.01], [0.0, 1.0]]
+
+    assert mmr_order(vectors, lambda_=1.0) == [0, 1, 2]
+    assert mmr_order(vectors, lambda_=0.5) == [0, 2, 1]
+
+
+def test_pack_context_dedupes_and_caps_threads():
+    results = [
+        _result(1, 10, 100, "Invoice 4711 is due.", [1.0, 0.0]),
+        _result(2, 10, 100, "Second chunk of message 10.", [0.9, 0.1]),
+        _result(3, 11, 100, "Reply in the same thread.", [0.5, 0.5]),
+        _result(4, 12, 100, "Third message of the thread.", [0.4, 0.6]),
+        _result(5, 13, 200, "Invoice 4711 is due.", [0.0, 1.0]),
+        _result(6, 14, 300, "Another thread entirely.", [0.2, 0.8]),
+    ]
+
+    packed = pack_context(results, token_budget=1000, max_per_thread=2, lambda_=0.7)
+
+    assert [chunk.embedding.id for chunk in packed] == [1, 3, 6]
+    assert all("Subject:" not in chunk.text for chunk in packed)
+
+
+def test_pack_context_stays_within_the_token_budget():
+    results = [_result(index, index, index, f"word{index} " * 150, [float(index), 1.0]) for index in range(1, 6)]
+
+    packed = pack_context(results, token_budget=400, max_per_thread=2, lambda_=0.7)
+
+    used = sum(estimate_tokens(f"[Message {c.message.id} | None | From: a@example.com | Subject: Plan]") for c in packed)
+    used += sum(estimate_tokens(chunk.text) for chunk in packed)
+    assert len(packed) == 2
+    assert packed[-1].text.endswith("…")
+    assert used <= 400 + len(packed)
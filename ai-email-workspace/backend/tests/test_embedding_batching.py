@@ -0,0 +1,135 @@
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+from app.providers.base import LLMProvider
+from app.services import embedding
+from app.services.embedding import request_batches
+from app.services.embedding_cache import EmbeddingCache, content_hash
+
+
+class CountingProvider(LLMProvider):
+    def __init__(self):
+        self.requests = []
+
+    def embed(self, texts):
+        self.requests.append(list(texts))
+        return [[float(len(text))] for text in texts]
+
+    def chat(self, prompt):
+        return ""
+
+
+def _message(message_id, body):
+    return SimpleNamespace(
+        id=message_id,
+        account_id=1,
+        thread_id=message_id,
+        subject="Plan",
+        sent_at=datetime(2024, 1, 1, tzinfo=timezone.utc),
+        from_email="a@example.com",
+        to_json=["b@example.com"],
+        body_text=body,
+    )
+
+
+def test_request_batches_respect_item_and_token_budgets():
+    texts = ["a" * 40, "b" * 40, "c" * 40, "d" * 400, "e"]
+
+    assert [(s.start, s.stop) for s in request_batches(texts, max_items=2, max_tokens=1000)] == [
+        (0, 2),
+        (2, 4),
+        (4, 5),
+    ]
+    # An oversized text still gets its own request.
+    assert [(s.start, s.stop) for s in request_batches(texts, max_items=10, max_tokens=50)] == [
+        (0, 3),
+        (3, 4),
+        (4, 5),
+    ]
+
+
+def _db(messages, existing=()):
+    db = MagicMock()
+    db.query.return_value.options.return_value.filter.return_value.order_by.return_value.all.return_value = messages
+    db.query.return_value.filter.return_value.all.return_value = list(existing)
+    return db
+
+
+def _inserted_embeddings(db):
+    return [call.args[1] for call in db.execute.call_args_list if "embeddings" in str(call.args[0])]
+
+
+def test_embed_messages_packs_many_messages_into_one_request(monkeypatch):
+    provider = CountingProvider()
+    monkeypatch.setattr(embedding, "get_provider", lambda: provider)
+    monkeypatch.setattr(embedding, "embedding_cache", EmbeddingCache(lru_size=0))
+    db = _db([_message(1, "first"), _message(2, "second"), _message(3, "third")])
+
+    assert embedding.embed_messages(db, [1, 2, 3]) == 3
+
+    assert len(provider.requests) == 1
+    [rows] = _inserted_embeddings(db)
+    assert [(row["message_id"], row["chunk_index"]) for row in rows] == [(1, 0), (2, 0), (3, 0)]
+    assert rows[1]["vector"] == [float(len(rows[1]["content"]))]
+    db.commit.assert_called_once()
+
+
+def test_embedding_cache_skips_provider_for_known_content(monkeypatch):
+    provider = CountingProvider()
+    monkeypatch.setattr(embedding, "get_provider", lambda: provider)
+    cache = EmbeddingCache(lru_size=100)
+    monkeypatch.setattr(embedding, "embedding_cache", cache)
+
+    # Two copies of the same message only cost one embedding.
+    embedding.embed_messages(_db([_message(1, "same"), _message(2, "same")]), [1, 2])
+    assert sum(len(request) for request in provider.requests) == 1
+
+    # A copy in another folder is served from the in-process cache.
+    db = _db([_message(3, "same")])
+    embedding.embed_messages(db, [3])
+    assert len(provider.requests) == 1
+    assert len(_inserted_embeddings(db)) == 1
+    assert cache.stats.memory_hits == 1
+    assert cache.stats.misses == 1
+
+
+def test_unchanged_chunks_are_not_rewritten(monkeypatch):
+    provider = CountingProvider()
+    monkeypatch.setattr(embedding, "get_provider", lambda: provider)
+    monkeypatch.setattr(embedding, "embedding_cache", EmbeddingCache(lru_size=0))
+    message = _message(1, "body")
+    [content] = embedding.message_contents(message)
+    existing = [
+        SimpleNamespace(id=10, message_id=1, chunk_index=0, model="CountingProvider", content_hash=content_hash(content)),
+    ]
+    db = _db([message], existing)
+
+    assert embedding.embed_messages(db, [1]) == 1
+
+    assert provider.requests == []
+    assert _inserted_embeddings(db) == []
+
+
+def test_aembed_texts_caps_concurrency_and_keeps_input_order(monkeypatch):
+    import asyncio
+
+    monkeypatch.setattr(embedding.settings, "embed_batch_max_items", 1)
+
+    class SlowProvider(CountingProvider):
+        in_flight = 0
+        peak = 0
+
+        async def aembed(self, texts):
+            SlowProvider.in_flight += 1
+            SlowProvider.peak = max(SlowProvider.peak, SlowProvider.in_flight)
+            # Later batches finish first.
+            await asyncio.sleep(0.01 * (10 - len(self.requests)))
+            SlowProvider.in_flight -= 1
+            return self.embed(texts)
+
+    texts = ["x" * length for length in range(1, 9)]
+    vectors = asyncio.run(embedding.aembed_texts(SlowProvider(), texts, concurrency=3))
+
+    assert vectors == [[float(length)] for length in range(1, 9)]
+    assert SlowProvider.peak == 3
@@ -0,0 +1,175 @@
+import asyncio
+import gzip
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import orjson
+import pytest
+from fastapi.testclient import TestClient
+
+from app.api import fast_json, routes
+from app.core.config import settings
+from app.core.db import get_async_db
+from app.main import app
+
+from conftest import Result
+
+UTC_SENT = datetime(2024, 3, 1, 9, 30, 15, 250000, tzinfo=timezone.utc)
+OFFSET_SENT = datetime(2024, 3, 2, 18, 0, tzinfo=timezone(timedelta(hours=2)))
+
+
+def _message(id, sent_at, **extra):
+    return SimpleNamespace(
+        id=id,
+        folder_id=1,
+        thread_id=9,
+        subject="Quarterly numbers" if id % 2 else None,
+        sent_at=sent_at,
+        from_name="Alice" if id % 2 else None,
+        from_email="alice@example.com",
+        to_json=["bob@example.com"] if id % 2 else None,
+        cc_json=None,
+        bcc_json=["audit@example.com"],
+        snippet="Numbers attached" if id % 2 else None,
+        body_text="Ünïcode body\nwith lines",
+        has_attachments=None if id % 2 else True,
+        **extra,
+    )
+
+
+MESSAGES = [_message(3, UTC_SENT), _message(2, OFFSET_SENT), _message(1, None)]
+THREADS = [
+    SimpleNamespace(
+        id=9,
+        subject_norm="quarterly numbers",
+        last_date=UTC_SENT,
+        message_count=3,
+        participants=["alice@example.com", "bob@example.com"],
+        last_from_name="Alice",
+        last_from_email="alice@example.com",
+        last_snippet="Numbers attached",
+        folder_ids=[1, 4],
+    ),
+    SimpleNamespace(
+        id=8,
+        subject_norm="(no subject)",
+        last_date=None,
+        message_count=0,
+        participants=None,
+        last_from_name=None,
+        last_from_email=None,
+        last_snippet=None,
+        folder_ids=None,
+    ),
+]
+
+
+class FakeAsyncSession:
+    async def scalars(self, statement):
+        table = statement.get_final_froms()[0].name
+        # keyset_page: the first query returns the page, the NULL-date query nothing.
+        if "IS NULL" in str(statement):
+            return Result([])
+        return Result(MESSAGES if table == "messages" else THREADS)
+
+    async def execute(self, statement):
+        # No stored account: the routes answer without validators.
+        if statement.selected_columns[0].table.name == "mail_accounts":
+            return Result([])
+        return Result(MESSAGES)
+
+    async def stream(self, statement):
+        return Result(MESSAGES)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(routes, "AsyncSessionLocal", FakeAsyncSession)
+    app.dependency_overrides[get_async_db] = FakeAsyncSession
+    yield TestClient(app)
+    app.dependency_overrides.clear()
+
+
+@pytest.mark.parametrize(
+    "path",
+    [
+        "/api/messages?account_id=1",
+        "/api/threads?account_id=1",
+        "/api/messages/3",
+        "/api/thread/9",
+    ],
+)
+def test_fast_path_matches_the_response_models(client, monkeypatch, path):
+    monkeypatch.setattr(settings, "fast_json_responses", False)
+    validated = client.get(path, headers={"Accept-Encoding": "identity"})
+    monkeypatch.setattr(settings, "fast_json_responses", True)
+    fast = client.get(path, headers={"Accept-Encoding": "identity"})
+
+    assert validated.status_code == fast.status_code == 200
+    assert fast.headers["content-type"] == "application/json"
+    # Same values, same types and the same datetime formatting.
+    assert fast.json() == validated.json()
+    assert list(fast.json()) == list(validated.json())
+
+
+def test_fast_path_compresses_when_the_client_accepts_it(client, monkeypatch):
+    monkeypatch.setattr(settings, "fast_json_responses", True)
+
+    response = client.get("/api/thread/9", headers={"Accept-Encoding": "gzip"})
+
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert [message["id"] for message in response.json()["messages"]] == [3, 2, 1]
+
+
+@pytest.mark.parametrize(
+    "header, expected",
+    [
+        (None, None),
+        ("identity", None),
+        ("gzip, deflate", "gzip"),
+        ("gzip;q=0", None),
+        ("*", "br"),
+        ("br;q=1.0, gzip;q=0.5", "br"),
+    ],
+)
+def test_encoding_negotiation(monkeypatch, header, expected):
+    monkeypatch.setattr(fast_json, "brotli", object())
+
+    assert fast_json.negotiate_encoding(header) == expected
+
+
+def test_brotli_is_skipped_when_not_installed(monkeypatch):
+    monkeypatch.setattr(fast_json, "brotli", None)
+
+    assert fast_json.negotiate_encoding("br") is None
+    assert fast_json.negotiate_encoding("br, gzip") == "gzip"
+
+
+def test_streamed_rows_form_one_json_document_across_chunks(monkeypatch):
+    monkeypatch.setattr(fast_json, "STREAM_CHUNK_BYTES", 64)
+
+    async def rows():
+        for index in range(50):
+            yield {"id": index, "sent_at": UTC_SENT}
+
+    async def collect(chunks):
+        return [chunk async for chunk in chunks]
+
+    def document_chunks():
+        return fast_json.json_array_chunks(b'{"rows":', rows(), b"}")
+
+    chunks = asyncio.run(collect(document_chunks()))
+    compressed = asyncio.run(collect(fast_json._compressed(document_chunks(), fast_json._Compressor("gzip"))))
+    document = orjson.loads(b"".join(chunks))
+
+    assert len(chunks) > 2
+    assert orjson.loads(gzip.decompress(b"".join(compressed))) == document
+    assert [row["id"] for row in document["rows"]] == list(range(50))
+    assert document["rows"][0]["sent_at"] == "2024-03-01T09:30:15.250000Z"
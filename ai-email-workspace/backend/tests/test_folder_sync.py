@@ -0,0 +1,130 @@
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+from app.services import folder_sync, ingest
+
+
+class SyncClient:
+    def __init__(self, status, fetch_result=None, search_result=None):
+        self.status = status
+        self.fetch_result = fetch_result or {}
+        self.search_result = search_result or []
+        self.calls = []
+
+    def select_folder(self, name):
+        self.calls.append("select")
+        return self.status
+
+    def search(self, criteria):
+        self.calls.append(("search", criteria))
+        return list(self.search_result)
+
+    def fetch(self, uids, data, modifiers=None):
+        self.calls.append(("fetch", uids, list(data), modifiers))
+        return self.fetch_result
+
+
+def _folder(**kwargs):
+    values = dict(id=1, name="INBOX", last_uid=10, uidvalidity=5, highestmodseq=100)
+    values.update(kwargs)
+    return SimpleNamespace(**values)
+
+
+def test_unchanged_folder_costs_only_select(monkeypatch):
+    folder = _folder()
+    monkeypatch.setattr(ingest, "count_known_uids", lambda db, folder: 10)
+    monkeypatch.setattr(folder_sync, "count_missing_uids", lambda db, folder: 0)
+    client = SyncClient({b"UIDVALIDITY": 5, b"HIGHESTMODSEQ": 100, b"UIDNEXT": 11, b"EXISTS": 10})
+
+    count = ingest.ingest_folder_messages(MagicMock(), client, SimpleNamespace(id=1, ingest_batch_size=None), folder)
+
+    assert count == 0
+    assert client.calls == ["select"]
+
+
+def test_condstore_fetches_only_changed_flags():
+    db = MagicMock()
+    db.query.return_value.filter.return_value.all.return_value = [
+        SimpleNamespace(id=42, imap_uid=3, flags_json=[]),
+    ]
+    client = SyncClient({}, fetch_result={3: {b"FLAGS": (b"\\Seen",)}})
+
+    changed = folder_sync.sync_flag_changes(db, client, _folder(), 120)
+
+    assert changed == 1
+    assert client.calls == [("fetch", "1:10", [b"FLAGS"], ["CHANGEDSINCE 100"])]
+    assert db.execute.call_args.args[1] == [{"id": 42, "flags_json": ["\\Seen"]}]
+
+
+def test_flag_fallback_fetches_stored_uids_in_pages(monkeypatch):
+    db = MagicMock()
+    db.query.return_value.filter.return_value.all.return_value = []
+    monkeypatch.setattr(folder_sync, "_stored_uid_pages", lambda db, folder, batch_size: iter([[1, 2], [5]]))
+    client = SyncClient({}, fetch_result={1: {b"FLAGS": ()}})
+
+    folder_sync.sync_flag_changes(db, client, _folder(highestmodseq=None), None, batch_size=2)
+
+    assert client.calls == [("fetch", [1, 2], [b"FLAGS"], None), ("fetch", [5], [b"FLAGS"], None)]
+
+
+def test_uidvalidity_reset_remaps_by_message_id_in_pages(monkeypatch):
+    db = MagicMock()
+    db.query.return_value.filter.return_value.all.return_value = [
+        SimpleNamespace(id=1, message_id_header="<a@x>"),
+    ]
+    cleared = []
+    monkeypatch.setattr(folder_sync, "_delete_rows_without_uid", lambda db, folder: cleared.append(folder.id))
+    client = SyncClient({}, search_result=[7, 9])
+    pages = {
+        7: {folder_sync.MESSAGE_ID_FIELD: b"Message-ID: <a@x>\r\n\r\n"},
+        9: {folder_sync.MESSAGE_ID_FIELD: b"Message-ID: <new@x>\r\n\r\n"},
+    }
+    client.fetch = lambda uids, data, modifiers=None: client.calls.append(("fetch", uids)) or {
+        uid: pages[uid] for uid in uids
+    }
+    folder = _folder()
+
+    folder_sync.remap_uidvalidity(db, client, folder, batch_size=1)
+
+    assert ("fetch", [7]) in client.calls and ("fetch", [9]) in client.calls
+    assert db.execute.call_args_list[1].args[1] == [{"id": 1, "imap_uid": 7}]
+    assert cleared == [1]
+    assert folder.last_uid == 8
+    assert folder.highestmodseq is None
+
+
+def test_backfill_attaches_uids_to_legacy_rows(monkeypatch):
+    db = MagicMock()
+    db.query.return_value.filter.return_value.all.return_value = [
+        SimpleNamespace(id=4, message_id_header="<a@x>"),
+    ]
+    monkeypatch.setattr(folder_sync, "count_missing_uids", lambda db, folder: 2)
+    cleared = []
+    monkeypatch.setattr(folder_sync, "_delete_rows_without_uid", lambda db, folder: cleared.append(folder.id))
+    client = SyncClient(
+        {},
+        fetch_result={3: {folder_sync.MESSAGE_ID_FIELD: b"Message-ID: <a@x>\r\n\r\n"}},
+        search_result=[3],
+    )
+
+    assert folder_sync.backfill_missing_uids(db, client, _folder(), batch_size=50) == 2
+    assert client.calls[0] == ("search", ["UID", "1:10"])
+    assert db.execute.call_args.args[1] == [{"id": 4, "imap_uid": 3}]
+    assert cleared == [1]
+
+
+def test_delete_messages_refreshes_their_threads(monkeypatch):
+    db = MagicMock()
+    db.query.return_value.filter.return_value.distinct.return_value.all.return_value = [
+        SimpleNamespace(account_id=1, thread_id=5),
+        SimpleNamespace(account_id=1, thread_id=6),
+    ]
+    refreshed = []
+    bumped = []
+    monkeypatch.setattr(folder_sync, "refresh_threads", lambda db, thread_ids: refreshed.extend(thread_ids))
+    monkeypatch.setattr(folder_sync, "bump_account_versions", lambda db, account_ids: bumped.extend(account_ids))
+
+    folder_sync.delete_messages(db, [1, 2])
+
+    assert refreshed == [5, 6]
+    assert bumped == [1, 1]
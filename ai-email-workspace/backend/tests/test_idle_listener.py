@@ -0,0 +1,213 @@
+import socketserver
+import threading
+from types import SimpleNamespace
+
+import pytest
+from imapclient import IMAPClient
+
+from app.services import idle, locks
+from app.services.idle import FolderWatcher, IdleListener, TooManyWatchers
+
+
+class FakeIMAPHandler(socketserver.StreamRequestHandler):
+    """Just enough IMAP4rev1 for LOGIN, SELECT and IDLE."""
+
+    def send(self, line: str) -> None:
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self) -> None:
+        self.send("* OK [CAPABILITY IMAP4rev1 IDLE] fake server ready")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            tag, command = line.decode().strip().split(" ", 2)[:2]
+            command = command.upper()
+            if command == "CAPABILITY":
+                self.send("* CAPABILITY IMAP4rev1 IDLE")
+                self.send(f"{tag} OK CAPABILITY completed")
+            elif command == "LOGIN":
+                if self.server.reject_login:
+                    self.send(f"{tag} NO [AUTHENTICATIONFAILED] invalid credentials")
+                else:
+                    self.send(f"{tag} OK LOGIN completed")
+            elif command in {"SELECT", "EXAMINE"}:
+                self.send("* 2 EXISTS")
+                self.send("* OK [UIDVALIDITY 1] UIDs valid")
+                self.send(f"{tag} OK [READ-ONLY] {command} completed")
+            elif command == "IDLE":
+                self.send("+ idling")
+                if self.server.pending_mail.is_set():
+                    self.server.pending_mail.clear()
+                    self.send("* 3 EXISTS")
+                self.rfile.readline()  # DONE
+                self.send(f"{tag} OK IDLE terminated")
+            elif command == "LOGOUT":
+                self.send("* BYE")
+                self.send(f"{tag} OK LOGOUT completed")
+                return
+            else:
+                self.send(f"{tag} BAD unsupported")
+
+
+class FakeIMAPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self) -> None:
+        super().__init__(("127.0.0.1", 0), FakeIMAPHandler)
+        self.pending_mail = threading.Event()
+        self.reject_login = False
+
+
+def _account():
+    return SimpleNamespace(id=1, imap_host="127.0.0.1", imap_user="demo", imap_password="demo")
+
+
+def test_watcher_queues_ingest_on_connect_and_new_mail(monkeypatch):
+    monkeypatch.setattr(idle.settings, "idle_check_timeout", 0.2)
+    server = FakeIMAPServer()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_address[1]
+    server.pending_mail.set()
+
+    notified = []
+    done = threading.Event()
+
+    def on_new_mail(account_id, folder_id):
+        notified.append((account_id, folder_id))
+        if len(notified) == 2:
+            done.set()
+
+    watcher = FolderWatcher(
+        _account(),
+        SimpleNamespace(id=5, name="INBOX"),
+        on_new_mail,
+        client_factory=lambda account: IMAPClient(account.imap_host, port=port, ssl=False, timeout=5),
+    )
+    thread = threading.Thread(target=watcher.run, daemon=True)
+    thread.start()
+    try:
+        assert done.wait(5)
+        assert notified == [(1, 5), (1, 5)]
+    finally:
+        watcher.stop()
+        thread.join(5)
+        server.shutdown()
+        server.server_close()
+    assert not thread.is_alive()
+
+
+def test_watcher_reconnects_with_backoff(monkeypatch):
+    monkeypatch.setattr(idle.settings, "idle_backoff_initial", 0.01)
+    attempts = []
+    connected = threading.Event()
+
+    def flaky_factory(account):
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise ConnectionRefusedError("down")
+        connected.set()
+        raise ConnectionRefusedError("still down")
+
+    watcher = FolderWatcher(_account(), SimpleNamespace(id=5, name="INBOX"), lambda a, f: None, flaky_factory)
+    thread = threading.Thread(target=watcher.run, daemon=True)
+    thread.start()
+    try:
+        assert connected.wait(5)
+    finally:
+        watcher.stop()
+        thread.join(5)
+    assert len(attempts) >= 3
+
+
+def test_watcher_keeps_backing_off_when_login_fails(monkeypatch):
+    server = FakeIMAPServer()
+    server.reject_login = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_address[1]
+    delays = []
+    done = threading.Event()
+
+    watcher = FolderWatcher(
+        _account(),
+        SimpleNamespace(id=5, name="INBOX"),
+        lambda a, f: None,
+        client_factory=lambda account: IMAPClient(account.imap_host, port=port, ssl=False, timeout=5),
+    )
+
+    def record_backoff(attempt):
+        delays.append(attempt)
+        if len(delays) == 3:
+            done.set()
+        return 0.01
+
+    monkeypatch.setattr(watcher, "_backoff", record_backoff)
+    thread = threading.Thread(target=watcher.run, daemon=True)
+    thread.start()
+    try:
+        assert done.wait(5)
+    finally:
+        watcher.stop()
+        thread.join(5)
+        server.shutdown()
+        server.server_close()
+    # The TCP connect succeeds every time, but the backoff must keep growing.
+    assert delays[:3] == [0, 1, 2]
+
+
+def test_watcher_waits_for_a_free_account_slot(monkeypatch):
+    monkeypatch.setattr(idle.settings, "ingest_max_connections_per_account", 2)
+    monkeypatch.setattr(idle.settings, "idle_reserved_ingest_connections", 1)
+    monkeypatch.setattr(idle.settings, "ingest_slot_retry_seconds", 0.01)
+    token = locks.AccountConnectionSlots(1).acquire()
+    connected = threading.Event()
+
+    def factory(account):
+        connected.set()
+        raise ConnectionRefusedError("down")
+
+    watcher = FolderWatcher(_account(), SimpleNamespace(id=5, name="INBOX"), lambda a, f: None, factory)
+    thread = threading.Thread(target=watcher.run, daemon=True)
+    thread.start()
+    try:
+        assert not connected.wait(0.2)
+        locks.AccountConnectionSlots(1).release(token)
+        assert connected.wait(5)
+    finally:
+        watcher.stop()
+        thread.join(5)
+
+
+def test_watchers_leave_the_reserved_slots_to_ingest(monkeypatch):
+    monkeypatch.setattr(idle.settings, "ingest_max_connections_per_account", 2)
+    monkeypatch.setattr(idle.settings, "idle_reserved_ingest_connections", 1)
+    idle_slots = locks.AccountConnectionSlots(1, limit=idle.idle_slot_limit())
+
+    assert idle_slots.acquire() is not None
+    assert idle_slots.acquire() is None
+    with locks.AccountConnectionSlots(1).hold() as ingest_slot:
+        assert ingest_slot is not None
+
+
+def test_listener_refuses_more_folders_than_connections(monkeypatch):
+    monkeypatch.setattr(idle.settings, "idle_max_connections", 1)
+    watched = [(_account(), SimpleNamespace(id=5, name="INBOX")), (_account(), SimpleNamespace(id=6, name="Sent"))]
+
+    with pytest.raises(TooManyWatchers):
+        IdleListener(watched).start()
+
+
+def test_queue_folder_ingest_coalesces_until_the_sync_starts(monkeypatch):
+    from app.tasks import jobs
+
+    queued = []
+    monkeypatch.setattr(jobs.ingest_folders, "delay", lambda account_id, folder_ids: queued.append(folder_ids))
+
+    idle._queue_folder_ingest(1, 5)
+    idle._queue_folder_ingest(1, 5)
+    assert queued == [[5]]
+
+    locks.clear_ingest_pending(5)
+    idle._queue_folder_ingest(1, 5)
+    assert queued == [[5], [5]]
@@ -0,0 +1,256 @@
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+from app.services import folder_sync, ingest
+from app.tasks import jobs
+
+
+class FakeIMAPClient:
+    def __init__(self, uids):
+        self.uids = uids
+        self.fetched = []
+
+    def select_folder(self, name):
+        return {}
+
+    def search(self, criteria):
+        return list(self.uids)
+
+    def fetch(self, uids, data):
+        self.fetched.append(list(uids))
+        return {uid: {b"RFC822": f"Subject: {uid}\r\n\r\nbody".encode()} for uid in uids}
+
+
+def test_ingest_folder_commits_per_uid_window(monkeypatch):
+    db = MagicMock()
+    folder = SimpleNamespace(id=1, name="INBOX", last_uid=0, uidvalidity=None, highestmodseq=None)
+    account = SimpleNamespace(id=1, ingest_batch_size=2)
+    checkpoints = []
+    db.commit.side_effect = lambda: checkpoints.append(folder.last_uid)
+
+    monkeypatch.setattr(
+        ingest,
+        "write_messages",
+        lambda db, account_id, folder_id, items: [columns["imap_uid"] for _, columns in items],
+    )
+    monkeypatch.setattr(jobs.embed_messages, "delay", lambda message_ids: None)
+
+    client = FakeIMAPClient([5, 1, 3, 7, 9])
+    count = ingest.ingest_folder_messages(db, client, account, folder)
+
+    assert count == 5
+    assert client.fetched == [[1, 3], [5, 7], [9]]
+    assert checkpoints == [0, 3, 7, 9, 9]
+
+
+def test_ingest_folder_skips_already_seen_uid(monkeypatch):
+    db = MagicMock()
+    folder = SimpleNamespace(id=1, name="INBOX", last_uid=9, uidvalidity=None, highestmodseq=None)
+    account = SimpleNamespace(id=1, ingest_batch_size=None)
+    monkeypatch.setattr(ingest.settings, "ingest_flag_sync_fallback", False)
+    monkeypatch.setattr(folder_sync, "count_missing_uids", lambda db, folder: 0)
+    monkeypatch.setattr(jobs.embed_messages, "delay", lambda message_ids: None)
+
+    # IMAP returns the highest existing UID for "10:*" when nothing is new.
+    client = FakeIMAPClient([9])
+    assert ingest.ingest_folder_messages(db, client, account, folder) == 0
+    assert client.fetched == []
+
+
+def test_headers_first_fetches_only_text_sections(monkeypatch):
+    db = MagicMock()
+    folder = SimpleNamespace(id=1, name="INBOX", last_uid=0, uidvalidity=None, highestmodseq=None)
+    account = SimpleNamespace(id=1, ingest_batch_size=None)
+    monkeypatch.setattr(ingest.settings, "ingest_mode", "headers_first")
+    monkeypatch.setattr(jobs.embed_messages, "delay", lambda message_ids: None)
+    messages = {}
+
+    def fake_write(db, account_id, folder_id, items):
+        for parsed, columns in items:
+            messages[columns["imap_uid"]] = parsed
+        return list(messages)
+
+    monkeypatch.setattr(ingest, "write_messages", fake_write)
+    structure = (b"TEXT", b"PLAIN", (b"CHARSET", b"utf-8"), None, None, b"7BIT", 5, 1, None, None, None, None)
+    requests = []
+
+    class HeaderClient(FakeIMAPClient):
+        def fetch(self, uids, data):
+            requests.append(list(data))
+            if b"BODYSTRUCTURE" in data:
+                return {
+                    uid: {
+                        b"BODY[HEADER]": b"Subject: Hi\r\n\r\n",
+                        b"RFC822.SIZE": 100,
+                        b"BODYSTRUCTURE": structure,
+                    }
+                    for uid in uids
+                }
+            return {uid: {b"BODY[1]": b"hello"} for uid in uids}
+
+    count = ingest.ingest_folder_messages(db, HeaderClient([1, 2]), account, folder)
+
+    assert count == 2
+    assert requests[1] == [b"BODY.PEEK[1]"]
+    assert b"RFC822" not in requests[0]
+    assert messages[1]["body_text"] == "hello"
+    assert messages[2]["subject"] == "Hi"
+
+
+def test_headers_first_marks_oversized_text_as_deferred(monkeypatch):
+    folder = SimpleNamespace(id=1, name="INBOX", last_uid=0, uidvalidity=None, highestmodseq=None)
+    monkeypatch.setattr(ingest.settings, "ingest_mode", "headers_first")
+    monkeypatch.setattr(ingest.settings, "ingest_max_text_part_bytes", 4)
+    monkeypatch.setattr(jobs.embed_messages, "delay", lambda message_ids: None)
+    written = []
+    monkeypatch.setattr(
+        ingest, "write_messages", lambda db, account_id, folder_id, items: written.extend(items) or [1]
+    )
+    structure = (b"TEXT", b"PLAIN", (b"CHARSET", b"utf-8"), None, None, b"7BIT", 5, 1, None, None, None, None)
+    requests = []
+
+    class HeaderClient(FakeIMAPClient):
+        def fetch(self, uids, data):
+            requests.append(list(data))
+            return {
+                uid: {b"BODY[HEADER]": b"Subject: Hi\r\n\r\n", b"RFC822.SIZE": 100, b"BODYSTRUCTURE": structure}
+                for uid in uids
+            }
+
+    ingest.ingest_folder_messages(MagicMock(), HeaderClient([1]), SimpleNamespace(id=1, ingest_batch_size=None), folder)
+
+    assert len(requests) == 1
+    assert written[0][1]["body_deferred"] is True
+
+
+def test_fetch_deferred_body_queues_reembedding(monkeypatch):
+    message = SimpleNamespace(
+        id=7, account_id=1, folder_id=2, thread_id=3, imap_uid=11, body_deferred=True,
+        snippet="", body_text="", body_html=None,
+    )
+    account = SimpleNamespace(id=1, imap_host="imap.test", imap_user="u", imap_password="p")
+    folder = SimpleNamespace(id=2, name="INBOX")
+    db = MagicMock()
+    db.query.return_value.filter.return_value.first.side_effect = [message, account, folder]
+    structure = (b"TEXT", b"PLAIN", (b"CHARSET", b"utf-8"), None, None, b"7BIT", 5, 1, None, None, None, None)
+
+    class BodyClient:
+        def __init__(self, host):
+            pass
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+        def select_folder(self, name, readonly=False):
+            return {}
+
+        def fetch(self, uids, data):
+            if b"BODYSTRUCTURE" in data:
+                return {11: {b"BODYSTRUCTURE": structure}}
+            return {11: {b"BODY[1]": b"hello"}}
+
+    queued = []
+    monkeypatch.setattr(ingest, "IMAPClient", BodyClient)
+    monkeypatch.setattr(ingest, "_login", lambda client, account: None)
+    monkeypatch.setattr(ingest, "recompute_thread_aggregates", lambda db, thread_ids: None)
+    monkeypatch.setattr(ingest, "bump_account_versions", lambda db, account_ids: None)
+    monkeypatch.setattr(jobs.embed_messages, "delay", queued.append)
+    db.commit.side_effect = lambda: queued.append("commit")
+
+    assert ingest.fetch_deferred_body(db, 7) is True
+    assert message.body_text == "hello"
+    assert queued == ["commit", [7]]
+
+
+def test_large_folders_are_planned_as_locked_uid_ranges(monkeypatch):
+    from app.services import locks
+
+    monkeypatch.setattr(ingest.settings, "ingest_uid_range_size", 3)
+    monkeypatch.setattr(ingest.settings, "ingest_max_connections_per_account", 4)
+    small = SimpleNamespace(id=1, name="Drafts", last_uid=0, uidvalidity=None)
+    large = SimpleNamespace(id=2, name="INBOX", last_uid=2, uidvalidity=5)
+    synced = SimpleNamespace(id=3, name="Archive", last_uid=9, uidvalidity=5)
+    uids = {"Drafts": [1, 2], "INBOX": [1, 2, 3, 4, 6, 7, 8, 10], "Archive": [8, 9]}
+
+    class PlanClient(FakeIMAPClient):
+        def __init__(self, host):
+            self.selected = None
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+        def folder_status(self, name, what):
+            return {b"MESSAGES": len(uids[name]) + (10 if name == "Archive" else 0), b"UIDVALIDITY": 5}
+
+        def select_folder(self, name, readonly=False):
+            self.selected = name
+            return {}
+
+        def search(self, criteria):
+            return uids[self.selected]
+
+    db = MagicMock()
+    monkeypatch.setattr(ingest, "IMAPClient", PlanClient)
+    monkeypatch.setattr(ingest, "_login", lambda client, account: None)
+    monkeypatch.setattr(ingest, "_list_folder_names", lambda client: list(uids))
+    monkeypatch.setattr(ingest, "_ensure_folders", lambda db, account_id, names: [small, large, synced])
+
+    plan = ingest.plan_account_ingest(db, 7)
+
+    assert plan.folder_groups == [[1], [3]]
+    [split] = plan.split_folders
+    assert (split.folder_id, split.uidvalidity, split.ranges) == (2, 5, [(3, 6), (7, 10)])
+    assert not locks.FolderLock(2).acquire()
+    assert locks.FolderLock(2, token=split.lock_token).refresh()
+
+
+def test_uid_range_ingest_stores_new_messages_only(monkeypatch):
+    from app.services import locks
+
+    account = SimpleNamespace(id=7, imap_host="imap.test", ingest_batch_size=2)
+    folder = SimpleNamespace(id=2, name="INBOX", last_uid=2)
+    db = MagicMock()
+    db.query.return_value.filter.return_value.first.side_effect = [account, folder]
+    queued = []
+    written = []
+
+    class RangeClient(FakeIMAPClient):
+        def __init__(self, host):
+            super().__init__([3, 4, 6, 11])
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+        def select_folder(self, name, readonly=False):
+            assert readonly
+            return {b"UIDVALIDITY": 5}
+
+    monkeypatch.setattr(ingest, "IMAPClient", RangeClient)
+    monkeypatch.setattr(ingest, "_login", lambda client, account: None)
+    monkeypatch.setattr(ingest, "_known_uids", lambda db, folder, batch: {4})
+    monkeypatch.setattr(
+        ingest,
+        "write_messages",
+        lambda db, account_id, folder_id, items: written.extend(c["imap_uid"] for _, c in items) or [1] * len(items),
+    )
+    monkeypatch.setattr(jobs.embed_messages, "delay", queued.append)
+    lock = locks.FolderLock(2)
+    lock.acquire()
+
+    count = ingest.ingest_uid_range_messages(db, 7, 2, 3, 6, 5, lock.token)
+
+    assert count == 2
+    assert written == [3, 6]
+    assert folder.last_uid == 2
+    # UIDVALIDITY changed since planning: the regular sync remaps instead.
+    db.query.return_value.filter.return_value.first.side_effect = [account, folder]
+    assert ingest.ingest_uid_range_messages(db, 7, 2, 3, 6, 6, lock.token) == 0
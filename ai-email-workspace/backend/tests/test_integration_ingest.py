@@ -1,4 +1,5 @@
 import os
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
 
 import pytest
@@ -6,16 +7,21 @@ from sqlalchemy import create_engine, text
 from sqlalchemy.orm import sessionmaker
 
 from app.models.base import Base
-from app.models.models import MailAccount, User
+from app.models.models import Folder, MailAccount, Message, Thread, User
 from app.services.ingest_fixture import ingest_fixture_dir
 from app.services.auth import hash_password
+from app.services.message_writer import write_messages
 
-
-@pytest.mark.skipif(
+pytestmark = pytest.mark.skipif(
     os.getenv("RUN_INTEGRATION_TESTS") != "1",
     reason="Integration tests disabled unless RUN_INTEGRATION_TESTS=1",
 )
-def test_fixture_ingest():
+
+NOW = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def db():
     database_url = os.getenv("DATABASE_URL")
     assert database_url, "DATABASE_URL required"
     engine = create_engine(database_url)
@@ -26,7 +32,15 @@ def test_fixture_ingest():
     Base.metadata.create_all(engine)
 
     SessionLocal = sessionmaker(bind=engine)
-    db = SessionLocal()
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+        engine.dispose()
+
+
+def _account(db):
     user = User(email="demo@example.com", password_hash=hash_password("password"))
     db.add(user)
     db.flush()
@@ -42,7 +56,73 @@ def test_fixture_ingest():
     )
     db.add(account)
     db.commit()
+    return account
+
 
+def _folder(db, account, name):
+    folder = Folder(account_id=account.id, name=name)
+    db.add(folder)
+    db.flush()
+    return folder
+
+
+def _item(message_id, subject, sent_at, uid, in_reply_to=None):
+    parsed = {
+        "message_id": message_id,
+        "in_reply_to": in_reply_to,
+        "references": None,
+        "subject": subject,
+        "sent_at": sent_at,
+        "from_email": "a@example.com",
+        "to": ["b@example.com"],
+        "body_text": "body",
+    }
+    return parsed, {"imap_uid": uid}
+
+
+def test_fixture_ingest(db):
+    account = _account(db)
     fixture_dir = Path(__file__).parent / "fixtures"
     count = ingest_fixture_dir(db, account.id, "Inbox", fixture_dir)
     assert count == 2
+
+
+def test_write_messages_threads_replies_and_is_idempotent(db):
+    account = _account(db)
+    inbox = _folder(db, account, "INBOX")
+    first_batch = [
+        _item("<reply@x>", "Re: Plan", NOW + timedelta(hours=1), 2, in_reply_to="<root@x>"),
+        _item("<root@x>", "Plan", NOW, 1),
+    ]
+    assert len(write_messages(db, account.id, inbox.id, first_batch)) == 2
+    db.commit()
+
+    threads = db.query(Thread).all()
+    assert len(threads) == 1
+    assert threads[0].last_date == NOW + timedelta(hours=1)
+
+    # A later reply bumps the existing thread.
+    later = [_item("<late@x>", "Re: Plan", NOW + timedelta(days=1), 3, in_reply_to="<reply@x>")]
+    assert len(write_messages(db, account.id, inbox.id, later)) == 1
+    db.commit()
+    db.expire_all()
+    assert db.query(Thread).one().last_date == NOW + timedelta(days=1)
+
+    # Re-running the same batches inserts nothing.
+    assert write_messages(db, account.id, inbox.id, first_batch + later) == []
+    db.commit()
+    assert db.query(Message).count() == 3
+
+
+def test_write_messages_keeps_copies_in_other_folders(db):
+    account = _account(db)
+    inbox = _folder(db, account, "INBOX")
+    archive = _folder(db, account, "Archive")
+
+    write_messages(db, account.id, inbox.id, [_item("<root@x>", "Plan", NOW, 7)])
+    write_messages(db, account.id, archive.id, [_item("<root@x>", "Plan", NOW, 1)])
+    db.commit()
+
+    rows = db.query(Message.folder_id, Message.thread_id).order_by(Message.folder_id).all()
+    assert [row.folder_id for row in rows] == [inbox.id, archive.id]
+    assert len({row.thread_id for row in rows}) == 1
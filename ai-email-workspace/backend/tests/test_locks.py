@@ -0,0 +1,100 @@
+import pytest
+
+from app.services import locks
+
+
+def test_connection_slots_cap_holders_across_instances():
+    first = locks.AccountConnectionSlots(1, limit=2)
+    second = locks.AccountConnectionSlots(1, limit=2)
+
+    tokens = [first.acquire(), second.acquire()]
+    assert all(tokens)
+    assert first.acquire() is None
+    assert locks.AccountConnectionSlots(2, limit=2).acquire() is not None
+
+    second.release(tokens[0])
+    assert first.acquire() is not None
+
+
+def test_connection_slots_reclaim_expired_holders(monkeypatch):
+    slots = locks.AccountConnectionSlots(1, limit=1, ttl=10)
+    now = [1_000_000]
+    monkeypatch.setattr(locks, "_now_ms", lambda: now[0])
+
+    token = slots.acquire()
+    assert slots.acquire() is None
+    now[0] += 5_000
+    assert slots.refresh(token)
+    now[0] += 8_000
+    assert slots.acquire() is None
+    now[0] += 5_000
+    assert slots.acquire() is not None
+
+
+def test_hold_raises_when_no_slot_is_free():
+    slots = locks.AccountConnectionSlots(1, limit=1)
+    with slots.hold():
+        with pytest.raises(locks.ConnectionSlotsExhausted):
+            with slots.hold():
+                pass
+    with slots.hold():
+        pass
+
+
+def test_folder_lock_is_exclusive_and_released():
+    with locks.folder_lock(5) as lock:
+        assert lock is not None
+
+
+def test_folder_lock_is_handed_over_by_token():
+    planned = locks.FolderLock(5)
+    assert planned.acquire()
+
+    with locks.folder_lock(5) as other:
+        assert other is None
+    with locks.folder_lock(5, planned.token) as lock:
+        assert lock is not None
+    with locks.folder_lock(5) as lock:
+        assert lock is not None
+        with locks.folder_lock(5) as other:
+            assert other is None
+        assert lock.refresh()
+    with locks.folder_lock(5) as lock:
+        assert lock is not None
+
+
+def test_ingest_folders_retries_when_slots_are_exhausted(monkeypatch):
+    from celery.exceptions import Retry
+
+    from app.services import ingest
+    from app.tasks import jobs
+    from app.tasks.celery_app import celery_app
+
+    def exhausted(account_id, folder_ids):
+        raise locks.ConnectionSlotsExhausted("busy")
+
+    monkeypatch.setattr(ingest, "ingest_folders_service", exhausted)
+    monkeypatch.setattr(celery_app.conf, "task_always_eager", True)
+    monkeypatch.setattr(celery_app.conf, "task_eager_propagates", True)
+
+    with pytest.raises(Retry):
+        jobs.ingest_folders.apply(args=(7, [1]), throw=True)
+
+
+def test_locked_folder_is_queued_again(monkeypatch):
+    from types import SimpleNamespace
+
+    from app.services import ingest
+    from app.tasks import jobs
+
+    queued = []
+    monkeypatch.setattr(jobs.ingest_folders, "apply_async", lambda args, countdown: queued.append(args))
+    monkeypatch.setattr(ingest, "ingest_folder_messages", lambda *args: 1)
+    slots = locks.AccountConnectionSlots(7)
+    folders = [SimpleNamespace(id=5), SimpleNamespace(id=6)]
+
+    with locks.folder_lock(5):
+        count = ingest._sync_locked_folders(None, None, SimpleNamespace(id=7), folders, slots, slots.acquire())
+
+    assert count == 1
+    assert queued == [(7, [5])]
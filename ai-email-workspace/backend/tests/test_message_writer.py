@@ -0,0 +1,128 @@
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+from app.services import message_writer
+from app.utils.threading import ThreadResolver
+
+NOW = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def _parsed(message_id, subject, sent_at, in_reply_to=None, references=None):
+    return {
+        "message_id": message_id,
+        "in_reply_to": in_reply_to,
+        "references": references,
+        "subject": subject,
+        "sent_at": sent_at,
+        "from_email": "a@example.com",
+        "to": ["b@example.com"],
+    }
+
+
+class FakeDB:
+    """Records the bulk statements ``write_messages`` issues."""
+
+    def __init__(self, message_ids):
+        self.message_ids = message_ids
+        self.thread_rows = []
+        self.message_rows = []
+        self.executed = []
+
+    def execute(self, statement, params=None, **kwargs):
+        self.executed.append(statement)
+        if params is not None and statement.table.name == "threads":
+            self.thread_rows = params
+            result = MagicMock()
+            result.all.return_value = [
+                SimpleNamespace(id=100 + index, thread_key=row["thread_key"]) for index, row in enumerate(params)
+            ]
+            return result
+        return MagicMock()
+
+    def scalars(self, statement, params):
+        self.message_rows = params
+        return iter(self.message_ids[: len(params)])
+
+    def query(self, *args):
+        return MagicMock()
+
+
+def _prefill(existing_threads=None, children=None):
+    def prefill(self, db, message_ids, references, thread_keys):
+        self.by_message_id.update(existing_threads or {})
+        for parent, threads in (children or {}).items():
+            self.children[parent].update(threads)
+
+    return prefill
+
+
+def test_write_messages_resolves_reply_in_batch_and_returns_ids_in_order(monkeypatch):
+    monkeypatch.setattr(message_writer, "_stored_keys", lambda *args: (set(), set()))
+    monkeypatch.setattr(ThreadResolver, "prefill", _prefill())
+    db = FakeDB(message_ids=[11, 12])
+    items = [
+        (_parsed("<reply>", "Re: Plan", NOW + timedelta(hours=1), in_reply_to="<root>"), {"imap_uid": 2}),
+        (_parsed("<root>", "Plan", NOW), {"imap_uid": 1}),
+    ]
+
+    ids = message_writer.write_messages(db, account_id=1, folder_id=3, items=items)
+
+    assert ids == [11, 12]
+    assert len(db.thread_rows) == 1
+    assert db.thread_rows[0]["last_date"] == NOW + timedelta(hours=1)
+    assert db.thread_rows[0]["message_count"] == 2
+    assert db.thread_rows[0]["participants"] == ["a@example.com", "b@example.com"]
+    assert db.thread_rows[0]["folder_ids"] == [3]
+    assert [row["thread_id"] for row in db.message_rows] == [100, 100]
+    assert [row["imap_uid"] for row in db.message_rows] == [2, 1]
+
+
+def test_write_messages_skips_stored_and_repeated_messages(monkeypatch):
+    monkeypatch.setattr(message_writer, "_stored_keys", lambda *args: (set(), {"<old>"}))
+    monkeypatch.setattr(ThreadResolver, "prefill", _prefill())
+    db = FakeDB(message_ids=[21])
+    items = [
+        (_parsed("<old>", "Plan", NOW), {}),
+        (_parsed("<new>", "Plan", NOW), {}),
+        (_parsed("<new>", "Plan", NOW), {}),
+    ]
+
+    assert message_writer.write_messages(db, account_id=1, folder_id=3, items=items) == [21]
+    assert [row["message_id_header"] for row in db.message_rows] == ["<new>"]
+
+
+def test_write_messages_merges_regrouped_threads(monkeypatch):
+    monkeypatch.setattr(message_writer, "_stored_keys", lambda *args: (set(), set()))
+    monkeypatch.setattr(ThreadResolver, "prefill", _prefill(children={"<root>": {5, 9}}))
+    merged = {}
+    monkeypatch.setattr(message_writer, "_merge_threads", lambda db, moves: merged.update(moves))
+    db = FakeDB(message_ids=[31])
+
+    message_writer.write_messages(db, account_id=1, folder_id=3, items=[(_parsed("<root>", "Plan", NOW), {})])
+
+    assert db.thread_rows == []
+    assert db.message_rows[0]["thread_id"] == 5
+    assert merged == {9: 5}
+
+
+def test_write_messages_keys_imap_messages_on_folder_uid(monkeypatch):
+    seen = {}
+
+    def stored_keys(db, folder_id, uids, message_ids):
+        seen.update(folder_id=folder_id, uids=uids, message_ids=message_ids)
+        return {4}, set()
+
+    monkeypatch.setattr(message_writer, "_stored_keys", stored_keys)
+    monkeypatch.setattr(ThreadResolver, "prefill", _prefill())
+    db = FakeDB(message_ids=[41, 42])
+    items = [
+        (_parsed("<dup>", "Plan", NOW), {"imap_uid": 4}),
+        (_parsed("<dup>", "Plan", NOW), {"imap_uid": 5}),
+        (_parsed("<dup>", "Plan", NOW), {"imap_uid": 6}),
+    ]
+
+    assert message_writer.write_messages(db, account_id=1, folder_id=3, items=items) == [41, 42]
+    assert seen == {"folder_id": 3, "uids": [4, 5, 6], "message_ids": []}
+    # Copies with the same Message-ID but their own UID are all kept.
+    assert [row["imap_uid"] for row in db.message_rows] == [5, 6]
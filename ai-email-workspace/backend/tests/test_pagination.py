@@ -0,0 +1,92 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import Column, DateTime, Integer, create_engine, select
+from sqlalchemy.orm import Session, declarative_base
+
+from app.api.pagination import decode_cursor, encode_cursor, keyset_page
+
+Base = declarative_base()
+
+
+class Row(Base):
+    __tablename__ = "rows"
+
+    id = Column(Integer, primary_key=True)
+    day = Column(DateTime)
+
+
+class SyncBackedSession:
+    def __init__(self, session):
+        self.session = session
+
+    async def scalars(self, statement):
+        return self.session.scalars(statement)
+
+
+@pytest.fixture
+def session():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    start = datetime(2024, 1, 1)
+    with Session(engine) as db:
+        # Ties on the date and rows without one must page without gaps or repeats.
+        days = [0, 1, 1, 1, 2, 3, 3, None, 4, None, 5]
+        db.add_all(
+            Row(id=index + 1, day=None if day is None else start + timedelta(days=day))
+            for index, day in enumerate(days)
+        )
+        db.commit()
+        yield db
+
+
+def _all_pages(session, limit):
+    db = SyncBackedSession(session)
+    pages, cursor = [], None
+    while True:
+        after = decode_cursor(cursor) if cursor else None
+        rows, next_cursor = asyncio.run(keyset_page(db, select(Row), Row.day, Row.id, limit, after))
+        pages.append([row.id for row in rows])
+        if next_cursor is None:
+            return pages
+        cursor = next_cursor
+
+
+@pytest.mark.parametrize("limit", [1, 2, 3, 4, 20])
+def test_keyset_pages_cover_every_row_once_newest_first(session, limit):
+    pages = _all_pages(session, limit)
+
+    assert [row_id for page in pages for row_id in page] == [11, 9, 7, 6, 5, 4, 3, 2, 1, 10, 8]
+    assert all(len(page) == limit for page in pages[:-1])
+    assert pages[-1]
+
+
+def test_cursor_round_trip():
+    sent_at = datetime(2024, 5, 1, 12, 30, tzinfo=timezone.utc)
+
+    assert decode_cursor(encode_cursor(sent_at, 42)) == (sent_at, 42)
+    assert decode_cursor(encode_cursor(None, 7)) == (None, 7)
+
+
+@pytest.mark.parametrize("cursor", ["", "not-a-cursor", encode_cursor(None, 1)[:-2]])
+def test_malformed_cursor_is_rejected(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+
+def test_listing_rejects_a_malformed_cursor_and_oversized_pages():
+    from app.core.db import get_async_db
+    from app.main import app
+
+    app.dependency_overrides[get_async_db] = lambda: None
+    try:
+        client = TestClient(app)
+        bad_cursor = client.get("/api/messages", params={"account_id": 1, "cursor": "garbage"})
+        too_large = client.get("/api/threads", params={"account_id": 1, "limit": 10_000})
+    finally:
+        app.dependency_overrides.clear()
+
+    assert bad_cursor.status_code == 400
+    assert too_large.status_code == 422
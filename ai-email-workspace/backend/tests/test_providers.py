@@ -0,0 +1,72 @@
+import httpx
+
+from app.providers import factory
+from app.providers.openai import OpenAIProvider
+
+
+def _configure_openai(monkeypatch):
+    monkeypatch.setattr(factory.settings, "llm_provider", "openai_compatible")
+    monkeypatch.setattr(factory.settings, "openai_chat_model", "chat-model")
+    monkeypatch.setattr(factory.settings, "openai_embedding_model", "embed-model")
+    monkeypatch.setattr(factory.settings, "openai_base_url", "http://llm.test/v1")
+
+
+def test_get_provider_reuses_instance_per_configuration(monkeypatch):
+    monkeypatch.setattr(factory, "_providers", {})
+    _configure_openai(monkeypatch)
+
+    first = factory.get_provider()
+    assert factory.get_provider() is first
+
+    monkeypatch.setattr(factory.settings, "openai_base_url", "http://other.test/v1")
+    second = factory.get_provider()
+    assert second is not first
+
+    factory.close_providers()
+    assert first.inner.client.is_closed and second.inner.client.is_closed
+    assert factory._providers == {}
+
+
+def test_openai_provider_sends_requests_on_its_pooled_client(monkeypatch):
+    _configure_openai(monkeypatch)
+    monkeypatch.setattr(factory.settings, "embed_timeout_seconds", 5.0)
+    monkeypatch.setattr(factory.settings, "chat_timeout_seconds", 60.0)
+    seen = []
+
+    def handler(request):
+        seen.append((request.url.path, request.extensions["timeout"]["read"]))
+        if request.url.path.endswith("/embeddings"):
+            return httpx.Response(200, json={"data": [{"embedding": [0.5]}]})
+        return httpx.Response(200, json={"choices": [{"message": {"content": "hi"}}]})
+
+    provider = OpenAIProvider(client=httpx.Client(transport=httpx.MockTransport(handler)))
+
+    assert provider.embed(["text"]) == [[0.5]]
+    assert provider.chat("prompt") == "hi"
+    assert seen == [("/v1/embeddings", 5.0), ("/v1/chat/completions", 60.0)]
+
+
+def test_openai_provider_async_calls_use_an_async_client(monkeypatch):
+    import asyncio
+
+    from app.providers import openai
+
+    _configure_openai(monkeypatch)
+
+    def handler(request):
+        if request.url.path.endswith("/embeddings"):
+            return httpx.Response(200, json={"data": [{"embedding": [1.0]}, {"embedding": [2.0]}]})
+        return httpx.Response(200, json={"choices": [{"message": {"content": "async hi"}}]})
+
+    monkeypatch.setattr(
+        openai, "build_async_http_client", lambda: httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    )
+    provider = OpenAIProvider(client=httpx.Client(transport=httpx.MockTransport(handler)))
+
+    async def run():
+        try:
+            return await provider.aembed(["a", "b"]), await provider.achat("prompt")
+        finally:
+            await provider.aclose()
+
+    assert asyncio.run(run()) == ([[1.0], [2.0]], "async hi")
@@ -0,0 +1,132 @@
+import threading
+import time
+from datetime import datetime, timezone
+
+import pytest
+import redis
+
+from app.providers.base import LLMProvider
+from app.services import locks, query_cache
+from app.services.query_cache import QueryCache
+
+
+class SlowProvider(LLMProvider):
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.embedded = []
+        self.lock = threading.Lock()
+
+    def embed(self, texts):
+        time.sleep(self.delay)
+        with self.lock:
+            self.embedded.extend(texts)
+        return [[float(len(text)), 1.0] for text in texts]
+
+    def chat(self, prompt):
+        return "answer"
+
+
+def test_query_embeddings_are_shared_by_normalized_text():
+    provider = SlowProvider()
+
+    first = QueryCache(lru_size=10).query_embedding(provider, "  Where is   the Invoice? ")
+    # Another process (no shared LRU) reads it back from Redis.
+    second = QueryCache(lru_size=0).query_embedding(provider, "where is the invoice?")
+
+    assert first == second == [21.0, 1.0]
+    assert provider.embedded == ["where is the invoice?"]
+
+
+def test_lru_evicts_least_recently_used_entries():
+    cache = QueryCache(lru_size=2)
+    for key in ("a", "b", "c"):
+        cache._lru_put(key, key, 60)
+
+    assert cache._lru_get("a") is None
+    assert cache._lru_get("c") == "c"
+
+
+def test_lru_entries_expire_with_their_ttl(monkeypatch, fake_redis):
+    provider = SlowProvider()
+    cache = QueryCache(lru_size=10)
+    now = [1_000.0]
+    monkeypatch.setattr(query_cache.time, "monotonic", lambda: now[0])
+    monkeypatch.setattr(query_cache.settings, "query_embedding_cache_ttl_seconds", 60)
+
+    cache.query_embedding(provider, "invoice")
+    fake_redis.flushall()
+    now[0] += 59
+    cache.query_embedding(provider, "invoice")
+    assert provider.embedded == ["invoice"]
+
+    now[0] += 2
+    cache.query_embedding(provider, "invoice")
+    assert provider.embedded == ["invoice", "invoice"]
+
+
+def test_lru_entries_read_from_redis_keep_the_keys_remaining_ttl(monkeypatch, fake_redis):
+    cache = QueryCache(lru_size=10)
+    now = [1_000.0]
+    monkeypatch.setattr(query_cache.time, "monotonic", lambda: now[0])
+    fake_redis.set("chat:answer:x", '["cached", []]', ex=10)
+
+    assert cache.get_or_compute("chat:answer:x", 3600, lambda: ["fresh", []]) == ["cached", []]
+    now[0] += 11
+    assert cache._lru_get("chat:answer:x") is None
+
+
+def test_concurrent_identical_queries_make_one_provider_call():
+    provider = SlowProvider(delay=0.2)
+    cache = QueryCache(lru_size=10)
+    results = []
+
+    threads = [
+        threading.Thread(target=lambda: results.append(cache.query_embedding(provider, "status?")))
+        for _ in range(5)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert provider.embedded == ["status?"]
+    assert len(results) == 5 and all(result == results[0] for result in results)
+
+
+def test_other_process_waits_for_the_leaders_result(fake_redis):
+    cache = QueryCache(lru_size=0)
+    key = "chat:test"
+    # Another process holds the lock and publishes its result shortly.
+    fake_redis.set(f"{key}:lock", "someone-else")
+    threading.Timer(0.1, lambda: fake_redis.set(key, '"from leader"')).start()
+
+    assert cache.get_or_compute(key, 60, lambda: pytest.fail("computed twice")) == "from leader"
+
+
+def test_answers_are_keyed_by_retrieved_context():
+    provider = SlowProvider()
+    cache = QueryCache(lru_size=10)
+    calls = []
+    sent_at = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+    def compute():
+        calls.append(1)
+        return "answer", [{"message_id": 1, "sent_at": sent_at}]
+
+    first = cache.answer(provider, "Status?", [2, 1], compute)
+    again = cache.answer(provider, "status?", [1, 2], compute)
+    # New mail changes the retrieved chunks and so the key.
+    changed = cache.answer(provider, "status?", [1, 3], compute)
+
+    assert first == again == changed == ("answer", [{"message_id": 1, "sent_at": "2024-01-01T00:00:00+00:00"}])
+    assert len(calls) == 2
+
+
+def test_redis_outage_still_computes(monkeypatch):
+    def down():
+        raise redis.ConnectionError("down")
+
+    monkeypatch.setattr(query_cache, "get_redis", down)
+    monkeypatch.setattr(locks, "get_redis", down)
+
+    assert QueryCache(lru_size=0).get_or_compute("chat:test", 60, lambda: [1.0]) == [1.0]
@@ -0,0 +1,140 @@
+import httpx
+import pytest
+
+from app.providers import resilience
+from app.providers.base import CircuitOpen, LLMProvider, ProviderUnavailable
+from app.providers.openai import OpenAIProvider, parse_retry_after
+
+
+class FlakyProvider(LLMProvider):
+    def __init__(self, failures, retry_after=None, retryable=True):
+        self.failures = failures
+        self.retry_after = retry_after
+        self.retryable = retryable
+        self.calls = 0
+
+    def embed(self, texts):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise ProviderUnavailable("down", retryable=self.retryable, retry_after=self.retry_after)
+        return [[1.0] for _ in texts]
+
+    def chat(self, prompt):
+        return "ok"
+
+
+def _no_sleep(monkeypatch):
+    slept = []
+    monkeypatch.setattr(resilience.time, "sleep", slept.append)
+    return slept
+
+
+def test_token_bucket_charges_requests_and_tokens(monkeypatch):
+    monkeypatch.setattr(resilience.settings, "llm_embed_requests_per_minute", 2)
+    monkeypatch.setattr(resilience.settings, "llm_embed_tokens_per_minute", 600)
+    now = [1_000.0]
+    monkeypatch.setattr(resilience.time, "time", lambda: now[0])
+    limiter = resilience.RateLimiter(resilience.EMBED)
+
+    assert limiter.try_acquire(100) == 0
+    assert limiter.try_acquire(100) == 0
+    # Out of requests: one refills every 30s.
+    assert limiter.try_acquire(100) == pytest.approx(30, abs=0.01)
+    now[0] += 30
+    assert limiter.try_acquire(100) == 0
+    # Tokens refill at 10/s: after spending 500 of 600, another 500 waits 40s.
+    now[0] += 60
+    assert limiter.try_acquire(500) == 0
+    assert limiter.try_acquire(500) == pytest.approx(40, abs=0.01)
+
+
+def test_waiting_chat_makes_embedding_yield(monkeypatch):
+    monkeypatch.setattr(resilience.settings, "llm_chat_requests_per_minute", 1)
+    monkeypatch.setattr(resilience.settings, "llm_embed_requests_per_minute", 100)
+    chat = resilience.RateLimiter(resilience.CHAT)
+    embed = resilience.RateLimiter(resilience.EMBED)
+
+    assert chat.try_acquire(1) == 0
+    assert embed.try_acquire(1) == 0
+    assert chat.try_acquire(1) > 0
+    assert embed.try_acquire(1) == pytest.approx(0.25)
+
+
+def test_retries_with_backoff_and_honors_retry_after(monkeypatch):
+    slept = _no_sleep(monkeypatch)
+    provider = resilience.ResilientProvider(FlakyProvider(failures=2, retry_after=7.0))
+
+    assert provider.embed(["a"]) == [[1.0]]
+    assert provider.inner.calls == 3
+    assert slept == [7.0, 7.0]
+
+
+def test_long_retry_after_is_handed_back_to_the_caller(monkeypatch):
+    slept = _no_sleep(monkeypatch)
+    monkeypatch.setattr(resilience.settings, "llm_retry_backoff_max", 30.0)
+    provider = resilience.ResilientProvider(FlakyProvider(failures=1, retry_after=3600.0))
+
+    with pytest.raises(ProviderUnavailable) as excinfo:
+        provider.embed(["a"])
+    assert excinfo.value.retryable and excinfo.value.retry_after == 3600.0
+    assert provider.inner.calls == 1
+    assert slept == []
+    assert resilience.backoff_delay(0, retry_after=3600.0) == 30.0
+
+
+def test_non_retryable_errors_fail_fast(monkeypatch):
+    slept = _no_sleep(monkeypatch)
+    provider = resilience.ResilientProvider(FlakyProvider(failures=1, retryable=False))
+
+    with pytest.raises(ProviderUnavailable):
+        provider.embed(["a"])
+    assert slept == []
+
+
+def test_circuit_opens_after_repeated_failures(monkeypatch):
+    _no_sleep(monkeypatch)
+    monkeypatch.setattr(resilience.settings, "llm_max_retries", 10)
+    monkeypatch.setattr(resilience.settings, "llm_circuit_failure_threshold", 3)
+    provider = resilience.ResilientProvider(FlakyProvider(failures=100))
+
+    with pytest.raises(CircuitOpen) as excinfo:
+        provider.embed(["a"])
+    assert provider.inner.calls == 3
+    assert excinfo.value.retry_after > 0
+    # Chat has its own circuit.
+    assert provider.chat("hi") == "ok"
+
+
+def test_openai_errors_carry_retry_hints(monkeypatch):
+    monkeypatch.setattr(resilience.settings, "openai_chat_model", "chat-model")
+    monkeypatch.setattr(resilience.settings, "openai_embedding_model", "embed-model")
+    monkeypatch.setattr(resilience.settings, "llm_provider", "openai_compatible")
+    responses = iter([httpx.Response(429, headers={"Retry-After": "3"}), httpx.Response(400)])
+    client = httpx.Client(transport=httpx.MockTransport(lambda request: next(responses)))
+    provider = OpenAIProvider(client=client)
+
+    with pytest.raises(ProviderUnavailable) as throttled:
+        provider.embed(["a"])
+    assert throttled.value.retryable and throttled.value.retry_after == 3.0
+    with pytest.raises(ProviderUnavailable) as rejected:
+        provider.embed(["a"])
+    assert not rejected.value.retryable
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+
+
+def test_embed_task_retries_instead_of_failing(monkeypatch):
+    from celery.exceptions import Retry
+
+    from app.services import embedding
+    from app.tasks import jobs
+    from app.tasks.celery_app import celery_app
+
+    def paused(message_ids):
+        raise CircuitOpen("embed", 42.0)
+
+    monkeypatch.setattr(embedding, "embed_messages_service", paused)
+    monkeypatch.setattr(celery_app.conf, "task_always_eager", True)
+    monkeypatch.setattr(celery_app.conf, "task_eager_propagates", True)
+
+    with pytest.raises(Retry):
+        jobs.embed_messages.apply(args=([1, 2],), throw=True)
@@ -7,3 +7,158 @@ def test_parse_filters():
     assert filters["from"] == "alice"
     assert filters["subject"] == "Update"
     assert filters["before"] == "2024-01-01"
+
+
+def test_vector_search_params_are_transaction_local(monkeypatch):
+    from unittest.mock import MagicMock
+
+    from app.services import chat
+
+    monkeypatch.setattr(chat.settings, "hnsw_ef_search", 40)
+    monkeypatch.setattr(chat.settings, "ivfflat_probes", 10)
+    monkeypatch.setattr(chat.settings, "hnsw_iterative_scan", "strict_order")
+    db = MagicMock()
+
+    chat.set_vector_search_params(db, top_k=100)
+
+    statement, params = db.execute.call_args.args
+    assert "set_config('hnsw.ef_search', :ef_search, true)" in str(statement)
+    assert "set_config('hnsw.iterative_scan', :iterative_scan, true)" in str(statement)
+    assert params == {
+        "ef_search": "100",
+        "probes": "10",
+        "iterative_scan": "strict_order",
+        "ivfflat_iterative_scan": "relaxed_order",
+    }
+
+
+def test_embedding_index_serves_cosine_distance():
+    from sqlalchemy.dialects import postgresql
+    from sqlalchemy.schema import CreateIndex
+
+    from app.models.models import Embedding
+
+    [index] = [index for index in Embedding.__table__.indexes if index.name == "ix_embeddings_vector"]
+    ddl = str(CreateIndex(index).compile(dialect=postgresql.dialect()))
+    assert "USING hnsw (vector vector_cosine_ops)" in ddl
+
+
+def test_embeddings_are_hash_partitioned_by_account():
+    from sqlalchemy.dialects import postgresql
+    from sqlalchemy.schema import CreateTable
+
+    from app.models.models import Embedding, embedding_partition_ddl
+
+    ddl = str(CreateTable(Embedding.__table__).compile(dialect=postgresql.dialect()))
+    assert "PARTITION BY HASH (account_id)" in ddl
+    assert "PRIMARY KEY (id, account_id)" in ddl
+    assert embedding_partition_ddl(4)[3].endswith("FOR VALUES WITH (MODULUS 4, REMAINDER 3)")
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    from app.services.chat import reciprocal_rank_fusion
+
+    lexical = [7, 1, 2]
+    vector = [1, 3, 7]
+    assert reciprocal_rank_fusion([lexical, vector], k=60) == [1, 7, 3, 2]
+
+
+def _stub_retrieval(monkeypatch, provider, message_of=None):
+    from types import SimpleNamespace
+    from unittest.mock import MagicMock
+
+    from app.services import chat
+    from app.services.query_cache import QueryCache
+
+    message_of = message_of or {}
+    calls = {}
+    monkeypatch.setattr(chat, "get_provider", lambda: provider)
+    cache = QueryCache(lru_size=0)
+    monkeypatch.setattr(cache, "get_or_compute", lambda key, ttl, compute: compute())
+    monkeypatch.setattr(chat, "query_cache", cache)
+    monkeypatch.setattr(chat, "_lexical_ids", lambda base, query, limit: calls.setdefault("lexical", [5, 6]))
+    monkeypatch.setattr(chat, "_vector_ids", lambda base, vector, limit: calls.setdefault("vector", [6, 9]))
+    monkeypatch.setattr(
+        chat, "_candidate_threads", lambda db, account_id, vector, limit: calls.setdefault("threads", [])
+    )
+    monkeypatch.setattr(
+        chat,
+        "_load_results",
+        lambda db, account_id, ids: [
+            (SimpleNamespace(id=item), SimpleNamespace(id=message_of.get(item, item))) for item in ids
+        ],
+    )
+    return chat, MagicMock(), calls
+
+
+def _chunk_ids(results):
+    return [embedding.id for embedding, _ in results]
+
+
+def test_retrieval_fuses_lexical_and_vector_rankings(monkeypatch):
+    from app.providers.stub import LocalStubProvider
+
+    chat, db, calls = _stub_retrieval(monkeypatch, LocalStubProvider())
+
+    assert _chunk_ids(chat.retrieve_context(db, 1, "invoice 4711", top_k=2)) == [6, 5]
+    assert set(calls) == {"lexical", "vector", "threads"}
+
+
+def test_retrieval_falls_back_to_full_text_when_provider_is_down(monkeypatch):
+    import pytest
+
+    from app.providers.base import CircuitOpen
+
+    class DownProvider:
+        def embedding_model_id(self):
+            return "down"
+
+        def embed(self, texts):
+            raise CircuitOpen("embed", 30)
+
+    chat, db, calls = _stub_retrieval(monkeypatch, DownProvider())
+
+    assert _chunk_ids(chat.retrieve_context(db, 1, "invoice 4711")) == [5, 6]
+    assert set(calls) == {"lexical"}
+    with pytest.raises(CircuitOpen):
+        chat.retrieve_context(db, 1, "from:alice")
+
+
+def test_lexical_search_uses_the_tsvector_index():
+    from unittest.mock import MagicMock
+
+    from sqlalchemy.dialects import postgresql
+    from sqlalchemy.orm import Query
+
+    from app.models.models import Embedding, Message
+    from app.services import chat
+
+    captured = {}
+
+    class Capture(Query):
+        def all(self):
+            captured["sql"] = str(self.statement.compile(dialect=postgresql.dialect()))
+            return []
+
+    base = Capture([Embedding, Message], session=MagicMock()).join(Message, Embedding.message_id == Message.id)
+    assert chat._lexical_ids(base, "invoice 4711", 10) == []
+    assert "embeddings.search_vector @@ websearch_to_tsquery" in captured["sql"]
+
+
+def test_retrieval_keeps_the_best_chunk_per_message(monkeypatch):
+    from app.providers.stub import LocalStubProvider
+
+    # Chunks 6 and 5 belong to the same message.
+    chat, db, calls = _stub_retrieval(monkeypatch, LocalStubProvider(), message_of={5: 50, 6: 50, 9: 90})
+
+    assert _chunk_ids(chat.retrieve_context(db, 1, "invoice 4711")) == [6, 9]
+
+
+def test_thread_stage_is_skipped_for_filtered_searches(monkeypatch):
+    from app.providers.stub import LocalStubProvider
+
+    chat, db, calls = _stub_retrieval(monkeypatch, LocalStubProvider())
+
+    chat.retrieve_context(db, 1, "from:alice invoice")
+    chat.retrieve_context(db, 1, "invoice", selected_thread_id=3)
+    assert "threads" not in calls
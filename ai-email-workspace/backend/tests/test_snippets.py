@@ -0,0 +1,20 @@
+from app.utils.snippets import SNIPPET_LENGTH, make_snippet
+
+
+def test_snippet_collapses_whitespace_and_drops_quotes():
+    body = "Hi team,\n\n  the report is   attached.\n\n> On Monday you wrote:\n> send it over\nThanks"
+
+    assert make_snippet(body) == "Hi team, the report is attached. Thanks"
+
+
+def test_snippet_is_bounded():
+    snippet = make_snippet("word " * 500)
+
+    assert len(snippet) <= SNIPPET_LENGTH
+    assert not snippet.endswith(" ")
+
+
+def test_empty_or_quote_only_bodies_have_no_snippet():
+    assert make_snippet(None) is None
+    assert make_snippet("") is None
+    assert make_snippet("> only a quote\n>\n") is None
@@ -0,0 +1,157 @@
+import asyncio
+import json
+from datetime import datetime, timezone
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from app.providers.base import LLMProvider, ProviderUnavailable
+from app.providers.openai import OpenAIProvider, parse_stream_line
+from app.providers.stub import LocalStubProvider
+
+
+async def _collect(stream):
+    return [piece async for piece in stream]
+
+
+def test_parse_stream_line_extracts_text_deltas():
+    assert parse_stream_line('data: {"choices": [{"delta": {"content": "Hel"}}]}') == "Hel"
+    assert parse_stream_line('data: {"choices": [{"delta": {"role": "assistant"}}]}') == ""
+    assert parse_stream_line("data: [DONE]") == ""
+    assert parse_stream_line(": keep-alive") == ""
+
+
+def test_openai_provider_streams_chat_deltas(monkeypatch):
+    from app.providers import factory, openai
+
+    monkeypatch.setattr(factory.settings, "llm_provider", "openai_compatible")
+    monkeypatch.setattr(factory.settings, "openai_chat_model", "chat-model")
+    monkeypatch.setattr(factory.settings, "openai_base_url", "http://llm.test/v1")
+    bodies = []
+
+    def handler(request):
+        bodies.append(request.read())
+        lines = [
+            'data: {"choices": [{"delta": {"content": "Hello"}}]}',
+            'data: {"choices": [{"delta": {"content": " there"}}]}',
+            "data: [DONE]",
+        ]
+        return httpx.Response(200, text="\n\n".join(lines) + "\n\n", headers={"Content-Type": "text/event-stream"})
+
+    monkeypatch.setattr(
+        openai, "build_async_http_client", lambda: httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    )
+    provider = OpenAIProvider(client=httpx.Client(transport=httpx.MockTransport(handler)))
+
+    async def run():
+        try:
+            return await _collect(provider.astream_chat("prompt"))
+        finally:
+            await provider.aclose()
+
+    assert asyncio.run(run()) == ["Hello", " there"]
+    assert json.loads(bodies[0])["stream"] is True
+
+
+def test_stub_streams_its_answer_in_pieces():
+    provider = LocalStubProvider()
+
+    pieces = asyncio.run(_collect(provider.astream_chat("prompt")))
+
+    assert len(pieces) > 1
+    assert "".join(pieces) == provider.chat("prompt")
+
+
+def test_resilient_stream_retries_only_before_the_first_piece(monkeypatch):
+    from app.providers import resilience
+
+    async def no_sleep(delay):
+        return None
+
+    monkeypatch.setattr(resilience.asyncio, "sleep", no_sleep)
+
+    class Flaky(LLMProvider):
+        def __init__(self, fail_after):
+            self.fail_after = fail_after
+            self.attempts = 0
+
+        def embed(self, texts):
+            return []
+
+        def chat(self, prompt):
+            return ""
+
+        async def astream_chat(self, prompt):
+            self.attempts += 1
+            for index, piece in enumerate(["a", "b"]):
+                if self.attempts == 1 and index == self.fail_after:
+                    raise ProviderUnavailable("down", retryable=True)
+                yield piece
+
+    before_first = Flaky(fail_after=0)
+    assert asyncio.run(_collect(resilience.ResilientProvider(before_first).astream_chat("p"))) == ["a", "b"]
+    assert before_first.attempts == 2
+
+    mid_stream = Flaky(fail_after=1)
+    with pytest.raises(ProviderUnavailable):
+        asyncio.run(_collect(resilience.ResilientProvider(mid_stream).astream_chat("p")))
+    assert mid_stream.attempts == 1
+
+
+def _events(body: str):
+    events = []
+    for block in body.strip().split("\n\n"):
+        event, data = block.split("\n")
+        events.append((event[len("event: ") :], data[len("data: ") :]))
+    return events
+
+
+def test_chat_stream_sends_citations_before_tokens(monkeypatch):
+    from app.api import routes
+    from app.core.db import get_async_db
+    from app.main import app
+    from app.services import chat
+
+    sent_at = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    citations = [{"message_id": 7, "sent_at": sent_at, "from_email": None, "subject": "Q"}]
+    async def prepare_answer(db, account_id, query, thread_id):
+        return chat.PreparedAnswer(query, "prompt", citations, [1])
+
+    monkeypatch.setattr(routes, "prepare_answer", prepare_answer)
+    monkeypatch.setattr(chat, "get_provider", LocalStubProvider)
+    stored = []
+    monkeypatch.setattr(chat.query_cache, "store_answer", lambda *args: stored.append(args))
+    app.dependency_overrides[get_async_db] = lambda: None
+    try:
+        response = TestClient(app).post("/api/chat/query/stream", json={"account_id": 1, "query": "status?"})
+    finally:
+        app.dependency_overrides.clear()
+
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = _events(response.text)
+    assert events[0] == ("citations", json.dumps([{**citations[0], "sent_at": "2024-01-01T00:00:00+00:00"}]))
+    assert {name for name, _ in events[1:-1]} == {"token"}
+    assert events[-1] == ("done", "{}")
+    answer = "".join(json.loads(data)["text"] for _, data in events[1:-1])
+    assert answer == LocalStubProvider().chat("prompt")
+    assert stored and stored[0][3] == answer
+
+
+def test_draft_stream_ends_with_parsed_draft(monkeypatch):
+    from app.main import app
+    from app.services import compose
+
+    class DraftProvider(LocalStubProvider):
+        def chat(self, prompt):
+            return "Lunch on Friday\n\nHi Sam, are you free?"
+
+    monkeypatch.setattr(compose, "get_provider", DraftProvider)
+
+    response = TestClient(app).post(
+        "/api/compose/draft/stream",
+        json={"to": ["sam@example.com"], "subject_hint": "Lunch", "instructions": "Invite Sam"},
+    )
+
+    events = _events(response.text)
+    assert events[-1] == ("done", json.dumps({"subject": "Lunch on Friday", "body": "Hi Sam, are you free?"}))
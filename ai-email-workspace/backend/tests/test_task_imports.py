@@ -25,3 +25,42 @@ def test_embed_message_task_eager(monkeypatch):
     result = jobs.embed_message.delay(123)
     assert result.get() == 1
     assert called["message_id"] == 123
+
+
+def test_ingest_account_fans_out_folder_groups(monkeypatch):
+    from app.services import ingest
+    from app.tasks import jobs
+    from app.tasks.celery_app import celery_app
+
+    replaced = {}
+
+    def fake_replace(sig):
+        replaced["sig"] = sig
+        return None
+
+    plan = ingest.IngestPlan([[1, 3], [2]], [ingest.SplitFolder(4, 99, "token", [(1, 500), (501, 900)])])
+    monkeypatch.setattr(ingest, "plan_account_ingest_service", lambda account_id: plan)
+    monkeypatch.setattr(ingest, "ingest_folders_service", lambda account_id, folder_ids: len(folder_ids) * 10)
+    monkeypatch.setattr(ingest, "ingest_uid_range_service", lambda account_id, folder_id, low, high, *rest: high - low)
+    monkeypatch.setattr(ingest, "ingest_split_folder_service", lambda account_id, folder_id, lock_token: 1)
+    monkeypatch.setattr(jobs.ingest_account, "replace", fake_replace)
+    monkeypatch.setattr(celery_app.conf, "task_always_eager", True)
+    monkeypatch.setattr(celery_app.conf, "task_eager_propagates", True)
+
+    jobs.ingest_account.delay(7)
+    sig = replaced["sig"]
+    groups, split = sig.tasks[:2], sig.tasks[2]
+    assert [task.args for task in groups] == [(7, [1, 3]), (7, [2])]
+    assert [task.args for task in split.tasks] == [(7, 4, 1, 500, 99, "token"), (7, 4, 501, 900, 99, "token")]
+    assert split.body.args == (7, 4, "token")
+    range_counts = [task.apply().get() for task in split.tasks]
+    split_count = split.body.clone(args=(range_counts,)).apply().get()
+    counts = [task.apply().get() for task in groups] + [split_count]
+    assert sig.body.clone(args=(counts,)).apply().get() == 30 + 499 + 399 + 1
+
+
+def test_partition_folders_caps_connections():
+    from app.services.ingest import _partition_folders
+
+    assert _partition_folders([1, 2, 3, 4, 5], 2) == [[1, 3, 5], [2, 4]]
+    assert _partition_folders([1], 4) == [[1]]
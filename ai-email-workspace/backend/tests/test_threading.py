@@ -1,4 +1,4 @@
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 from unittest.mock import MagicMock
 
 from app.models.models import Message, Thread
@@ -26,3 +26,159 @@ def test_thread_assignment_with_reference(mocker):
     )
 
     assert result == thread
+
+
+def _resolve(resolver, message_id, subject, sent_at, references=()):
+    return resolver.resolve(message_id, list(references), subject, "a@example.com", ["b@example.com"], sent_at)
+
+
+def test_resolver_links_reply_to_parent_in_same_batch():
+    from app.utils.threading import ThreadResolver
+
+    resolver = ThreadResolver(account_id=1)
+    now = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    root = _resolve(resolver, "<root>", "Plan", now)
+    reply = _resolve(resolver, "<reply>", "Re: Plan (updated)", now, references=["<root>"])
+
+    assert root == reply
+    assert list(resolver.threads_to_create()) == [root]
+
+
+def test_resolver_regroups_when_parent_arrives_after_replies():
+    from app.utils.threading import ThreadResolver
+
+    resolver = ThreadResolver(account_id=1)
+    # Replies already stored in two different threads point at the parent.
+    resolver.children["<root>"].update({5, 9})
+    now = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+    slot = _resolve(resolver, "<root>", "Plan", now)
+
+    assert slot == 5
+    assert resolver.merged_threads() == {9: 5}
+    assert resolver.threads_to_create() == {}
+
+
+def test_resolver_merges_new_thread_into_existing_one():
+    from app.utils.threading import ThreadResolver
+
+    resolver = ThreadResolver(account_id=1)
+    resolver.by_message_id["<old>"] = 3
+    now = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    orphan = _resolve(resolver, "<orphan>", "Something else", now, references=["<missing>"])
+    late = _resolve(resolver, "<missing>", "Other", now, references=["<old>"])
+
+    assert late == 3
+    assert resolver.find(orphan) == 3
+    assert resolver.threads_to_create() == {}
+
+
+def test_resolver_puts_copy_of_stored_message_in_its_thread():
+    from app.utils.threading import ThreadResolver
+
+    resolver = ThreadResolver(account_id=1)
+    resolver.by_message_id["<root>"] = 8
+    now = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+    assert _resolve(resolver, "<root>", "Different subject", now) == 8
+    assert resolver.threads_to_create() == {}
+
+
+def test_thread_centroids_take_a_running_mean():
+    from types import SimpleNamespace
+
+    from app.utils.threading import add_to_thread_centroids
+
+    db = MagicMock()
+    db.query.return_value.filter.return_value.order_by.return_value.with_for_update.return_value.all.return_value = [
+        SimpleNamespace(id=1, centroid=[1.0, 1.0], centroid_count=2),
+        SimpleNamespace(id=2, centroid=None, centroid_count=0),
+    ]
+
+    add_to_thread_centroids(db, {1: [[4.0, 1.0]], 2: [[2.0, 0.0], [0.0, 2.0]]})
+
+    statement, rows = db.execute.call_args.args
+    assert rows == [
+        {"id": 1, "centroid": [2.0, 1.0], "centroid_count": 3},
+        {"id": 2, "centroid": [1.0, 1.0], "centroid_count": 2},
+    ]
+
+
+def _aggregate_message(thread_id, folder_id, hours, from_email, to=(), snippet=None):
+    return {
+        "thread_id": thread_id,
+        "folder_id": folder_id,
+        "sent_at": datetime(2024, 1, 1, tzinfo=timezone.utc) + timedelta(hours=hours),
+        "from_name": from_email.split("@")[0].title(),
+        "from_email": from_email,
+        "to_json": list(to),
+        "cc_json": None,
+        "snippet": snippet,
+    }
+
+
+def test_thread_aggregates_fold_the_same_in_batches_or_at_once():
+    from app.utils.threading import empty_thread_aggregates, fold_thread_aggregates
+
+    messages = [
+        _aggregate_message(1, 3, 2, "Bob@Example.com", ["alice@example.com"], "Sounds good"),
+        _aggregate_message(1, 4, 0, "alice@example.com", ["bob@example.com"], "Plan for Monday"),
+        _aggregate_message(1, 3, 1, "carol@example.com", ["alice@example.com", " "], "Count me in"),
+    ]
+
+    at_once = fold_thread_aggregates(empty_thread_aggregates(), messages)
+    in_batches = fold_thread_aggregates(fold_thread_aggregates(empty_thread_aggregates(), messages[:1]), messages[1:])
+
+    assert at_once == in_batches
+    assert at_once["message_count"] == 3
+    assert at_once["last_date"] == messages[0]["sent_at"]
+    assert (at_once["last_from_name"], at_once["last_from_email"], at_once["last_snippet"]) == (
+        "Bob",
+        "Bob@Example.com",
+        "Sounds good",
+    )
+    assert at_once["participants"] == ["alice@example.com", "bob@example.com", "carol@example.com"]
+    assert at_once["folder_ids"] == [3, 4]
+
+
+def test_thread_participants_are_capped():
+    from app.utils.threading import MAX_THREAD_PARTICIPANTS, empty_thread_aggregates, fold_thread_aggregates
+
+    to = [f"user{index:03d}@example.com" for index in range(MAX_THREAD_PARTICIPANTS * 2)]
+    aggregates = fold_thread_aggregates(empty_thread_aggregates(), [_aggregate_message(1, 3, 0, "a@example.com", to)])
+
+    assert len(aggregates["participants"]) == MAX_THREAD_PARTICIPANTS
+    assert aggregates["participants"][0] == "a@example.com"
+
+
+def test_new_messages_are_folded_into_stored_thread_aggregates():
+    from types import SimpleNamespace
+
+    from app.utils.threading import add_to_thread_aggregates, empty_thread_aggregates
+
+    class StoredThread(SimpleNamespace):
+        def _asdict(self):
+            return dict(vars(self))
+
+    stored = {
+        **empty_thread_aggregates(),
+        "message_count": 4,
+        "last_date": datetime(2024, 2, 1, tzinfo=timezone.utc),
+        "last_from_email": "old@example.com",
+        "participants": ["old@example.com"],
+        "folder_ids": [3],
+    }
+    db = MagicMock()
+    db.query.return_value.filter.return_value.order_by.return_value.with_for_update.return_value.all.return_value = [
+        StoredThread(id=7, **stored)
+    ]
+
+    # Older than what the thread already holds: counted, but not the latest message.
+    add_to_thread_aggregates(db, [_aggregate_message(7, 5, 0, "new@example.com", snippet="Late copy")])
+
+    statement, rows = db.execute.call_args.args
+    assert rows[0]["id"] == 7
+    assert rows[0]["message_count"] == 5
+    assert rows[0]["last_from_email"] == "old@example.com"
+    assert rows[0]["participants"] == ["new@example.com", "old@example.com"]
+    assert rows[0]["folder_ids"] == [3, 5]
@@ -29,10 +29,27 @@ type Message = {
   body_text: string | null;
 };
 
+type MessageSummary = {
+  id: number;
+  folder_id: number;
+  thread_id: number;
+  subject: string | null;
+  sent_at: string | null;
+  from_name: string | null;
+  from_email: string | null;
+  snippet: string | null;
+};
+
 type Thread = {
   id: number;
   subject_norm: string;
   last_date: string | null;
+  message_count: number;
+  participants: string[];
+  last_from_name: string | null;
+  last_from_email: string | null;
+  snippet: string | null;
+  folder_ids: number[];
 };
 
 type ChatResponse = {
@@ -47,7 +64,7 @@ export default function Home() {
   const [accountId, setAccountId] = useState<number | null>(null);
   const [folders, setFolders] = useState<Folder[]>([]);
   const [selectedFolder, setSelectedFolder] = useState<number | null>(null);
-  const [messages, setMessages] = useState<Message[]>([]);
+  const [messages, setMessages] = useState<MessageSummary[]>([]);
   const [threads, setThreads] = useState<Thread[]>([]);
   const [selectedThread, setSelectedThread] = useState<number | null>(null);
   const [threadMessages, setThreadMessages] = useState<Message[]>([]);
@@ -102,14 +119,14 @@ export default function Home() {
     if (!accountId) return;
     fetch(`${backendUrl}/api/threads?account_id=${accountId}`)
       .then((res) => res.json())
-      .then((data) => setThreads(data));
+      .then((data) => setThreads(data.items));
   }, [accountId]);
 
   useEffect(() => {
     if (!accountId || !selectedFolder) return;
     fetch(`${backendUrl}/api/messages?account_id=${accountId}&folder_id=${selectedFolder}&limit=50`)
       .then((res) => res.json())
-      .then((data) => setMessages(data));
+      .then((data) => setMessages(data.items));
   }, [accountId, selectedFolder]);
 
   useEffect(() => {
@@ -191,6 +208,7 @@ export default function Home() {
           >
             <strong>{message.subject || '(no subject)'}</strong>
             <div>{message.from_email}</div>
+            {message.snippet && <div className="snippet">{message.snippet}</div>}
           </div>
         ))}
       </section>